@@ -0,0 +1,142 @@
+"""
+Concurrent balance and history reads: sync views under gunicorn (WSGI) vs
+the async views under uvicorn (ASGI).
+
+Starts both servers on local ports against the database in DATABASE_URL,
+creates benchmark users (bench_reader_<n>) with some transaction history if
+they do not exist yet, then keeps --concurrency requests in flight against
+each endpoint for --requests requests and reports throughput and latency.
+The sync views are also measured under uvicorn, to separate the server from
+the views.
+
+    python benchmarks/async_reads.py --workers 2 --concurrency 64
+
+Pass --wsgi-url / --asgi-url to measure servers that are already running
+(for example behind the production proxy) instead of starting local ones.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from contextlib import ExitStack
+from decimal import Decimal
+from pathlib import Path
+from urllib.parse import urlsplit
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from rest_framework_simplejwt.tokens import RefreshToken  # noqa: E402
+
+from harness import Connection, percentiles, serve  # noqa: E402
+from transactions.models import Transaction, generate_reference  # noqa: E402
+
+
+SCENARIOS = [
+    # (label, server, path)
+    ('balance   sync  / gunicorn', 'wsgi', '/api/v1/wallet/balance/'),
+    ('balance   sync  / uvicorn ', 'asgi', '/api/v1/wallet/balance/'),
+    ('balance   async / uvicorn ', 'asgi', '/api/v1/async/wallet/balance/'),
+    ('history   sync  / gunicorn', 'wsgi', '/api/v1/transactions/?page_size=20'),
+    ('history   sync  / uvicorn ', 'asgi', '/api/v1/transactions/?page_size=20'),
+    ('history   async / uvicorn ', 'asgi', '/api/v1/async/transactions/?page_size=20'),
+]
+
+
+def prepare_users(count, history):
+    """Access tokens for count benchmark users, each with history rows"""
+    tokens = []
+    for n in range(count):
+        user, created = User.objects.get_or_create(
+            username=f'bench_reader_{n}',
+            defaults={'email': f'bench_reader_{n}@example.com'})
+        if created:
+            user.set_unusable_password()
+            user.save(update_fields=['password'])
+        missing = history - Transaction.objects.filter(wallet=user.wallet).count()
+        if missing > 0:
+            Transaction.objects.bulk_create([
+                Transaction(reference=generate_reference('DEPOSIT'),
+                            wallet=user.wallet, transaction_type='DEPOSIT',
+                            amount=Decimal('10.00'), status='COMPLETED')
+                for _ in range(missing)
+            ], batch_size=500)
+        tokens.append(str(RefreshToken.for_user(user).access_token))
+    return tokens
+
+
+async def load(base_url, path, tokens, requests, concurrency):
+    """Latencies (seconds) of requests GETs, concurrency in flight"""
+    url = urlsplit(base_url)
+    latencies, failures = [], 0
+    counter = iter(range(requests))
+
+    async def client():
+        nonlocal failures
+        connection = Connection(url.hostname, url.port or 80)
+        for n in counter:
+            started = time.perf_counter()
+            response = await connection.request('GET', path, {
+                'Authorization': f'Bearer {tokens[n % len(tokens)]}'})
+            latencies.append(time.perf_counter() - started)
+            failures += response.status != 200
+        connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return time.perf_counter() - started, latencies, failures
+
+
+def report(label, elapsed, latencies, failures):
+    p50, p95, p99 = percentiles(latencies)
+    line = (f'{label}  {len(latencies) / elapsed:8,.0f} req/s   '
+            f'p50 {p50 * 1000:6.1f} ms   '
+            f'p95 {p95 * 1000:6.1f} ms   '
+            f'p99 {p99 * 1000:6.1f} ms')
+    if failures:
+        line += f'   {failures} non-200'
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--history', type=int, default=100,
+                        help='transactions per benchmark user')
+    parser.add_argument('--wsgi-url')
+    parser.add_argument('--asgi-url')
+    args = parser.parse_args()
+
+    tokens = prepare_users(args.users, args.history)
+
+    def run(urls):
+        print(f'{args.requests} requests per endpoint, '
+              f'{args.concurrency} in flight, {args.users} users')
+        for label, server, path in SCENARIOS:
+            # Warm caches and connections before measuring
+            asyncio.run(load(urls[server], path, tokens,
+                             args.concurrency, args.concurrency))
+            report(label, *asyncio.run(load(
+                urls[server], path, tokens, args.requests, args.concurrency)))
+
+    if args.wsgi_url and args.asgi_url:
+        run({'wsgi': args.wsgi_url, 'asgi': args.asgi_url})
+    else:
+        print(f'{args.workers} worker processes per server')
+        with ExitStack() as stack:
+            run({kind: stack.enter_context(serve(kind, args.workers))
+                 for kind in ('wsgi', 'asgi')})
+
+
+if __name__ == '__main__':
+    main()
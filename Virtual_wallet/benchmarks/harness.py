@@ -0,0 +1,130 @@
+"""
+Shared pieces of the HTTP benchmarks: local servers, a minimal keep-alive
+HTTP/1.1 client on asyncio streams, and latency percentiles.
+"""
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+SERVER_COMMANDS = {
+    'wsgi': lambda port, workers: [
+        'gunicorn', 'config.wsgi:application', '--workers', str(workers),
+        '--bind', f'127.0.0.1:{port}', '--log-level', 'warning'],
+    'asgi': lambda port, workers: [
+        'uvicorn', 'config.asgi:application', '--workers', str(workers),
+        '--port', str(port), '--no-access-log', '--log-level', 'warning'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{process.args[0]} exited with {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'{process.args[0]} did not start listening on {port}')
+
+
+@contextmanager
+def serve(kind, workers, env=None):
+    """
+    Run the app under gunicorn ('wsgi') or uvicorn ('asgi') on a free local
+    port, against the same settings and database as this process; yields
+    its base URL. env adds environment variables for the server.
+    """
+    port = free_port()
+    process = subprocess.Popen(
+        SERVER_COMMANDS[kind](port, workers), cwd=BASE_DIR,
+        env={**os.environ, **(env or {})})
+    try:
+        wait_for(port, process)
+        yield f'http://127.0.0.1:{port}'
+    finally:
+        process.terminate()
+        process.wait()
+
+
+class Response:
+    __slots__ = ('status', 'headers', 'body')
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class Connection:
+    """
+    One keep-alive HTTP/1.1 connection to host, reopened whenever the
+    server closes it (gunicorn's sync workers close after every response).
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._streams = None
+
+    async def request(self, method, path, headers=None, body=None):
+        if self._streams is None:
+            self._streams = await asyncio.open_connection(self.host, self.port)
+        reader, writer = self._streams
+
+        headers = {'Host': self.host, **(headers or {})}
+        payload = b''
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        headers['Content-Length'] = str(len(payload))
+        head = f'{method} {path} HTTP/1.1\r\n' + ''.join(
+            f'{name}: {value}\r\n' for name, value in headers.items())
+        writer.write(head.encode('latin-1') + b'\r\n' + payload)
+        await writer.drain()
+
+        lines = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+        status = int(lines[0].split()[1])
+        received = dict(line.split(': ', 1) for line in lines[1:] if line)
+        received = {name.lower(): value for name, value in received.items()}
+        if 'content-length' in received:
+            content = await reader.readexactly(int(received['content-length']))
+        else:
+            content = await reader.read()
+            received['connection'] = 'close'
+
+        if received.get('connection', '').lower() == 'close':
+            self.close()
+        return Response(status, received, content)
+
+    def close(self):
+        if self._streams is not None:
+            self._streams[1].close()
+            self._streams = None
+
+
+def percentiles(values):
+    """(p50, p95, p99) of values"""
+    if len(values) < 2:
+        value = values[0] if values else 0.0
+        return value, value, value
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return cuts[49], cuts[94], cuts[98]
@@ -0,0 +1,291 @@
+"""
+Load test of the wallet API's main flows, checked against a stored baseline.
+
+Seeds --users users (load_user_<n>) with about --history transactions each
+through the seed_wallets command, unless they exist already. Then it
+starts the app on a local server and has --concurrency clients run a
+weighted mix of flows:
+- register
+- login
+- balance
+- history
+- transfer
+
+Each flow is reported with its throughput, p50/p95/p99 latency, error rate
+and queries per request. The server samples every request, so each response
+carries its query count in Server-Timing.
+
+    python benchmarks/loadtest.py                     # run and report
+    python benchmarks/loadtest.py --check             # fail on regression
+    python benchmarks/loadtest.py --update-baseline   # store a new baseline
+
+--check exits with status 1 in any of these cases:
+- a flow's median query count grew
+- its p95 latency grew by more than --latency-tolerance
+- its throughput fell by more than --throughput-tolerance
+- its error rate rose by more than a point
+
+Latency and throughput depend on the machine, so refresh the baseline with
+--update-baseline on the machine that runs --check. Query counts do not.
+
+Runs against the database in DATABASE_URL. Use a scratch database: runs
+register users and move money.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import time
+import uuid
+from pathlib import Path
+from statistics import median
+from urllib.parse import urlsplit
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from rest_framework_simplejwt.tokens import RefreshToken  # noqa: E402
+
+from harness import Connection, percentiles, serve  # noqa: E402
+
+
+BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+PASSWORD = 'load-test-password'
+
+# Share of requests per flow
+FLOWS = {
+    'balance': 40,
+    'history': 30,
+    'transfer': 20,
+    'login': 5,
+    'register': 5,
+}
+
+_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def seed(users, history, seed_value):
+    """
+    Seed the load test users that do not exist yet with seed_wallets.
+    Returns their usernames.
+    """
+    usernames = [f'load_user_{n}' for n in range(users)]
+    existing = User.objects.filter(username__in=usernames).count()
+    if existing < users:
+        call_command('seed_wallets', users=users - existing, start=existing,
+                     transactions=history, prefix='load_user_',
+                     password=PASSWORD, seed=seed_value)
+    return usernames
+
+
+class Client:
+    """One virtual user: runs flows over its own connection"""
+
+    def __init__(self, base_url, usernames, tokens, rng, run_id, results):
+        url = urlsplit(base_url)
+        self.connection = Connection(url.hostname, url.port or 80)
+        self.usernames = usernames
+        self.tokens = tokens
+        self.rng = rng
+        self.run_id = run_id
+        self.results = results
+        self.registered = 0
+
+    def _auth(self, username):
+        return {'Authorization': f'Bearer {self.tokens[username]}'}
+
+    async def register(self):
+        self.registered += 1
+        username = f'load_reg_{self.run_id}_{id(self) % 10_000}_{self.registered}'
+        return 201, await self.connection.request(
+            'POST', '/api/v1/auth/register/', body={
+                'username': username, 'email': f'{username}@example.com',
+                'password': PASSWORD, 'password_confirm': PASSWORD})
+
+    async def login(self):
+        return 200, await self.connection.request(
+            'POST', '/api/v1/auth/login/', body={
+                'username': self.rng.choice(self.usernames),
+                'password': PASSWORD})
+
+    async def balance(self):
+        return 200, await self.connection.request(
+            'GET', '/api/v1/wallet/balance/',
+            self._auth(self.rng.choice(self.usernames)))
+
+    async def history(self):
+        return 200, await self.connection.request(
+            'GET', '/api/v1/transactions/?page_size=20',
+            self._auth(self.rng.choice(self.usernames)))
+
+    async def transfer(self):
+        sender, recipient = self.rng.sample(self.usernames, 2)
+        return 201, await self.connection.request(
+            'POST', '/api/v1/transactions/transfer/', self._auth(sender),
+            body={'recipient_username': recipient, 'amount': '1.00'})
+
+    async def run(self, schedule):
+        for flow in schedule:
+            started = time.perf_counter()
+            expected, response = await getattr(self, flow)()
+            elapsed = time.perf_counter() - started
+            match = _QUERIES.search(response.headers.get('server-timing', ''))
+            self.results[flow].append((
+                elapsed, response.status == expected,
+                int(match.group(1)) if match else None))
+        self.connection.close()
+
+
+async def drive(base_url, usernames, tokens, requests, concurrency, rng):
+    """Run requests flows over concurrency clients; returns results, seconds"""
+    results = {flow: [] for flow in FLOWS}
+    flows, weights = zip(*FLOWS.items())
+    run_id = uuid.uuid4().hex[:8]
+    clients = [
+        Client(base_url, usernames, tokens, random.Random(rng.random()),
+               run_id, results)
+        for _ in range(concurrency)
+    ]
+    schedules = [[] for _ in clients]
+    for n, flow in enumerate(rng.choices(flows, weights, k=requests)):
+        schedules[n % concurrency].append(flow)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client.run(schedule)
+                           for client, schedule in zip(clients, schedules)))
+    return results, time.perf_counter() - started
+
+
+def summarize(results, elapsed):
+    summary = {}
+    for flow, samples in results.items():
+        if not samples:
+            continue
+        latencies = [sample[0] for sample in samples]
+        queries = [sample[2] for sample in samples if sample[2] is not None]
+        p50, p95, p99 = percentiles(latencies)
+        summary[flow] = {
+            'requests': len(samples),
+            'throughput': round(len(samples) / elapsed, 2),
+            'p50_ms': round(p50 * 1000, 2),
+            'p95_ms': round(p95 * 1000, 2),
+            'p99_ms': round(p99 * 1000, 2),
+            'error_rate': round(
+                sum(not sample[1] for sample in samples) / len(samples), 4),
+            'queries': median(queries) if queries else None,
+        }
+    return summary
+
+
+def report(summary):
+    print(f'{"flow":<10}{"requests":>9}{"req/s":>9}{"p50 ms":>9}'
+          f'{"p95 ms":>9}{"p99 ms":>9}{"errors":>8}{"queries":>9}')
+    for flow, row in summary.items():
+        queries = '-' if row['queries'] is None else f'{row["queries"]:g}'
+        print(f'{flow:<10}{row["requests"]:>9}{row["throughput"]:>9.1f}'
+              f'{row["p50_ms"]:>9.1f}{row["p95_ms"]:>9.1f}{row["p99_ms"]:>9.1f}'
+              f'{row["error_rate"]:>8.1%}{queries:>9}')
+
+
+def regressions(summary, baseline, latency_tolerance, throughput_tolerance):
+    """Descriptions of every way summary is worse than baseline"""
+    found = []
+    for flow, before in baseline['flows'].items():
+        now = summary.get(flow)
+        if now is None:
+            continue
+        if (now['queries'] is not None and before['queries'] is not None
+                and now['queries'] > before['queries']):
+            found.append(f'{flow}: {now["queries"]:g} queries per request, '
+                         f'baseline {before["queries"]:g}')
+        if now['p95_ms'] > before['p95_ms'] * (1 + latency_tolerance):
+            found.append(f'{flow}: p95 {now["p95_ms"]:.1f} ms, '
+                         f'baseline {before["p95_ms"]:.1f} ms')
+        if now['throughput'] < before['throughput'] * (1 - throughput_tolerance):
+            found.append(f'{flow}: {now["throughput"]:.1f} req/s, '
+                         f'baseline {before["throughput"]:.1f} req/s')
+        if now['error_rate'] > before['error_rate'] + 0.01:
+            found.append(f'{flow}: {now["error_rate"]:.1%} errors, '
+                         f'baseline {before["error_rate"]:.1%}')
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--history', type=int, default=50,
+                        help='transactions per seeded user')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--server', choices=('wsgi', 'asgi'), default='wsgi')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--url', help='measure a running server instead')
+    parser.add_argument('--baseline', type=Path, default=BASELINE)
+    parser.add_argument('--check', action='store_true',
+                        help='exit with status 1 on a regression')
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--latency-tolerance', type=float, default=1.0)
+    parser.add_argument('--throughput-tolerance', type=float, default=0.3)
+    parser.add_argument('--output', type=Path, help='write results as JSON')
+    args = parser.parse_args()
+
+    usernames = seed(args.users, args.history, args.seed)
+    rng = random.Random(args.seed)
+    tokens = {
+        user.username: str(RefreshToken.for_user(user).access_token)
+        for user in User.objects.filter(username__in=usernames)
+    }
+
+    def measure(base_url):
+        print(f'{args.requests} requests, {args.concurrency} clients, '
+              f'{args.users} users')
+        return drive(base_url, usernames, tokens, args.requests,
+                     args.concurrency, rng)
+
+    if args.url:
+        results, elapsed = asyncio.run(measure(args.url))
+    else:
+        with serve(args.server, args.workers,
+                   env={'METRICS_SAMPLE_RATE': '1'}) as base_url:
+            results, elapsed = asyncio.run(measure(base_url))
+
+    summary = summarize(results, elapsed)
+    report(summary)
+    run = {
+        'settings': {key: getattr(args, key) for key in (
+            'users', 'history', 'requests', 'concurrency', 'server',
+            'workers', 'seed')},
+        'flows': summary,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(run, indent=2) + '\n')
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(run, indent=2) + '\n')
+        print(f'Baseline written to {args.baseline}')
+    elif args.check:
+        baseline = json.loads(args.baseline.read_text())
+        if baseline['settings'] != run['settings']:
+            print(f'Note: baseline was recorded with {baseline["settings"]}')
+        found = regressions(summary, baseline, args.latency_tolerance,
+                            args.throughput_tolerance)
+        for line in found:
+            print(f'REGRESSION {line}')
+        if found:
+            sys.exit(1)
+        print('No regressions against the baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Insert throughput of random (uuid4) vs time-ordered (uuid7) primary keys.
+
+Creates two scratch tables shaped like ledger_entries (UUID primary key plus
+a secondary index), fills each with the same number of rows in batches,
+reports rows/second and, on PostgreSQL, the size of the primary key index.
+The scratch tables are dropped afterwards.
+
+    python benchmarks/uuid_inserts.py --rows 500000 --batch-size 1000
+
+Run it against the database in DATABASE_URL; the gap grows once the index
+no longer fits in shared_buffers, so use a row count well above that for
+representative numbers.
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection, transaction  # noqa: E402
+
+from config.ids import uuid7  # noqa: E402
+
+
+GENERATORS = {
+    'uuid4': uuid.uuid4,
+    'uuid7': uuid7,
+}
+
+
+def _column_type():
+    return 'uuid' if connection.vendor == 'postgresql' else 'char(32)'
+
+
+def _value(generated):
+    return generated if connection.vendor == 'postgresql' else generated.hex
+
+
+def create_table(name):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {name}')
+        cursor.execute(
+            f'CREATE TABLE {name} ('
+            f'id {_column_type()} PRIMARY KEY, '
+            f'wallet_id integer NOT NULL, '
+            f'amount numeric(15, 2) NOT NULL, '
+            f'created_at timestamp NOT NULL)'
+        )
+        cursor.execute(
+            f'CREATE INDEX {name}_wallet_idx ON {name} (wallet_id, created_at)')
+
+
+def drop_table(name):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {name}')
+
+
+def index_size(name):
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_relation_size(indexrelid) FROM pg_index "
+            "WHERE indrelid = %s::regclass AND indisprimary", [name])
+        return cursor.fetchone()[0]
+
+
+def run(kind, rows, batch_size):
+    table = f'bench_{kind}_inserts'
+    generate = GENERATORS[kind]
+    create_table(table)
+    sql = (f'INSERT INTO {table} (id, wallet_id, amount, created_at) '
+           f'VALUES (%s, %s, %s, %s)')
+    try:
+        started = time.perf_counter()
+        for offset in range(0, rows, batch_size):
+            now = datetime.now(timezone.utc)
+            batch = [
+                (_value(generate()), (offset + i) % 1000, '10.00', now)
+                for i in range(min(batch_size, rows - offset))
+            ]
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, batch)
+        elapsed = time.perf_counter() - started
+        return elapsed, index_size(table)
+    finally:
+        drop_table(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f'{connection.vendor}: {args.rows} rows, '
+          f'batches of {args.batch_size}')
+    for kind in GENERATORS:
+        elapsed, size = run(kind, args.rows, args.batch_size)
+        line = f'{kind}: {args.rows / elapsed:,.0f} rows/s ({elapsed:.2f}s)'
+        if size is not None:
+            line += f', primary key index {size / 1024 / 1024:.1f} MiB'
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
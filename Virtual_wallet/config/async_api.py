@@ -0,0 +1,52 @@
+"""
+Base view for async read endpoints.
+
+DRF 3.14 views are synchronous, so under an ASGI server every DRF request
+occupies a worker thread for its whole duration. Views built on AsyncAPIView
+are plain async Django views: they authenticate with the same JWTs and query
+through the async ORM and cache, so a single ASGI worker can interleave many
+requests while they wait on the database.
+
+They render JSON with DRF serializers and report errors in DRF's shape, so
+clients can switch between the sync and async routes freely.
+"""
+from django.http import JsonResponse
+from django.views import View
+from rest_framework import exceptions
+
+from users.authentication import WalletJWTAuthentication
+
+
+class AsyncAPIView(View):
+    """
+    Async, JWT-authenticated, read-only JSON view.
+
+    Subclasses implement `async def get(self, request)`; request.user is the
+    authenticated user, loaded with their wallet and profile.
+    """
+    http_method_names = ['get', 'head', 'options']
+    authentication_class = WalletJWTAuthentication
+
+    async def dispatch(self, request, *args, **kwargs):
+        authenticator = self.authentication_class()
+        try:
+            authenticated = await authenticator.aauthenticate(request)
+            if authenticated is None:
+                raise exceptions.NotAuthenticated()
+            request.user, request.auth = authenticated
+            return await super().dispatch(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            response = self.respond(
+                exc.detail if isinstance(exc.detail, (list, dict))
+                else {'detail': exc.detail},
+                status=exc.status_code)
+            if isinstance(exc, (exceptions.NotAuthenticated,
+                                exceptions.AuthenticationFailed)):
+                response['WWW-Authenticate'] = (
+                    authenticator.authenticate_header(request))
+            return response
+
+    @staticmethod
+    def respond(data, status=200):
+        return JsonResponse(data, status=status, safe=False,
+                            json_dumps_params={'ensure_ascii': False})
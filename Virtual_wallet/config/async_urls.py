@@ -0,0 +1,18 @@
+"""
+Async read endpoints, for serving under an ASGI server (see config/asgi.py)
+"""
+from django.urls import path
+
+from transactions import async_views as transaction_views
+from wallets import async_views as wallet_views
+
+urlpatterns = [
+    path('wallet/', wallet_views.WalletDetailView.as_view(),
+         name='async-wallet-detail'),
+    path('wallet/balance/', wallet_views.WalletBalanceView.as_view(),
+         name='async-wallet-balance'),
+    path('wallet/events/', wallet_views.WalletEventsView.as_view(),
+         name='async-wallet-events'),
+    path('transactions/', transaction_views.TransactionListView.as_view(),
+         name='async-transaction-list'),
+]
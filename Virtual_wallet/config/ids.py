@@ -0,0 +1,81 @@
+"""
+Time-ordered identifiers.
+
+Random uuid4 keys land all over a B-tree index, so every insert touches a
+different leaf page. UUIDv7 (RFC 9562) starts with a millisecond timestamp,
+so new rows append at the right edge of the index and recent rows share
+pages. References use the same value in Crockford base32, which sorts
+lexicographically in creation order like a ULID.
+"""
+import os
+import threading
+import time
+import uuid
+
+
+# Crockford base32 without I, L, O, U
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def _next_timestamp():
+    """
+    Millisecond timestamp and 12-bit sequence, monotonic within the process.
+
+    The sequence starts at a random value below 2**11 each millisecond and
+    counts up, so ids made in the same millisecond still sort in order.
+    """
+    global _last_ms, _counter
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _last_ms:
+            _last_ms = now_ms
+            _counter = int.from_bytes(os.urandom(2), 'big') & 0x7FF
+        else:
+            _counter += 1
+            if _counter > 0xFFF:
+                # Sequence exhausted: borrow the next millisecond
+                _last_ms += 1
+                _counter = 0
+        return _last_ms, _counter
+
+
+def uuid7():
+    """A UUIDv7: 48-bit unix ms, version, 12-bit sequence, variant, random"""
+    timestamp_ms, sequence = _next_timestamp()
+    return uuid7_from(timestamp_ms, sequence, int.from_bytes(os.urandom(8), 'big'))
+
+
+def uuid7_from(timestamp_ms, sequence, random_bits):
+    """
+    The UUIDv7 made of the given parts, for ids of backdated or generated
+    rows; sequence keeps its low 12 bits and random_bits its low 62.
+    """
+    value = (
+        (timestamp_ms & (2 ** 48 - 1)) << 80
+        | 0x7 << 76
+        | (sequence & 0xFFF) << 64
+        | 0b10 << 62
+        | (random_bits & (2 ** 62 - 1))
+    )
+    return uuid.UUID(int=value)
+
+
+def encode_base32(value, length=26):
+    """Fixed-width Crockford base32 of a non-negative integer"""
+    chars = []
+    for _ in range(length):
+        value, index = divmod(value, 32)
+        chars.append(ALPHABET[index])
+    return ''.join(reversed(chars))
+
+
+def sortable_reference(prefix, uid=None):
+    """
+    prefix followed by a time-ordered 26 character id, e.g. TXN_TRA_01J...;
+    the id encodes uid, a new UUIDv7 by default.
+    """
+    return f'{prefix}{encode_base32((uid or uuid7()).int)}'
@@ -0,0 +1,73 @@
+"""
+What a sampled request spends on the database, collected where it is spent.
+
+Code that takes wallet row locks wraps the work in lock_time(); the SQL
+execute wrapper record_query() counts and times statements. Both only do
+anything while a request is being sampled (see begin()), so the hot paths
+that call them cost a context variable lookup otherwise. config.metrics
+samples requests and reports the figures.
+
+Nothing here imports Django, so models and services can use it freely.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+
+class RequestStats:
+    """What one sampled request spent on the database"""
+    __slots__ = ('queries', 'db_time', 'lock_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.lock_time = 0.0
+
+
+# Stats of the sampled request being served; context variables follow the
+# request into the threads async views run their queries in
+_current = contextvars.ContextVar('request_stats', default=None)
+
+
+def begin():
+    """Sample the current request; returns its stats and a token for end()"""
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def end(token):
+    _current.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper counting and timing the statements of sampled requests"""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - started
+
+
+@contextmanager
+def lock_time():
+    """
+    Count the time spent in the block as wallet lock time.
+
+    The databases do not report how long a statement waited for a row
+    lock, so this is the whole of the locking statement (or the backoff
+    before retrying one): an upper bound on the wait that approaches it
+    under contention.
+    """
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.lock_time += time.perf_counter() - started
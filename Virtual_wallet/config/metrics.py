@@ -0,0 +1,298 @@
+"""
+Per-view request metrics: latency, SQL query count, DB time and wallet lock
+time.
+
+RequestMetricsMiddleware times every request. A METRICS_SAMPLE_RATE share
+of requests is also instrumented: every SQL statement they run is counted
+and timed, and so are the statements that take wallet row locks (see
+config.instrumentation.lock_time()). Sampled responses carry a
+Server-Timing header, and all figures are collected into histograms served
+in the Prometheus text format by metrics_view.
+
+Each process keeps its own histograms. With several worker processes, set
+METRICS_DIR to a directory they share: each process writes its figures
+there every METRICS_FLUSH_SECONDS, and /metrics serves the sum of them.
+"""
+import abc
+import bisect
+import json
+import os
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+from . import instrumentation
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 100, 200)
+LOCK_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2, 5)
+
+# Any other request method is reported as OTHER, to bound label values
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+class Metric(abc.ABC):
+    """A labelled Prometheus metric, kept as plain lists of numbers"""
+    kind = None
+
+    def __init__(self, registry, name, documentation, labels):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values = {}
+        self._lock = registry.lock
+        registry.metrics.append(self)
+
+    @abc.abstractmethod
+    def _empty(self):
+        """A new series of zeros for one set of label values"""
+
+    def _series(self, labels):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = self._empty()
+        return series
+
+    def _label_text(self, labels, extra=()):
+        pairs = list(zip(self.labels, labels)) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (
+            '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                             .replace('"', '\\"').replace('\n', '\\n'))
+            for name, value in pairs)
+        return '{' + ','.join(escaped) + '}'
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _empty(self):
+        return [0]
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._series(labels)[0] += amount
+
+    def render(self, values):
+        for labels, (value,) in sorted(values.items()):
+            yield f'{self.name}{self._label_text(labels)} {value}'
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labels, buckets):
+        super().__init__(registry, name, documentation, labels)
+        self.buckets = buckets
+
+    def _empty(self):
+        # One count per bucket, one for +Inf, then the sum
+        return [0] * (len(self.buckets) + 1) + [0]
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series(labels)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self, values):
+        bounds = [*(format(b, 'g') for b in self.buckets), '+Inf']
+        for labels, series in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, series):
+                cumulative += count
+                text = self._label_text(labels, [('le', bound)])
+                yield f'{self.name}_bucket{text} {cumulative}'
+            yield f'{self.name}_sum{self._label_text(labels)} {series[-1]}'
+            yield f'{self.name}_count{self._label_text(labels)} {cumulative}'
+
+
+class Registry:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = []
+        self._flushed_at = 0
+
+    def snapshot(self):
+        """{metric name: [[labels, series], ...]} of this process"""
+        with self.lock:
+            return {
+                metric.name: [[list(labels), list(series)]
+                              for labels, series in metric.values.items()]
+                for metric in self.metrics
+            }
+
+    def flush(self, directory):
+        """Write this process's snapshot to directory, atomically"""
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        with open(f'{path}.tmp', 'w') as snapshot_file:
+            json.dump(self.snapshot(), snapshot_file)
+        os.replace(f'{path}.tmp', path)
+        self._flushed_at = time.monotonic()
+
+    def flush_if_due(self):
+        directory = settings.METRICS_DIR
+        if directory and (time.monotonic() - self._flushed_at
+                          >= settings.METRICS_FLUSH_SECONDS):
+            self.flush(directory)
+
+    def _collect(self):
+        """Snapshots of every process writing to METRICS_DIR, or just this one"""
+        directory = settings.METRICS_DIR
+        if not directory:
+            return [self.snapshot()]
+        self.flush(directory)
+        snapshots = []
+        for name in os.listdir(directory):
+            if name.endswith('.json'):
+                try:
+                    with open(os.path.join(directory, name)) as snapshot_file:
+                        snapshots.append(json.load(snapshot_file))
+                except (OSError, ValueError):
+                    continue
+        return snapshots
+
+    def render(self):
+        """Every metric, summed over processes, in Prometheus text format"""
+        snapshots = self._collect()
+        lines = []
+        for metric in self.metrics:
+            merged = {}
+            for snapshot in snapshots:
+                for labels, series in snapshot.get(metric.name, ()):
+                    total = merged.setdefault(tuple(labels), [0] * len(series))
+                    for index, value in enumerate(series):
+                        total[index] += value
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render(merged))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUESTS = Counter(
+    registry, 'wallet_http_requests_total',
+    'Requests by view, method and status code.',
+    ('view', 'method', 'status'))
+REQUEST_DURATION = Histogram(
+    registry, 'wallet_http_request_duration_seconds',
+    'Time until the response was returned, by view.',
+    ('view', 'method'), LATENCY_BUCKETS)
+DB_QUERIES = Histogram(
+    registry, 'wallet_db_queries_per_request',
+    'SQL statements per sampled request, by view.',
+    ('view',), QUERY_BUCKETS)
+DB_DURATION = Histogram(
+    registry, 'wallet_db_duration_seconds',
+    'Time spent executing SQL per sampled request, by view.',
+    ('view',), LATENCY_BUCKETS)
+LOCK_TIME = Histogram(
+    registry, 'wallet_lock_time_seconds',
+    'Time in statements that take wallet row locks, lock waits and retry '
+    'backoff included, per sampled request, by view.',
+    ('view',), LOCK_BUCKETS)
+
+
+def _instrument(connection, **kwargs):
+    if instrumentation.record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(instrumentation.record_query)
+
+
+connection_created.connect(_instrument)
+
+
+class RequestMetricsMiddleware:
+    """
+    Records request metrics and adds Server-Timing to sampled responses.
+
+    Place it first in MIDDLEWARE so the latency covers the other
+    middleware. For streaming responses only the time until the response
+    was returned is measured.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats, token = self._start()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            if token is not None:
+                instrumentation.end(token)
+        self._finish(request, response, time.perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats, token = self._start()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            if token is not None:
+                instrumentation.end(token)
+        self._finish(request, response, time.perf_counter() - started, stats)
+        return response
+
+    def _start(self):
+        if random.random() >= settings.METRICS_SAMPLE_RATE:
+            return None, None
+        # Connections opened before this module was imported
+        for connection in connections.all(initialized_only=True):
+            _instrument(connection)
+        return instrumentation.begin()
+
+    def _finish(self, request, response, elapsed, stats):
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        method = request.method if request.method in METHODS else 'OTHER'
+        REQUESTS.inc((view, method, str(response.status_code)))
+        REQUEST_DURATION.observe((view, method), elapsed)
+
+        if stats is not None:
+            DB_QUERIES.observe((view,), stats.queries)
+            DB_DURATION.observe((view,), stats.db_time)
+            LOCK_TIME.observe((view,), stats.lock_time)
+            if settings.METRICS_SERVER_TIMING:
+                response['Server-Timing'] = (
+                    f'total;dur={elapsed * 1000:.1f}, '
+                    f'db;dur={stats.db_time * 1000:.1f};'
+                    f'desc="{stats.queries} queries", '
+                    f'lock;dur={stats.lock_time * 1000:.1f}')
+
+        registry.flush_if_due()
+
+
+def metrics_view(request):
+    """
+    The metrics in Prometheus text format. Scrapers must send METRICS_TOKEN
+    as a bearer token; without a token the endpoint is only open with
+    DEBUG on.
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponse(status=403)
+    elif request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse(status=401)
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -46,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'config.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -81,16 +82,72 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# DB_CONN_MAX_AGE keeps connections open between requests; set it to 0 when
+# serving through config.asgi, where each request runs its sync code in a
+# fresh thread and persistent connections are not reused
 DATABASES = {
     'default': dj_database_url.config(
         default=config(
             'DATABASE_URL', default=f'sqlite:///{BASE_DIR / "db.sqlite3"}'),
-        conn_max_age=600,
+        conn_max_age=config('DB_CONN_MAX_AGE', default=600, cast=int),
         conn_health_checks=True,
     )
 }
 
 
+# Cache
+# Local memory by default. Set REDIS_URL (and install the `redis` package) to
+# share cached balances and idempotent responses between workers.
+
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds a balance snapshot may be served from the cache. Invalidation after
+# a money movement only reaches the worker's own local memory cache, so
+# without a shared cache other workers may serve (and 304) a stale balance
+# until it expires; keep that window to a few seconds.
+BALANCE_CACHE_TIMEOUT = config(
+    'BALANCE_CACHE_TIMEOUT', default=300 if REDIS_URL else 5, cast=int)
+
+# Request metrics (config/metrics.py, served at /metrics)
+# Share of requests whose SQL and lock time are measured; latency is always
+# recorded
+METRICS_SAMPLE_RATE = config('METRICS_SAMPLE_RATE', default=0.05, cast=float)
+# Add a Server-Timing header to sampled responses
+METRICS_SERVER_TIMING = config('METRICS_SERVER_TIMING', default=True, cast=bool)
+# Bearer token scrapers must send; while empty /metrics answers 403 unless
+# DEBUG is on
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+# Directory shared by worker processes so /metrics covers all of them
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_SECONDS = config('METRICS_FLUSH_SECONDS', default=5, cast=int)
+
+# Wallet events (server-sent events stream)
+# The local backend only reaches streams served by the process that moved
+# the money; use wallets.events.RedisBackend with more than one process.
+WALLET_EVENTS_BACKEND = config(
+    'WALLET_EVENTS_BACKEND', default='wallets.events.LocalBackend')
+WALLET_EVENTS_REDIS_URL = config('WALLET_EVENTS_REDIS_URL', default='')
+# Events buffered per stream before a slow client is disconnected
+WALLET_EVENTS_QUEUE_SIZE = config('WALLET_EVENTS_QUEUE_SIZE', default=100, cast=int)
+# Seconds between keep-alive comments on an idle stream
+WALLET_EVENTS_HEARTBEAT_SECONDS = config(
+    'WALLET_EVENTS_HEARTBEAT_SECONDS', default=15, cast=int)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -137,7 +194,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.WalletJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -158,6 +215,27 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Seconds a resolved user (with wallet and profile) is cached per access
+# token for read-only requests; 0 disables the cache
+JWT_USER_CACHE_TTL = config('JWT_USER_CACHE_TTL', default=0, cast=int)
+
+# Wallet locking
+# Bounded wait for wallet row locks (PostgreSQL) and how many times a money
+# movement is retried after a lock timeout or deadlock
+WALLET_LOCK_TIMEOUT_MS = config('WALLET_LOCK_TIMEOUT_MS', default=2000, cast=int)
+WALLET_LOCK_MAX_RETRIES = config('WALLET_LOCK_MAX_RETRIES', default=3, cast=int)
+
+# Ledger partitioning (PostgreSQL only)
+# Monthly ledger_entries partitions created ahead of time, and the tablespace
+# archive_ledger_partitions moves closed months into
+LEDGER_PARTITION_MONTHS_AHEAD = config(
+    'LEDGER_PARTITION_MONTHS_AHEAD', default=3, cast=int)
+LEDGER_ARCHIVE_TABLESPACE = config('LEDGER_ARCHIVE_TABLESPACE', default='')
+
+# Payment gateways (webhook verification)
+PAYSTACK_SECRET_KEY = config('PAYSTACK_SECRET_KEY', default='')
+FLUTTERWAVE_SECRET_HASH = config('FLUTTERWAVE_SECRET_HASH', default='')
+
 # CORS Configuration (for development)
 CORS_ALLOW_ALL_ORIGINS = config(
     'CORS_ALLOW_ALL_ORIGINS', default=True, cast=bool)
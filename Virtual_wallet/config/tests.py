@@ -0,0 +1,169 @@
+import time
+import uuid
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from config import ids, instrumentation, metrics
+from wallets.models import Wallet
+
+
+class TimeOrderedIdTests(SimpleTestCase):
+    """
+    uuid7 values are valid version 7 UUIDs that sort in creation order,
+    including within one millisecond and across a clock step backwards.
+    """
+
+    def test_layout(self):
+        before = time.time_ns() // 1_000_000
+        value = ids.uuid7()
+        after = time.time_ns() // 1_000_000
+
+        self.assertEqual(value.version, 7)
+        self.assertEqual(value.variant, uuid.RFC_4122)
+        self.assertLessEqual(before, value.int >> 80)
+        # A sequence overflow may borrow one millisecond ahead
+        self.assertLessEqual(value.int >> 80, after + 1)
+
+    def test_values_are_monotonic(self):
+        values = [ids.uuid7() for _ in range(5000)]
+        self.assertEqual(values, sorted(values))
+        self.assertEqual(len(set(values)), len(values))
+
+    def test_same_millisecond_and_clock_going_back(self):
+        clock = iter([1_700_000_000_000_000_000] * 4200
+                     + [1_699_999_999_000_000_000] * 10)
+        # Fresh generator state, as if the process had just started
+        with mock.patch.object(ids, '_last_ms', 0), \
+                mock.patch.object(ids, '_counter', 0), \
+                mock.patch.object(ids.time, 'time_ns', lambda: next(clock)):
+            values = [ids.uuid7() for _ in range(4210)]
+
+        self.assertEqual(values, sorted(values))
+        self.assertEqual(len(set(values)), len(values))
+        # 4200 ids overflow the 12-bit sequence into the next millisecond
+        # whatever its random start, and the earlier clock reading never
+        # moves the timestamp back
+        self.assertEqual(values[0].int >> 80, 1_700_000_000_000)
+        self.assertEqual(values[-1].int >> 80, 1_700_000_000_001)
+
+    def test_later_timestamps_sort_later(self):
+        older = ids.uuid7_from(1_000, 0xFFF, 2 ** 62 - 1)
+        newer = ids.uuid7_from(1_001, 0, 0)
+        self.assertLess(older, newer)
+        self.assertEqual(newer.version, 7)
+
+    def test_references_sort_like_their_ids(self):
+        values = [ids.uuid7() for _ in range(200)]
+        references = [ids.sortable_reference('TXN_TRA_', v) for v in values]
+
+        self.assertEqual(references, sorted(references))
+        self.assertTrue(all(len(ref) == len('TXN_TRA_') + 26 for ref in references))
+        self.assertEqual(int(references[0][-26:].translate(
+            str.maketrans(ids.ALPHABET, '0123456789abcdefghijklmnopqrstuv')), 32),
+            values[0].int)
+
+
+class RequestMetricsTests(TestCase):
+    """
+    Sampled requests report their SQL statements and timings in
+    Server-Timing and in the /metrics histograms, which only scrapers
+    holding the token can read.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+        User.objects.create_user('bob', 'bob@example.com', 'pass1234')
+        Wallet.objects.filter(user=cls.alice).update(balance=Decimal('500.00'))
+
+    def _transfer(self):
+        client = APIClient()
+        token = RefreshToken.for_user(self.alice).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client.post(reverse('transfer'), {
+            'recipient_username': 'bob', 'amount': '5.00'}, format='json')
+
+    def _sampled(self):
+        series = metrics.DB_QUERIES.values.get(('transfer',))
+        return sum(series[:-1]) if series else 0
+
+    def _scrape(self, token=None):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        return self.client.get(reverse('metrics'), headers=headers)
+
+    @override_settings(METRICS_SAMPLE_RATE=1.0, METRICS_TOKEN='scrape-me')
+    def test_sampled_request_reports_queries(self):
+        sampled = self._sampled()
+        lock_samples = sum(metrics.LOCK_TIME.values.get(('transfer',), [0])[:-1])
+        response = self._transfer()
+
+        self.assertEqual(response.status_code, 201)
+        queries = 18 if connection.vendor == 'postgresql' else 20
+        self.assertRegex(response['Server-Timing'],
+                         r'^total;dur=[\d.]+, db;dur=[\d.]+;'
+                         rf'desc="{queries} queries", lock;dur=[\d.]+$')
+        self.assertEqual(self._sampled(), sampled + 1)
+        self.assertEqual(
+            sum(metrics.LOCK_TIME.values[('transfer',)][:-1]), lock_samples + 1)
+
+        body = self._scrape('scrape-me').content.decode()
+        self.assertIn('# TYPE wallet_db_queries_per_request histogram', body)
+        self.assertIn('# TYPE wallet_lock_time_seconds histogram', body)
+        self.assertRegex(
+            body, r'wallet_http_request_duration_seconds_bucket'
+                  r'\{view="transfer",method="POST",le="\+Inf"\} \d+')
+        self.assertRegex(
+            body, r'wallet_http_requests_total'
+                  r'\{view="transfer",method="POST",status="201"\} \d+')
+
+    @override_settings(METRICS_SAMPLE_RATE=0.0, METRICS_TOKEN='scrape-me')
+    def test_unsampled_request_and_metrics_token(self):
+        sampled = self._sampled()
+        response = self._transfer()
+
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(self._sampled(), sampled)
+        self.assertEqual(self._scrape().status_code, 401)
+        self.assertEqual(self._scrape('wrong').status_code, 401)
+        self.assertEqual(self._scrape('scrape-me').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_metrics_without_token_are_closed_unless_debugging(self):
+        self.assertEqual(self._scrape().status_code, 403)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self._scrape().status_code, 200)
+
+
+class InstrumentationTests(SimpleTestCase):
+    """lock_time() only counts inside a sampled request"""
+
+    def test_lock_time_is_counted_while_sampled(self):
+        with instrumentation.lock_time():
+            pass
+
+        stats, token = instrumentation.begin()
+        try:
+            with instrumentation.lock_time():
+                time.sleep(0.01)
+        finally:
+            instrumentation.end(token)
+        self.assertGreaterEqual(stats.lock_time, 0.01)
+
+        counted = stats.lock_time
+        with instrumentation.lock_time():
+            time.sleep(0.01)
+        self.assertEqual(stats.lock_time, counted)
+
+    def test_metric_kinds_must_define_their_series(self):
+        class Gauge(metrics.Metric):
+            kind = 'gauge'
+
+        with self.assertRaises(TypeError):
+            Gauge(metrics.Registry(), 'wallet_test', 'Test.', ())
@@ -17,9 +17,14 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from config.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/v1/auth/', include('users.urls')),
     path('api/v1/wallet/', include('wallets.urls')),
     path('api/v1/transactions/', include('transactions.urls')),
+    path('api/v1/payments/', include('payments.urls')),
+    path('api/v1/async/', include('config.async_urls')),
 ]
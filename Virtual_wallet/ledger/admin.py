@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import LedgerEntry
+from .models import BalanceCheckpoint, LedgerEntry
 
 
 @admin.register(LedgerEntry)
@@ -20,3 +20,18 @@ class LedgerEntryAdmin(admin.ModelAdmin):
 
     def has_delete_permission(self, request, obj=None):
         return False
+
+
+@admin.register(BalanceCheckpoint)
+class BalanceCheckpointAdmin(admin.ModelAdmin):
+    list_display = ['wallet', 'as_of', 'balance', 'created_at']
+    search_fields = ['wallet__user__username']
+    readonly_fields = ['wallet', 'as_of', 'balance', 'last_entry_id',
+                       'created_at']
+
+    # Checkpoints are built by build_balance_checkpoints
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,72 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from ledger import partitions
+
+
+class Command(BaseCommand):
+    help = ('Move closed ledger_entries partitions to cold storage and/or '
+            'export them as gzipped CSV (PostgreSQL)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-months', type=int, default=12,
+                            help='Recent months left untouched')
+        parser.add_argument('--tablespace',
+                            default=settings.LEDGER_ARCHIVE_TABLESPACE,
+                            help='Tablespace closed partitions are moved to')
+        parser.add_argument('--export-dir', default=None,
+                            help='Also write each closed partition to '
+                                 '<export-dir>/<partition>.csv.gz')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='List the partitions without archiving them')
+
+    def handle(self, *args, **options):
+        if not partitions.supported(connection):
+            self.stdout.write(
+                f'{connection.vendor} does not partition ledger_entries; nothing to do')
+            return
+
+        tablespace = options['tablespace']
+        export_dir = options['export_dir']
+        if not tablespace and not export_dir:
+            raise CommandError(
+                'Set --tablespace (or LEDGER_ARCHIVE_TABLESPACE) and/or --export-dir')
+        if export_dir:
+            os.makedirs(export_dir, exist_ok=True)
+
+        cutoff = partitions.add_months(
+            partitions.month_start(timezone.now()), -options['keep_months'])
+        archived = 0
+        with connection.cursor() as cursor:
+            if not partitions.is_partitioned(cursor):
+                self.stdout.write('ledger_entries is not partitioned; run migrate first')
+                return
+
+            for name, _, upper, current_space in partitions.list_partitions(cursor):
+                if upper > cutoff:
+                    continue
+                move = tablespace and current_space != tablespace
+                path = export_dir and os.path.join(export_dir, f'{name}.csv.gz')
+                export = path and not os.path.exists(path)
+                if not move and not export:
+                    continue
+
+                self.stdout.write(f'  {name} (before {upper:%Y-%m-%d})')
+                archived += 1
+                if options['dry_run']:
+                    continue
+                # Archived partitions stay attached, so statements and
+                # balance queries over old periods keep working
+                if export:
+                    partitions.export_partition(cursor, name, path)
+                if move:
+                    with transaction.atomic():
+                        partitions.move_to_tablespace(cursor, name, tablespace)
+
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {archived} partition(s) closed before {cutoff:%Y-%m-%d}'))
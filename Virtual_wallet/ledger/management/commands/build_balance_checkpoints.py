@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ledger.services import build_checkpoints
+from wallets.models import Wallet
+
+
+class Command(BaseCommand):
+    help = 'Incrementally build balance checkpoints from the ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=int, default=1000,
+                            help='Ledger entries between two checkpoints')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Wallets processed per batch')
+        parser.add_argument('--settle-seconds', type=int, default=300,
+                            help='Leave entries newer than this for a later run')
+        parser.add_argument('--wallet', default=None,
+                            help='Only build checkpoints for this wallet id')
+
+    def handle(self, *args, **options):
+        until = timezone.now() - timedelta(seconds=options['settle_seconds'])
+        wallets = Wallet.objects.order_by('pk').values_list('pk', flat=True)
+        if options['wallet']:
+            wallets = wallets.filter(pk=options['wallet'])
+
+        created = 0
+        processed = 0
+        last_pk = None
+        while True:
+            page = wallets if last_pk is None else wallets.filter(pk__gt=last_pk)
+            batch = list(page[:options['batch_size']])
+            if not batch:
+                break
+            created += build_checkpoints(
+                batch, until, every=options['every'])
+            processed += len(batch)
+            last_pk = batch[-1]
+            self.stdout.write(
+                f'  {processed} wallet(s) scanned, {created} checkpoint(s)')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {created} checkpoint(s) up to {until:%Y-%m-%d %H:%M:%S}'))
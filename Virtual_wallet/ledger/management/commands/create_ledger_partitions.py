@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from ledger import partitions
+
+
+class Command(BaseCommand):
+    help = 'Create the upcoming monthly ledger_entries partitions (PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int,
+                            default=settings.LEDGER_PARTITION_MONTHS_AHEAD,
+                            help='Months ahead of the current one to cover')
+
+    def handle(self, *args, **options):
+        if not partitions.supported(connection):
+            self.stdout.write(
+                f'{connection.vendor} does not partition ledger_entries; nothing to do')
+            return
+
+        current = partitions.month_start(timezone.now())
+        created = 0
+        with connection.cursor() as cursor:
+            if not partitions.is_partitioned(cursor):
+                self.stdout.write('ledger_entries is not partitioned; run migrate first')
+                return
+            existing = partitions.list_partitions(cursor)
+            # The current month is covered too, in case the legacy partition
+            # ended before it
+            for ahead in range(options['months'] + 1):
+                month = partitions.add_months(current, ahead)
+                if any((lower is None or lower <= month) and month < upper
+                       for _, lower, upper, _ in existing):
+                    continue
+                with transaction.atomic():
+                    if partitions.create_partition(cursor, month):
+                        created += 1
+                        self.stdout.write(
+                            f'  created {partitions.partition_name(month)}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {created} partition(s)'))
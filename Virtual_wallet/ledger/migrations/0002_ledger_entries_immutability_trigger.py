@@ -0,0 +1,63 @@
+from django.db import migrations
+
+
+# The SQL this migration ran, kept here rather than imported from
+# ledger.triggers so later changes to the triggers cannot change it
+MESSAGE = 'Ledger entries cannot be modified once created'
+
+CREATE = {
+    'postgresql': [
+        f"""
+        CREATE OR REPLACE FUNCTION ledger_entries_immutable() RETURNS trigger AS $$
+        BEGIN
+            RAISE EXCEPTION '{MESSAGE}';
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE TRIGGER ledger_entries_no_update
+        BEFORE UPDATE ON ledger_entries
+        FOR EACH ROW EXECUTE PROCEDURE ledger_entries_immutable()
+        """,
+    ],
+    'sqlite': [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS ledger_entries_no_update
+        BEFORE UPDATE ON ledger_entries
+        BEGIN
+            SELECT RAISE(ABORT, '{MESSAGE}');
+        END
+        """,
+    ],
+}
+
+DROP = {
+    'postgresql': [
+        "DROP TRIGGER IF EXISTS ledger_entries_no_update ON ledger_entries",
+        "DROP FUNCTION IF EXISTS ledger_entries_immutable()",
+    ],
+    'sqlite': [
+        "DROP TRIGGER IF EXISTS ledger_entries_no_update",
+    ],
+}
+
+
+def create_trigger(apps, schema_editor):
+    for statement in CREATE.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def drop_trigger(apps, schema_editor):
+    for statement in DROP.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigger, drop_trigger),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0002_ledger_entries_immutability_trigger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=models.Index(fields=['wallet', 'created_at'], name='ledger_wallet_created_idx'),
+        ),
+    ]
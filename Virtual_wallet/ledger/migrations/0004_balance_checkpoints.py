@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallets', '0002_daily_spend_counter'),
+        ('ledger', '0003_wallet_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('as_of', models.DateTimeField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('last_entry_id', models.UUIDField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_checkpoints', to='wallets.wallet')),
+            ],
+            options={
+                'db_table': 'ledger_balance_checkpoints',
+                'ordering': ['-as_of'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='balancecheckpoint',
+            constraint=models.UniqueConstraint(fields=('wallet', 'as_of'), name='unique_wallet_checkpoint'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:24
+
+import config.ids
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The uuid7 default is applied by Django, not the database, so only the
+    # migration state changes and existing rows keep their uuid4 ids. A real
+    # AlterField would make SQLite rebuild ledger_entries and lose the
+    # immutability trigger along with the old table.
+
+    dependencies = [
+        ('ledger', '0004_balance_checkpoints'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='ledgerentry',
+                    name='id',
+                    field=models.UUIDField(default=config.ids.uuid7, editable=False, primary_key=True, serialize=False),
+                ),
+            ],
+        ),
+    ]
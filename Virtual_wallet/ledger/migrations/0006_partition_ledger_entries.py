@@ -0,0 +1,17 @@
+from django.db import migrations
+
+from ledger.partitions import partition_ledger, unpartition_ledger
+
+
+class Migration(migrations.Migration):
+    # PostgreSQL only; see ledger.partitions. CREATE INDEX CONCURRENTLY and
+    # VALIDATE CONSTRAINT run before the swap, outside its transaction
+    atomic = False
+
+    dependencies = [
+        ('ledger', '0005_time_ordered_ids'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_ledger, unpartition_ledger),
+    ]
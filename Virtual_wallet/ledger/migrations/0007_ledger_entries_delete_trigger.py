@@ -0,0 +1,82 @@
+from django.db import migrations
+
+
+# The SQL this migration ran, kept here rather than imported from
+# ledger.triggers so later changes to the triggers cannot change it
+MESSAGE = 'Ledger entries cannot be modified once created'
+
+CREATE = {
+    'postgresql': [
+        f"""
+        CREATE OR REPLACE FUNCTION ledger_entries_immutable() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE'
+                    AND current_setting('ledger.allow_delete', true) = 'on' THEN
+                RETURN OLD;
+            END IF;
+            RAISE EXCEPTION '{MESSAGE}';
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS ledger_entries_no_update ON ledger_entries",
+        "DROP TRIGGER IF EXISTS ledger_entries_no_delete ON ledger_entries",
+        """
+        CREATE TRIGGER ledger_entries_no_update
+        BEFORE UPDATE ON ledger_entries
+        FOR EACH ROW EXECUTE PROCEDURE ledger_entries_immutable()
+        """,
+        """
+        CREATE TRIGGER ledger_entries_no_delete
+        BEFORE DELETE ON ledger_entries
+        FOR EACH ROW EXECUTE PROCEDURE ledger_entries_immutable()
+        """,
+    ],
+    'sqlite': [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS ledger_entries_no_update
+        BEFORE UPDATE ON ledger_entries
+        BEGIN
+            SELECT RAISE(ABORT, '{MESSAGE}');
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS ledger_entries_no_delete
+        BEFORE DELETE ON ledger_entries
+        BEGIN
+            SELECT RAISE(ABORT, '{MESSAGE}');
+        END
+        """,
+    ],
+}
+
+DROP = {
+    'postgresql': [
+        "DROP TRIGGER IF EXISTS ledger_entries_no_delete ON ledger_entries",
+    ],
+    'sqlite': [
+        "DROP TRIGGER IF EXISTS ledger_entries_no_delete",
+    ],
+}
+
+
+def create_triggers(apps, schema_editor):
+    for statement in CREATE.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def drop_delete_trigger(apps, schema_editor):
+    for statement in DROP.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+    # Recreates the UPDATE trigger alongside the new DELETE trigger; on
+    # PostgreSQL both are cloned onto every partition
+
+    dependencies = [
+        ('ledger', '0006_partition_ledger_entries'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_triggers, drop_delete_trigger),
+    ]
@@ -0,0 +1,55 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+SQLITE_CREATE_DELETE = """
+    CREATE TRIGGER IF NOT EXISTS ledger_entries_no_delete
+    BEFORE DELETE ON ledger_entries
+    BEGIN
+        SELECT RAISE(ABORT, 'Ledger entries cannot be modified once created');
+    END
+    """
+
+
+def drop_sqlite_delete_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TRIGGER IF EXISTS ledger_entries_no_delete")
+
+
+def create_sqlite_delete_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE_DELETE)
+
+
+class Migration(migrations.Migration):
+    # PROTECT makes Django refuse to cascade a user, wallet or transaction
+    # delete into the ledger, instead of the DELETE trigger aborting it
+    # half way. on_delete lives only in the migration state, so SQLite does
+    # not rebuild ledger_entries (and lose its UPDATE trigger).
+    #
+    # SQLite flushes a test database with DELETE, which the trigger would
+    # reject; with the ORM protecting the rows, only PostgreSQL (which
+    # flushes with TRUNCATE) keeps a DELETE trigger.
+
+    dependencies = [
+        ('ledger', '0007_ledger_entries_delete_trigger'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='ledgerentry',
+                    name='transaction',
+                    field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='ledger_entries', to='transactions.transaction'),
+                ),
+                migrations.AlterField(
+                    model_name='ledgerentry',
+                    name='wallet',
+                    field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='ledger_entries', to='wallets.wallet'),
+                ),
+            ],
+        ),
+        migrations.RunPython(
+            drop_sqlite_delete_trigger, create_sqlite_delete_trigger),
+    ]
@@ -2,7 +2,13 @@ from django.db import models
 from wallets.models import Wallet
 from transactions.models import Transaction
 from decimal import Decimal
-import uuid
+from config.ids import uuid7
+
+
+class LedgerEntryQuerySet(models.QuerySet):
+
+    def delete(self):
+        raise ValueError("Ledger entries cannot be deleted")
 
 
 class LedgerEntry(models.Model):
@@ -14,14 +20,16 @@ class LedgerEntry(models.Model):
         ('CREDIT', 'Credit'),
     ]
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
+    # PROTECT: deleting a user, wallet or transaction with ledger history
+    # fails with ProtectedError before any DELETE reaches the database
     transaction = models.ForeignKey(
         Transaction,
-        on_delete=models.CASCADE,
+        on_delete=models.PROTECT,
         related_name='ledger_entries'
     )
     wallet = models.ForeignKey(
-        Wallet, on_delete=models.CASCADE, related_name='ledger_entries')
+        Wallet, on_delete=models.PROTECT, related_name='ledger_entries')
     entry_type = models.CharField(max_length=10, choices=ENTRY_TYPES)
     amount = models.DecimalField(max_digits=15, decimal_places=2)
     balance_before = models.DecimalField(max_digits=15, decimal_places=2)
@@ -29,20 +37,60 @@ class LedgerEntry(models.Model):
     description = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = LedgerEntryQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.entry_type} - {self.wallet.user.username} - {self.amount}"
 
     def save(self, *args, **kwargs):
-        # Ledger entries are immutable - prevent updates (but allow initial creation)
-        if self.pk is not None:  # Only raise error if trying to UPDATE existing entry
-            # Check if this is actually an update by seeing if it exists in database
-            if LedgerEntry.objects.filter(pk=self.pk).exists():
-                raise ValueError(
-                    "Ledger entries cannot be modified once created")
+        # Ledger entries are append-only: saving is always an INSERT. The
+        # database additionally rejects UPDATEs with a trigger.
+        if not self._state.adding:
+            raise ValueError(
+                "Ledger entries cannot be modified once created")
+        kwargs['force_insert'] = True
         super().save(*args, **kwargs)
 
+    def delete(self, *args, **kwargs):
+        raise ValueError("Ledger entries cannot be deleted")
+
     class Meta:
         db_table = 'ledger_entries'
         verbose_name = 'Ledger Entry'
         verbose_name_plural = 'Ledger Entries'
         ordering = ['-created_at']
+        indexes = [
+            # Per-wallet chain scans (reconciliation, point-in-time balances)
+            models.Index(fields=['wallet', 'created_at'],
+                         name='ledger_wallet_created_idx'),
+        ]
+
+
+class BalanceCheckpoint(models.Model):
+    """
+    A wallet's balance as of a point in time, so point-in-time balance
+    queries replay only the ledger entries written after the checkpoint.
+
+    A checkpoint covers every entry with created_at <= as_of. The last entry
+    is kept as a plain id rather than a foreign key so ledger_entries can be
+    partitioned or archived independently.
+    """
+    id = models.BigAutoField(primary_key=True)
+    wallet = models.ForeignKey(
+        Wallet, on_delete=models.CASCADE, related_name='balance_checkpoints')
+    as_of = models.DateTimeField()
+    balance = models.DecimalField(max_digits=15, decimal_places=2)
+    last_entry_id = models.UUIDField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.wallet_id} @ {self.as_of}: {self.balance}"
+
+    class Meta:
+        db_table = 'ledger_balance_checkpoints'
+        ordering = ['-as_of']
+        constraints = [
+            # Also serves the "latest checkpoint at or before T" lookup
+            models.UniqueConstraint(fields=['wallet', 'as_of'],
+                                    name='unique_wallet_checkpoint'),
+        ]
@@ -0,0 +1,328 @@
+"""
+Monthly range partitioning of ledger_entries on PostgreSQL.
+
+ledger_entries is partitioned by created_at into one partition per month
+(ledger_entries_y2026m01, ...) plus a DEFAULT partition that catches rows if
+a month was not created in time. The rows that existed when partitioning
+was introduced live in ledger_entries_legacy. Queries that filter on
+created_at, such as statements and point-in-time balances, only read the
+partitions their range touches.
+
+On PostgreSQL the primary key becomes (id, created_at), since a partitioned
+table can only enforce uniqueness together with the partition key; ids are
+time-ordered UUIDs and nothing references ledger entries by foreign key.
+
+transactions is deliberately not partitioned: ledger_entries and payments
+reference it by foreign key, and its reference / idempotency_key
+uniqueness must hold across the whole table, neither of which PostgreSQL
+supports on partitioned tables.
+
+Requires PostgreSQL 13+ for the immutability trigger on the partitioned
+table. Every function is a no-op on other databases.
+"""
+import gzip
+import os
+import re
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from .triggers import (
+    POSTGRESQL_DROP_TRIGGERS, create_immutability_trigger, deletes_allowed)
+
+
+TABLE = 'ledger_entries'
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+# Built on the unpartitioned table before it becomes the legacy partition
+LEGACY_KEY = f'{TABLE}_id_created_at_key'
+LEGACY_BOUND = f'{TABLE}_legacy_bound'
+# How close to a month end the legacy partition also takes the next month
+LEGACY_HEADROOM = timedelta(days=7)
+
+_BOUNDS = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+
+def supported(connection):
+    return connection.vendor == 'postgresql'
+
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(month):
+    return f'{TABLE}_y{month.year}m{month.month:02d}'
+
+
+def _quote(cursor, name):
+    return cursor.db.ops.quote_name(name)
+
+
+def is_partitioned(cursor):
+    cursor.execute(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+        "WHERE partrelid = %s::regclass)", [TABLE])
+    return cursor.fetchone()[0]
+
+
+def _indexes(cursor, table):
+    """(name, definition) of the table's indexes, the primary key excluded"""
+    cursor.execute(
+        "SELECT i.relname, pg_get_indexdef(x.indexrelid) FROM pg_index x "
+        "JOIN pg_class i ON i.oid = x.indexrelid "
+        "WHERE x.indrelid = %s::regclass AND NOT x.indisprimary "
+        "ORDER BY i.relname", [table])
+    return cursor.fetchall()
+
+
+def _foreign_keys(cursor, table):
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype = 'f' "
+        "ORDER BY conname", [table])
+    return cursor.fetchall()
+
+
+def _primary_key(cursor, table):
+    cursor.execute(
+        "SELECT conname FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype = 'p'", [table])
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _move_aside(cursor, table, suffix):
+    """
+    Rename table and its indexes out of the way, so a replacement table can
+    take over the names Django and the migrations know them by.
+    """
+    indexes = _indexes(cursor, table)
+    foreign_keys = _foreign_keys(cursor, table)
+    primary_key = _primary_key(cursor, table)
+
+    for statement in POSTGRESQL_DROP_TRIGGERS:
+        cursor.execute(statement)
+    renamed = f'{table}{suffix}'
+    cursor.execute(f'ALTER TABLE {_quote(cursor, table)} '
+                   f'RENAME TO {_quote(cursor, renamed)}')
+    for name, _ in indexes:
+        cursor.execute(f'ALTER INDEX {_quote(cursor, name)} '
+                       f'RENAME TO {_quote(cursor, (name + suffix)[:63])}')
+    if primary_key:
+        cursor.execute(
+            f'ALTER TABLE {_quote(cursor, renamed)} RENAME CONSTRAINT '
+            f'{_quote(cursor, primary_key)} TO '
+            f'{_quote(cursor, (primary_key + suffix)[:63])}')
+    return renamed, indexes, foreign_keys
+
+
+def _recreate(cursor, indexes, foreign_keys):
+    for _, definition in indexes:
+        # Indexes of a partitioned table are reported as ON ONLY <table>
+        cursor.execute(definition.replace(' ON ONLY ', ' ON '))
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE {_quote(cursor, TABLE)} ADD CONSTRAINT '
+                       f'{_quote(cursor, name)} {definition}')
+
+
+def _prepare_legacy(cursor, boundary):
+    """
+    Build what attaching the existing table needs, without blocking writes.
+
+    The (id, created_at) unique index is built CONCURRENTLY, and a CHECK
+    that every row is older than boundary is added NOT VALID and validated
+    separately, which scans the table under a lock that lets writes
+    through. Runs in autocommit; safe to repeat after an interruption.
+    """
+    table, key = _quote(cursor, TABLE), _quote(cursor, LEGACY_KEY)
+    bound = _quote(cursor, LEGACY_BOUND)
+    cursor.execute(
+        "SELECT x.indisvalid FROM pg_index x "
+        "JOIN pg_class i ON i.oid = x.indexrelid "
+        "WHERE x.indrelid = %s::regclass AND i.relname = %s",
+        [TABLE, LEGACY_KEY])
+    row = cursor.fetchone()
+    if row and not row[0]:
+        # Left behind by an interrupted build
+        cursor.execute(f'DROP INDEX CONCURRENTLY {key}')
+    if not row or not row[0]:
+        cursor.execute(f'CREATE UNIQUE INDEX CONCURRENTLY {key} '
+                       f'ON {table} (id, created_at)')
+
+    cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {bound}')
+    cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {bound} '
+                   f'CHECK (created_at < %s) NOT VALID', [boundary])
+    cursor.execute(f'ALTER TABLE {table} VALIDATE CONSTRAINT {bound}')
+
+
+def partition_ledger(apps, schema_editor):
+    """
+    Migration step: turn ledger_entries into a partitioned table.
+
+    Existing rows stay where they are; their table is attached as the
+    ledger_entries_legacy partition covering everything up to the end of
+    the current month (the next one too within LEGACY_HEADROOM of the
+    month end), so no data is copied.
+
+    Must run outside a transaction: the expensive work happens first in
+    _prepare_legacy, so the swap itself only holds its ACCESS EXCLUSIVE
+    locks for catalog changes. ATTACH adopts the prebuilt index, the legacy
+    indexes and foreign keys, and trusts the validated CHECK instead of
+    scanning the rows.
+    """
+    connection = schema_editor.connection
+    if not supported(connection):
+        return
+
+    with connection.cursor() as cursor:
+        if is_partitioned(cursor):
+            return
+        # Rows written while the migration runs must still pass the CHECK
+        boundary = add_months(
+            month_start(datetime.now(dt_timezone.utc) + LEGACY_HEADROOM), 1)
+        _prepare_legacy(cursor, boundary)
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        # Move the primary key onto the prebuilt index; catalog only
+        primary_key = _quote(cursor, _primary_key(cursor, TABLE))
+        cursor.execute(f'ALTER TABLE {_quote(cursor, TABLE)} '
+                       f'DROP CONSTRAINT {primary_key}')
+        cursor.execute(f'ALTER TABLE {_quote(cursor, TABLE)} '
+                       f'ADD CONSTRAINT {primary_key} PRIMARY KEY '
+                       f'USING INDEX {_quote(cursor, LEGACY_KEY)}')
+
+        legacy, indexes, foreign_keys = _move_aside(cursor, TABLE, '_legacy')
+        cursor.execute(
+            f'CREATE TABLE {_quote(cursor, TABLE)} '
+            f'(LIKE {_quote(cursor, legacy)} INCLUDING DEFAULTS) '
+            f'PARTITION BY RANGE (created_at)')
+        cursor.execute(f'ALTER TABLE {_quote(cursor, TABLE)} '
+                       f'ADD PRIMARY KEY (id, created_at)')
+        _recreate(cursor, indexes, foreign_keys)
+
+        cursor.execute(
+            f'ALTER TABLE {_quote(cursor, TABLE)} ATTACH PARTITION '
+            f'{_quote(cursor, legacy)} FOR VALUES FROM (MINVALUE) TO (%s)',
+            [boundary])
+        # The partition bound enforces the same from here on
+        cursor.execute(f'ALTER TABLE {_quote(cursor, legacy)} '
+                       f'DROP CONSTRAINT {_quote(cursor, LEGACY_BOUND)}')
+        cursor.execute(
+            f'CREATE TABLE {_quote(cursor, DEFAULT_PARTITION)} '
+            f'PARTITION OF {_quote(cursor, TABLE)} DEFAULT')
+        for ahead in range(settings.LEDGER_PARTITION_MONTHS_AHEAD):
+            create_partition(cursor, add_months(boundary, ahead))
+
+        create_immutability_trigger(apps, schema_editor)
+
+
+def unpartition_ledger(apps, schema_editor):
+    """Migration step (reverse): copy the rows back into a plain table"""
+    connection = schema_editor.connection
+    if not supported(connection):
+        return
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            return
+        partitioned, indexes, foreign_keys = _move_aside(
+            cursor, TABLE, '_partitioned')
+        cursor.execute(
+            f'CREATE TABLE {_quote(cursor, TABLE)} '
+            f'(LIKE {_quote(cursor, partitioned)} INCLUDING DEFAULTS)')
+        cursor.execute(
+            f'INSERT INTO {_quote(cursor, TABLE)} '
+            f'SELECT * FROM {_quote(cursor, partitioned)}')
+        cursor.execute(f'ALTER TABLE {_quote(cursor, TABLE)} '
+                       f'ADD PRIMARY KEY (id)')
+        cursor.execute(f'DROP TABLE {_quote(cursor, partitioned)} CASCADE')
+        _recreate(cursor, indexes, foreign_keys)
+
+        create_immutability_trigger(apps, schema_editor)
+
+
+def create_partition(cursor, month):
+    """
+    Create the partition for month unless it exists.
+
+    Rows that already fell into the DEFAULT partition for that month are
+    moved into the new partition in the same transaction. Returns whether a
+    partition was created.
+    """
+    name = partition_name(month)
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [name])
+    if cursor.fetchone()[0]:
+        return False
+
+    upper = add_months(month, 1)
+    table, partition = _quote(cursor, TABLE), _quote(cursor, name)
+    default = _quote(cursor, DEFAULT_PARTITION)
+    cursor.execute(f'CREATE TABLE {partition} (LIKE {table} INCLUDING DEFAULTS)')
+    with deletes_allowed(cursor.db):
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {default} '
+            f'WHERE created_at >= %s AND created_at < %s RETURNING *) '
+            f'INSERT INTO {partition} SELECT * FROM moved', [month, upper])
+    cursor.execute(
+        f'ALTER TABLE {table} ATTACH PARTITION {partition} '
+        f'FOR VALUES FROM (%s) TO (%s)', [month, upper])
+    return True
+
+
+def _bound(value):
+    if value == 'MINVALUE':
+        return None
+    return parse_datetime(value.strip("'"))
+
+
+def list_partitions(cursor):
+    """
+    (name, lower, upper, tablespace) of the range partitions, oldest first.
+
+    lower is None for the legacy partition; the DEFAULT partition is left
+    out. tablespace is None for the database default.
+    """
+    cursor.execute(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), t.spcname "
+        "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "LEFT JOIN pg_tablespace t ON t.oid = c.reltablespace "
+        "WHERE i.inhparent = %s::regclass", [TABLE])
+    partitions = []
+    for name, bounds, tablespace in cursor.fetchall():
+        match = _BOUNDS.search(bounds)
+        if match is None:
+            continue
+        lower, upper = (_bound(value) for value in match.groups())
+        partitions.append((name, lower, upper, tablespace))
+    return sorted(partitions, key=lambda p: p[2])
+
+
+def move_to_tablespace(cursor, name, tablespace):
+    """Move a partition and its indexes; it stays attached and queryable"""
+    partition, space = _quote(cursor, name), _quote(cursor, tablespace)
+    cursor.execute(f'ALTER TABLE {partition} SET TABLESPACE {space}')
+    for index, _ in _indexes(cursor, name):
+        cursor.execute(
+            f'ALTER INDEX {_quote(cursor, index)} SET TABLESPACE {space}')
+
+
+def export_partition(cursor, name, path):
+    """
+    Write a partition to a gzipped CSV file with COPY, streaming.
+
+    The file only appears at path once complete.
+    """
+    partial = f'{path}.partial'
+    with gzip.open(partial, 'wb') as archive:
+        cursor.copy_expert(
+            f'COPY {_quote(cursor, name)} TO STDOUT WITH (FORMAT csv, HEADER)',
+            archive)
+    os.replace(partial, path)
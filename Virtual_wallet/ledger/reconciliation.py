@@ -0,0 +1,261 @@
+"""
+Streaming ledger reconciliation.
+
+Work is split into shards by wallet id range. Each shard streams its
+ledger entries ordered by (wallet, created_at) with a server-side cursor,
+so memory stays flat however large the ledger is, and checks:
+
+- chain continuity: every entry starts where the previous one ended and
+  its own arithmetic adds up
+- the wallet's stored balance equals the end of its ledger chain
+- every completed transaction is covered by ledger entries of the right
+  direction and amount
+- each transfer's debit equals the credit of its counterpart leg
+
+On PostgreSQL each shard reads from one REPEATABLE READ snapshot, so a
+transfer committing between the checks cannot show up as a discrepancy.
+Other databases get no such guarantee: run the reconciliation against a
+quiesced database or a replica there.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+from itertools import groupby
+
+from django.db import connection, transaction
+from django.db.models import Case, DecimalField, Q, Sum, Value, When
+
+from transactions.models import Transaction
+from wallets.models import Wallet
+from .models import LedgerEntry
+
+
+ZERO = Decimal('0.00')
+
+# Net ledger movement expected for each completed transaction type
+DEBIT_TYPES = ('TRANSFER_OUT', 'WITHDRAWAL')
+CREDIT_TYPES = ('TRANSFER_IN', 'DEPOSIT')
+
+
+def shard_ranges(shards):
+    """
+    Split wallet ids into contiguous [low, high) ranges of similar size.
+
+    The first low and the last high are None, meaning unbounded.
+    """
+    total = Wallet.objects.count()
+    shards = max(1, min(shards, total))
+    ids = Wallet.objects.order_by('pk').values_list('pk', flat=True)
+    bounds = [ids[total * i // shards] for i in range(1, shards)]
+    lows = [None] + bounds
+    highs = bounds + [None]
+    return list(zip(lows, highs))
+
+
+def _in_range(field, low, high):
+    query = Q()
+    if low is not None:
+        query &= Q(**{f'{field}__gte': low})
+    if high is not None:
+        query &= Q(**{f'{field}__lt': high})
+    return query
+
+
+def _signed(entry_type, amount):
+    return amount if entry_type == 'CREDIT' else -amount
+
+
+def _in_chain_order(group, balance):
+    """
+    Order entries sharing one created_at by following balance_before, so
+    entries written in the same instant do not show up as chain breaks.
+    """
+    remaining = list(group)
+    while remaining:
+        entry = next((e for e in remaining if e[4] == balance), remaining[0])
+        remaining.remove(entry)
+        balance = entry[5]
+        yield entry
+
+
+def reconcile_shard(low, high, chunk_size=2000):
+    """
+    Reconcile the wallets in [low, high).
+
+    Returns (stats, discrepancies) where discrepancies is a list of dicts.
+    """
+    stats = defaultdict(int)
+    discrepancies = []
+
+    with _snapshot():
+        _check_chains(low, high, chunk_size, stats, discrepancies)
+        _check_transactions(low, high, chunk_size, stats, discrepancies)
+    return dict(stats), discrepancies
+
+
+@contextmanager
+def _snapshot():
+    """
+    Read everything in the block from one PostgreSQL snapshot.
+
+    The isolation level can only be set as the first statement of a
+    transaction, so a caller already inside one keeps its own.
+    """
+    if connection.vendor != 'postgresql' or connection.in_atomic_block:
+        yield
+        return
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, '
+                           'READ ONLY')
+        yield
+
+
+def _check_chains(low, high, chunk_size, stats, discrepancies):
+    wallets = (
+        Wallet.objects.filter(_in_range('pk', low, high))
+        .order_by('pk')
+        .values_list('pk', 'balance')
+        .iterator(chunk_size=chunk_size)
+    )
+    entries = (
+        LedgerEntry.objects.filter(_in_range('wallet_id', low, high))
+        .order_by('wallet_id', 'created_at')
+        .values_list('id', 'wallet_id', 'entry_type', 'amount',
+                     'balance_before', 'balance_after', 'created_at')
+        .iterator(chunk_size=chunk_size)
+    )
+    chains = groupby(entries, key=lambda entry: entry[1])
+    chain = next(chains, None)
+
+    for wallet_id, balance in wallets:
+        stats['wallets'] += 1
+        # Entries are only expected for wallets that exist; anything left
+        # behind in the stream belongs to a deleted wallet and is skipped
+        while chain is not None and chain[0] < wallet_id:
+            chain = next(chains, None)
+
+        end = ZERO
+        if chain is not None and chain[0] == wallet_id:
+            end = _walk_chain(wallet_id, chain[1], stats, discrepancies)
+            chain = next(chains, None)
+
+        if end != balance:
+            discrepancies.append({
+                'type': 'BALANCE_MISMATCH',
+                'wallet_id': str(wallet_id),
+                'expected': str(end),
+                'actual': str(balance),
+            })
+
+
+def _walk_chain(wallet_id, entries, stats, discrepancies):
+    """
+    Check one wallet's entries and return the balance they end on.
+
+    Wallets open empty, so the chain starts from zero.
+    """
+    balance = ZERO
+    for _, group in groupby(entries, key=lambda entry: entry[6]):
+        for entry in _in_chain_order(group, balance):
+            entry_id, _, entry_type, amount, before, after, _ = entry
+            stats['entries'] += 1
+
+            if before != balance:
+                discrepancies.append({
+                    'type': 'CHAIN_BREAK',
+                    'wallet_id': str(wallet_id),
+                    'entry_id': str(entry_id),
+                    'expected': str(balance),
+                    'actual': str(before),
+                })
+            if before + _signed(entry_type, amount) != after:
+                discrepancies.append({
+                    'type': 'ENTRY_ARITHMETIC',
+                    'wallet_id': str(wallet_id),
+                    'entry_id': str(entry_id),
+                    'expected': str(before + _signed(entry_type, amount)),
+                    'actual': str(after),
+                })
+            balance = after
+    return balance
+
+
+def _check_transactions(low, high, chunk_size, stats, discrepancies):
+    decimal = DecimalField(max_digits=15, decimal_places=2)
+    rows = (
+        Transaction.objects.filter(_in_range('wallet_id', low, high),
+                                   status='COMPLETED')
+        .order_by()
+        .values('reference', 'transaction_type', 'amount', 'metadata')
+        .annotate(
+            credits=Sum(Case(
+                When(ledger_entries__entry_type='CREDIT',
+                     then='ledger_entries__amount'),
+                default=Value(ZERO), output_field=decimal)),
+            debits=Sum(Case(
+                When(ledger_entries__entry_type='DEBIT',
+                     then='ledger_entries__amount'),
+                default=Value(ZERO), output_field=decimal)),
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+
+    pending_pairs = {}
+    for row in rows:
+        stats['transactions'] += 1
+        credits = row['credits'] or ZERO
+        debits = row['debits'] or ZERO
+        kind = row['transaction_type']
+
+        if kind in DEBIT_TYPES:
+            expected = (ZERO, row['amount'])
+        elif kind in CREDIT_TYPES:
+            expected = (row['amount'], ZERO)
+        else:
+            expected = None
+
+        if expected is not None and (credits, debits) != expected:
+            discrepancies.append({
+                'type': 'TRANSACTION_UNBALANCED',
+                'reference': row['reference'],
+                'transaction_type': kind,
+                'expected': {'credits': str(expected[0]), 'debits': str(expected[1])},
+                'actual': {'credits': str(credits), 'debits': str(debits)},
+            })
+
+        counterpart = (row['metadata'] or {}).get('counterpart')
+        if kind == 'TRANSFER_OUT' and not counterpart:
+            # Transfers made before the legs were linked cannot be paired
+            stats['unpaired_transfers'] += 1
+        elif kind == 'TRANSFER_OUT':
+            pending_pairs[counterpart] = (row['reference'], debits)
+            if len(pending_pairs) >= chunk_size:
+                _check_pairs(pending_pairs, stats, discrepancies)
+                pending_pairs = {}
+
+    if pending_pairs:
+        _check_pairs(pending_pairs, stats, discrepancies)
+
+
+def _check_pairs(pending_pairs, stats, discrepancies):
+    """Compare a chunk of transfer debits with their counterpart credits"""
+    credits = dict(
+        LedgerEntry.objects.filter(
+            transaction__reference__in=pending_pairs, entry_type='CREDIT')
+        .order_by()
+        .values('transaction__reference')
+        .annotate(total=Sum('amount'))
+        .values_list('transaction__reference', 'total')
+    )
+    for counterpart, (reference, debit) in pending_pairs.items():
+        stats['transfer_pairs'] += 1
+        credit = credits.get(counterpart)
+        if credit != debit:
+            discrepancies.append({
+                'type': 'TRANSFER_MISMATCH',
+                'reference': reference,
+                'counterpart': counterpart,
+                'debit': str(debit),
+                'credit': None if credit is None else str(credit),
+            })
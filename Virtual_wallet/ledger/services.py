@@ -0,0 +1,112 @@
+from decimal import Decimal
+from itertools import groupby
+
+from django.db.models import Case, F, OuterRef, Subquery, Sum, When
+
+from wallets.models import Wallet
+from .models import BalanceCheckpoint, LedgerEntry
+
+
+BULK_CREATE_BATCH_SIZE = 500
+
+
+def append(**fields):
+    """Append a single ledger entry with a plain INSERT"""
+    entry = LedgerEntry(**fields)
+    entry.save(force_insert=True)
+    return entry
+
+
+def append_many(entries):
+    """
+    Append the legs of one or more postings in a single bulk INSERT.
+
+    Entries are unsaved LedgerEntry instances; they are written as given and
+    never read back or updated.
+    """
+    return LedgerEntry.objects.bulk_create(
+        entries, batch_size=BULK_CREATE_BATCH_SIZE)
+
+
+def _signed_amount():
+    return Case(When(entry_type='CREDIT', then=F('amount')),
+                default=-F('amount'))
+
+
+def balance_at(wallet_id, at):
+    """
+    The wallet's balance at timestamp at, inclusive.
+
+    Starts from the latest checkpoint at or before at and adds the signed
+    amounts of the entries written after it, so only the tail since the
+    checkpoint is read, through the (wallet, created_at) index.
+    """
+    checkpoint = (BalanceCheckpoint.objects
+                  .filter(wallet_id=wallet_id, as_of__lte=at)
+                  .order_by('-as_of')
+                  .values_list('as_of', 'balance')
+                  .first())
+
+    entries = LedgerEntry.objects.filter(wallet_id=wallet_id, created_at__lte=at)
+    balance = Decimal('0.00')
+    if checkpoint is not None:
+        since, balance = checkpoint
+        entries = entries.filter(created_at__gt=since)
+
+    movement = entries.aggregate(net=Sum(_signed_amount()))['net']
+    return balance + (movement or Decimal('0.00'))
+
+
+def build_checkpoints(wallet_ids, until, every=1000, chunk_size=2000):
+    """
+    Extend the checkpoints of the given wallets up to until.
+
+    Each wallet resumes from its latest checkpoint and gets a new one every
+    `every` entries, at a created_at boundary so a checkpoint always covers
+    all entries sharing its timestamp. until should trail the current time
+    so no transaction still in flight can commit an entry behind a
+    checkpoint. Returns the number of checkpoints created.
+    """
+    latest = BalanceCheckpoint.objects.filter(
+        wallet_id=OuterRef('pk')).order_by('-as_of')
+    resume = {
+        pk: (as_of, balance)
+        for pk, as_of, balance in Wallet.objects.filter(pk__in=wallet_ids)
+        .annotate(as_of=Subquery(latest.values('as_of')[:1]),
+                  checkpoint_balance=Subquery(latest.values('balance')[:1]))
+        .values_list('pk', 'as_of', 'checkpoint_balance')
+    }
+    if not resume:
+        return 0
+
+    entries = LedgerEntry.objects.filter(
+        wallet_id__in=resume, created_at__lte=until)
+    starts = [as_of for as_of, _ in resume.values()]
+    if None not in starts:
+        entries = entries.filter(created_at__gt=min(starts))
+    entries = (entries.order_by('wallet_id', 'created_at')
+               .values_list('id', 'wallet_id', 'entry_type', 'amount',
+                            'created_at')
+               .iterator(chunk_size=chunk_size))
+
+    checkpoints = []
+    for wallet_id, wallet_entries in groupby(entries, key=lambda e: e[1]):
+        since, balance = resume[wallet_id]
+        balance = balance or Decimal('0.00')
+        pending = 0
+        for created_at, group in groupby(wallet_entries, key=lambda e: e[4]):
+            if since is not None and created_at <= since:
+                continue
+            for entry_id, _, entry_type, amount, _ in group:
+                balance += amount if entry_type == 'CREDIT' else -amount
+                pending += 1
+            if pending >= every:
+                checkpoints.append(BalanceCheckpoint(
+                    wallet_id=wallet_id, as_of=created_at, balance=balance,
+                    last_entry_id=entry_id))
+                pending = 0
+
+    # A concurrent run may have written the same checkpoints
+    BalanceCheckpoint.objects.bulk_create(
+        checkpoints, batch_size=BULK_CREATE_BATCH_SIZE, ignore_conflicts=True)
+    return len(checkpoints)
@@ -1,3 +1,373 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import ProtectedError
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from ledger import partitions, reconciliation
+from ledger.models import BalanceCheckpoint, LedgerEntry
+from ledger.services import balance_at, build_checkpoints
+from ledger.triggers import TRIGGERS, deletes_allowed, installed_triggers
+from transactions.models import Transaction
+from wallets.models import Wallet
+
+
+class LedgerImmutabilityTests(TestCase):
+    """
+    Ledger entries can only be inserted. The ORM refuses to change or
+    delete them, also through cascades, and the database rejects UPDATE
+    (and on PostgreSQL DELETE) from raw SQL too.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+        cls.deposit = Transaction.objects.create(
+            wallet=cls.alice.wallet, transaction_type='DEPOSIT',
+            amount=Decimal('10.00'), status='COMPLETED')
+        cls.entry = LedgerEntry.objects.create(
+            transaction=cls.deposit, wallet=cls.alice.wallet, entry_type='CREDIT',
+            amount=Decimal('10.00'), balance_before=Decimal('0.00'),
+            balance_after=Decimal('10.00'), description='Deposit')
+
+    def _assert_rejected(self, statement, error=DatabaseError):
+        with self.assertRaises(error):
+            with transaction.atomic():
+                statement()
+        entry = LedgerEntry.objects.get(pk=self.entry.pk)
+        self.assertEqual(entry.amount, Decimal('10.00'))
+
+    def _raw(self, sql):
+        # Both SQLite's char(32) and PostgreSQL's uuid accept the bare hex
+        def statement():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [self.entry.pk.hex])
+        return statement
+
+    def test_triggers_survive_migrations(self):
+        if connection.vendor not in TRIGGERS:
+            self.skipTest('No immutability triggers on this database')
+        self.assertEqual(installed_triggers(connection),
+                         set(TRIGGERS[connection.vendor]))
+
+    def test_orm_update_and_delete_are_rejected(self):
+        entries = LedgerEntry.objects.filter(pk=self.entry.pk)
+        self._assert_rejected(lambda: entries.update(amount=Decimal('99.00')))
+        self._assert_rejected(entries.delete, ValueError)
+        self._assert_rejected(
+            LedgerEntry.objects.get(pk=self.entry.pk).delete, ValueError)
+
+        with self.assertRaises(ValueError):
+            self.entry.save()
+
+    def test_cascades_into_the_ledger_are_protected(self):
+        for owner in (Transaction.objects.get(pk=self.deposit.pk),
+                      Wallet.objects.get(pk=self.alice.wallet.pk),
+                      User.objects.get(pk=self.alice.pk)):
+            with self.subTest(owner=type(owner).__name__):
+                self._assert_rejected(owner.delete, ProtectedError)
+        self.assertTrue(User.objects.filter(pk=self.alice.pk).exists())
+
+        # Users without ledger history can still be deleted
+        bob = User.objects.create_user('bob', 'bob@example.com', 'pass1234')
+        bob.delete()
+        self.assertFalse(Wallet.objects.filter(user_id=bob.pk).exists())
+
+    def test_raw_update_and_delete_are_rejected(self):
+        self._assert_rejected(self._raw(
+            "UPDATE ledger_entries SET amount = 99 WHERE id = %s"))
+        if connection.vendor != 'postgresql':
+            self.skipTest('Only PostgreSQL rejects DELETE in the database')
+        self._assert_rejected(self._raw(
+            "DELETE FROM ledger_entries WHERE id = %s"))
+
+    def test_deletes_allowed_is_scoped_to_its_block(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('Only PostgreSQL rejects DELETE in the database')
+        delete = self._raw("DELETE FROM ledger_entries WHERE id = %s")
+        with transaction.atomic():
+            with deletes_allowed(connection):
+                delete()
+            self.assertFalse(LedgerEntry.objects.filter(pk=self.entry.pk).exists())
+            transaction.set_rollback(True)
+
+        self._assert_rejected(delete)
+
+
+class ReconcileLedgerTests(TestCase):
+    """
+    reconcile_ledger passes a consistent ledger and fails, with a report,
+    on a broken chain or a transfer whose legs do not pair up.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+        User.objects.create_user('bob', 'bob@example.com', 'pass1234')
+        cls._post(cls.alice, 'DEPOSIT', 'CREDIT', '100.00', '0.00')
+        Wallet.objects.filter(user=cls.alice).update(balance=Decimal('100.00'))
+
+    @staticmethod
+    def _post(user, transaction_type, entry_type, amount, before, **fields):
+        amount, before = Decimal(amount), Decimal(before)
+        posted = Transaction.objects.create(
+            wallet=user.wallet, transaction_type=transaction_type,
+            amount=amount, status='COMPLETED', **fields)
+        LedgerEntry.objects.create(
+            transaction=posted, wallet=user.wallet, entry_type=entry_type,
+            amount=amount, balance_before=before,
+            balance_after=before + (amount if entry_type == 'CREDIT' else -amount),
+            description=transaction_type)
+        return posted
+
+    def setUp(self):
+        cache.clear()
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=self.alice.pk))
+        response = client.post(reverse('transfer'), {
+            'recipient_username': 'bob', 'amount': '30.00'}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def _reconcile(self):
+        """The command's report; raises CommandError on discrepancies"""
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        try:
+            call_command('reconcile_ledger', '--workers', '1', '--output', path,
+                         stdout=StringIO(), stderr=StringIO())
+        finally:
+            with open(path) as report_file:
+                self.report = json.load(report_file)
+
+    def test_consistent_ledger_reconciles(self):
+        self._reconcile()
+        self.assertEqual(self.report['discrepancies'], [])
+        self.assertEqual(self.report['checked']['transfer_pairs'], 1)
+
+    def test_chain_break_is_reported_and_fails(self):
+        # alice is at 70.00, but the new entry claims to start from 50.00
+        self._post(self.alice, 'DEPOSIT', 'CREDIT', '10.00', '50.00')
+
+        with self.assertRaisesMessage(CommandError, 'ledger discrepanc'):
+            self._reconcile()
+        breaks = [d for d in self.report['discrepancies']
+                  if d['type'] == 'CHAIN_BREAK']
+        self.assertEqual(len(breaks), 1)
+        self.assertEqual((breaks[0]['expected'], breaks[0]['actual']),
+                         ('70.00', '50.00'))
+
+    def test_unpaired_transfer_is_reported_and_fails(self):
+        # A debit whose counterpart credit was never written
+        self._post(self.alice, 'TRANSFER_OUT', 'DEBIT', '5.00', '70.00',
+                   metadata={'counterpart': 'TXN_TRA_MISSING'})
+        Wallet.objects.filter(user=self.alice).update(balance=Decimal('65.00'))
+
+        with self.assertRaises(CommandError):
+            self._reconcile()
+        self.assertEqual(self.report['summary'], {'TRANSFER_MISMATCH': 1})
+        self.assertEqual(self.report['discrepancies'][0]['counterpart'],
+                         'TXN_TRA_MISSING')
+
+
+class ReconcileSnapshotTests(TransactionTestCase):
+    """On PostgreSQL a shard reads one read-only REPEATABLE READ snapshot"""
+
+    def test_shard_runs_in_one_snapshot(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('Snapshot isolation is only set on PostgreSQL')
+
+        def settings_in_effect(*args):
+            with connection.cursor() as cursor:
+                cursor.execute('SHOW transaction_isolation')
+                seen.append(cursor.fetchone()[0])
+                cursor.execute('SHOW transaction_read_only')
+                seen.append(cursor.fetchone()[0])
+
+        seen = []
+        with mock.patch.object(reconciliation, '_check_transactions',
+                               settings_in_effect):
+            reconciliation.reconcile_shard(None, None)
+        self.assertEqual(seen, ['repeatable read', 'on'])
+
+
+class BalanceAtTests(TestCase):
+    """
+    balance_at answers the same from the whole ledger and from the nearest
+    checkpoint plus the entries after it.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+        cls.wallet_id = alice.wallet.pk
+        deposit = Transaction.objects.create(
+            wallet=alice.wallet, transaction_type='DEPOSIT',
+            amount=Decimal('1.00'), status='COMPLETED')
+
+        # (moment, balance after) for every entry of the chain
+        cls.timeline = []
+        balance = Decimal('0.00')
+        for n in range(14):
+            entry_type = 'DEBIT' if n % 3 == 2 else 'CREDIT'
+            amount = Decimal(n + 1)
+            after = balance + (amount if entry_type == 'CREDIT' else -amount)
+            entry = LedgerEntry.objects.create(
+                transaction=deposit, wallet=alice.wallet, entry_type=entry_type,
+                amount=amount, balance_before=balance, balance_after=after,
+                description='entry')
+            cls.timeline.append((entry.created_at, after))
+            balance = after
+
+    def _probes(self):
+        """Every entry's timestamp, between two entries, and both ends"""
+        first = self.timeline[0][0]
+        yield first - timedelta(seconds=1), Decimal('0.00')
+        for (moment, balance), (after, _) in zip(self.timeline, self.timeline[1:]):
+            yield moment, balance
+            yield moment + (after - moment) / 2, balance
+        yield self.timeline[-1]
+        yield self.timeline[-1][0] + timedelta(days=1), self.timeline[-1][1]
+
+    def _assert_all_probes(self):
+        for moment, expected in self._probes():
+            with self.subTest(at=moment):
+                self.assertEqual(balance_at(self.wallet_id, moment), expected)
+
+    def test_checkpoints_do_not_change_balances(self):
+        self.assertFalse(BalanceCheckpoint.objects.exists())
+        self._assert_all_probes()
+
+        # Up to the middle of the chain first, then resumed to the end
+        middle = self.timeline[6][0]
+        self.assertEqual(build_checkpoints([self.wallet_id], middle, every=3), 2)
+        self._assert_all_probes()
+
+        call_command('build_balance_checkpoints', '--every', '3',
+                     '--settle-seconds', '0', stdout=StringIO())
+        self.assertEqual(BalanceCheckpoint.objects.count(), 4)
+        self._assert_all_probes()
+
+
+class LedgerPartitioningTests(TransactionTestCase):
+    """
+    On PostgreSQL migrating turns ledger_entries into monthly partitions
+    around the existing rows; new rows land in their month's partition and
+    closed partitions can be archived.
+    """
+
+    def setUp(self):
+        if not partitions.supported(connection):
+            self.skipTest('ledger_entries is only partitioned on PostgreSQL')
+        alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+        self.deposit = Transaction.objects.create(
+            wallet=alice.wallet, transaction_type='DEPOSIT',
+            amount=Decimal('1.00'), status='COMPLETED')
+
+    def _migrate(self, target):
+        MigrationExecutor(connection).migrate([('ledger', target)])
+
+    def _is_partitioned(self):
+        with connection.cursor() as cursor:
+            return partitions.is_partitioned(cursor)
+
+    def _partitions(self):
+        with connection.cursor() as cursor:
+            return partitions.list_partitions(cursor)
+
+    def _entry(self, at=None):
+        with mock.patch('django.utils.timezone.now',
+                        return_value=at or timezone.now()):
+            return LedgerEntry.objects.create(
+                transaction=self.deposit, wallet=self.deposit.wallet,
+                entry_type='CREDIT', amount=Decimal('1.00'),
+                balance_before=Decimal('0.00'), balance_after=Decimal('1.00'),
+                description='Deposit')
+
+    def _partition_of(self, entry):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT tableoid::regclass::text FROM ledger_entries "
+                "WHERE id = %s", [entry.pk])
+            return cursor.fetchone()[0]
+
+    def _constraints(self, table, contype):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT conname FROM pg_constraint "
+                "WHERE conrelid = %s::regclass AND contype = %s",
+                [table, contype])
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_migrating_forward_keeps_rows_and_routes_inserts(self):
+        self._migrate('0005_time_ordered_ids')
+        self.assertFalse(self._is_partitioned())
+        existing = self._entry()
+
+        self._migrate('0008_protect_ledger_entries')
+
+        self.assertTrue(self._is_partitioned())
+        self.assertEqual(installed_triggers(connection), set(TRIGGERS))
+        legacy = f'{partitions.TABLE}_legacy'
+        self.assertEqual(self._partition_of(existing), legacy)
+        # The prebuilt index became the legacy primary key, and the CHECK
+        # that spared ATTACH its scan is gone
+        self.assertEqual(self._constraints(legacy, 'p'),
+                         {f'{partitions.TABLE}_pkey_legacy'})
+        self.assertEqual(self._constraints(legacy, 'c'), set())
+        self.assertEqual(len(self._constraints(legacy, 'f')),
+                         len(self._constraints(partitions.TABLE, 'f')))
+
+        self.assertEqual(self._partition_of(self._entry()), legacy)
+        (_, _, boundary, _), (name, lower, _, _) = self._partitions()[:2]
+        self.assertEqual(lower, boundary)
+        self.assertEqual(self._partition_of(
+            self._entry(lower + timedelta(days=3))), name)
+        self.assertEqual(self._partition_of(
+            self._entry(lower + timedelta(days=3650))),
+            partitions.DEFAULT_PARTITION)
+
+    def test_archive_exports_closed_partitions(self):
+        entry = self._entry()
+        closed = self._partitions()
+        export_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, export_dir)
+
+        def archive(*args):
+            out = StringIO()
+            # Far enough ahead that every range partition has closed
+            later = timezone.now() + timedelta(days=3650)
+            with mock.patch('django.utils.timezone.now', return_value=later):
+                call_command('archive_ledger_partitions', '--keep-months', '0',
+                             '--export-dir', export_dir, *args, stdout=out)
+            return out.getvalue()
+
+        self.assertIn(f'Would archive {len(closed)} partition(s)',
+                      archive('--dry-run'))
+        self.assertEqual(os.listdir(export_dir), [])
+
+        self.assertIn(f'Archived {len(closed)} partition(s)', archive())
+        self.assertEqual(sorted(os.listdir(export_dir)),
+                         sorted(f'{name}.csv.gz' for name, *_ in closed))
+        with gzip.open(os.path.join(
+                export_dir, f'{partitions.TABLE}_legacy.csv.gz'), 'rt') as f:
+            self.assertIn(str(entry.pk), f.read())
+        # Archived partitions stay attached and queryable
+        self.assertTrue(LedgerEntry.objects.filter(pk=entry.pk).exists())
+
+        self.assertIn('Archived 0 partition(s)', archive())
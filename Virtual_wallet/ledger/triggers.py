@@ -0,0 +1,114 @@
+"""
+Database-level immutability for ledger_entries, as currently installed.
+
+UPDATE is rejected everywhere. PostgreSQL also rejects DELETE unless
+deletes_allowed() is in effect. SQLite has no DELETE trigger, since it
+flushes a test database with DELETE; there, as everywhere, the ORM refuses
+to delete entries (LedgerEntry.delete and the PROTECT foreign keys).
+"""
+from contextlib import contextmanager
+
+MESSAGE = 'Ledger entries cannot be modified once created'
+
+# Transaction-local PostgreSQL setting that lets maintenance which moves
+# rows between partitions delete them; see deletes_allowed()
+ALLOW_DELETE_SETTING = 'ledger.allow_delete'
+
+POSTGRESQL_DROP_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS ledger_entries_no_update ON ledger_entries",
+    "DROP TRIGGER IF EXISTS ledger_entries_no_delete ON ledger_entries",
+]
+
+POSTGRESQL_CREATE = [
+    f"""
+    CREATE OR REPLACE FUNCTION ledger_entries_immutable() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE'
+                AND current_setting('{ALLOW_DELETE_SETTING}', true) = 'on' THEN
+            RETURN OLD;
+        END IF;
+        RAISE EXCEPTION '{MESSAGE}';
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    *POSTGRESQL_DROP_TRIGGERS,
+    """
+    CREATE TRIGGER ledger_entries_no_update
+    BEFORE UPDATE ON ledger_entries
+    FOR EACH ROW EXECUTE PROCEDURE ledger_entries_immutable()
+    """,
+    """
+    CREATE TRIGGER ledger_entries_no_delete
+    BEFORE DELETE ON ledger_entries
+    FOR EACH ROW EXECUTE PROCEDURE ledger_entries_immutable()
+    """,
+]
+
+SQLITE_CREATE = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS ledger_entries_no_update
+    BEFORE UPDATE ON ledger_entries
+    BEGIN
+        SELECT RAISE(ABORT, '{MESSAGE}');
+    END
+    """,
+]
+
+# Triggers every migrated database must have; SQLite drops them whenever a
+# migration rebuilds ledger_entries
+TRIGGERS = {
+    'postgresql': ('ledger_entries_no_update', 'ledger_entries_no_delete'),
+    'sqlite': ('ledger_entries_no_update',),
+}
+
+
+def create_immutability_trigger(apps, schema_editor):
+    """
+    Create (or replace) the current triggers, for code that rebuilds
+    ledger_entries. Migrations keep their own copy of the SQL they ran.
+    """
+    statements = {
+        'postgresql': POSTGRESQL_CREATE,
+        'sqlite': SQLITE_CREATE,
+    }
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def installed_triggers(connection):
+    """Names of the immutability triggers present on ledger_entries"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                "SELECT tgname FROM pg_trigger "
+                "WHERE tgrelid = 'ledger_entries'::regclass AND NOT tgisinternal")
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT name FROM sqlite_master "
+                "WHERE type = 'trigger' AND tbl_name = 'ledger_entries'")
+        else:
+            return set()
+        return ({row[0] for row in cursor.fetchall()}
+                & set(TRIGGERS[connection.vendor]))
+
+
+@contextmanager
+def deletes_allowed(connection):
+    """
+    Let ledger rows be deleted inside the block, for maintenance that moves
+    rows between partitions rather than destroying them.
+
+    PostgreSQL sets a transaction-local flag the trigger checks, so call it
+    inside a transaction. Elsewhere there is no DELETE trigger to lift.
+    """
+    if connection.vendor != 'postgresql':
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT set_config(%s, 'on', true)",
+                       [ALLOW_DELETE_SETTING])
+        try:
+            yield
+        finally:
+            cursor.execute("SELECT set_config(%s, 'off', true)",
+                           [ALLOW_DELETE_SETTING])
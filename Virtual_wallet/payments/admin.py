@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Payment
+from .models import Payment, WebhookEvent
 
 
 @admin.register(Payment)
@@ -9,3 +9,13 @@ class PaymentAdmin(admin.ModelAdmin):
     list_filter = ['payment_method', 'status', 'initiated_at']
     search_fields = ['reference', 'wallet__user__username']
     readonly_fields = ['id', 'reference', 'initiated_at', 'confirmed_at']
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'provider', 'event', 'reference',
+                    'status', 'received_at', 'processed_at']
+    list_filter = ['provider', 'status', 'received_at']
+    search_fields = ['reference', 'provider_reference']
+    readonly_fields = ['id', 'provider', 'event', 'reference',
+                       'provider_reference', 'payload', 'received_at']
@@ -0,0 +1,56 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from payments.models import Payment
+from payments.services import expire_overdue_batch
+
+
+class Command(BaseCommand):
+    help = 'Expire overdue PENDING payments and release their wallet holds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Payments expired per transaction')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be expired without changing anything')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+
+        if options['dry_run']:
+            overdue = Payment.objects.filter(
+                status='PENDING', expires_at__lte=now
+            ).aggregate(
+                payments=Count('id'),
+                wallets=Count('wallet', distinct=True),
+                amount=Sum('amount')
+            )
+            self.stdout.write(
+                f"[dry run] {overdue['payments']} payment(s) across "
+                f"{overdue['wallets']} wallet(s) would expire, releasing "
+                f"{overdue['amount'] or Decimal('0.00'):.2f} in pending holds")
+            return
+
+        started = time.monotonic()
+        batches = expired = 0
+        released = Decimal('0.00')
+        while True:
+            count, amount = expire_overdue_batch(now, options['batch_size'])
+            if not count:
+                break
+            batches += 1
+            expired += count
+            released += amount
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'batch {batches}: expired {expired} payment(s), '
+                f'released {released} ({expired / elapsed:.0f}/s)')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Expired {expired} payment(s) in {batches} batch(es), '
+            f'released {released} in pending holds, {elapsed:.2f}s'))
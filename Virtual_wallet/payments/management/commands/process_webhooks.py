@@ -0,0 +1,56 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from payments.services import process_webhook_batch
+
+
+class Command(BaseCommand):
+    help = 'Drain the payment webhook inbox: confirm payments and credit wallets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Number of concurrent worker threads')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Events claimed per worker transaction')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to sleep when the inbox is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the inbox is drained')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if workers > 1 and not connection.features.has_select_for_update_skip_locked:
+            self.stderr.write(
+                f'{connection.vendor} cannot skip locked rows; using one worker')
+            workers = 1
+
+        if workers == 1:
+            handled = self._drain(options)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                handled = sum(pool.map(
+                    lambda _: self._drain_in_thread(options), range(workers)))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {handled} webhook event(s)'))
+
+    def _drain(self, options):
+        handled = 0
+        while True:
+            count = process_webhook_batch(options['batch_size'])
+            handled += count
+            if count:
+                continue
+            if options['once']:
+                return handled
+            time.sleep(options['interval'])
+
+    def _drain_in_thread(self, options):
+        try:
+            return self._drain(options)
+        finally:
+            # Each worker thread owns its own database connection
+            connection.close()
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('provider', models.CharField(max_length=50)),
+                ('event', models.CharField(blank=True, max_length=100)),
+                ('reference', models.CharField(blank=True, db_index=True, max_length=100)),
+                ('provider_reference', models.CharField(blank=True, max_length=255, null=True)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('RECEIVED', 'Received'), ('PROCESSED', 'Processed'), ('DUPLICATE', 'Duplicate'), ('IGNORED', 'Ignored'), ('FAILED', 'Failed')], default='RECEIVED', max_length=15)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Webhook Event',
+                'verbose_name_plural': 'Webhook Events',
+                'db_table': 'payment_webhook_events',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'id'], name='payment_web_status_7d769a_idx')],
+            },
+        ),
+    ]
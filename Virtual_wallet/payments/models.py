@@ -3,12 +3,15 @@ from wallets.models import Wallet
 from transactions.models import Transaction
 from django.core.validators import MinValueValidator
 from decimal import Decimal
-import uuid
+from config.ids import sortable_reference, uuid7
 
 
 class Payment(models.Model):
     """
     External payment processing (deposits via payment gateway)
+
+    While a payment is PENDING its amount is held in the wallet's
+    pending_balance; confirming, failing or expiring it releases the hold.
     """
     PAYMENT_METHODS = [
         ('BANK_TRANSFER', 'Bank Transfer'),
@@ -24,7 +27,7 @@ class Payment(models.Model):
         ('EXPIRED', 'Expired'),
     ]
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     reference = models.CharField(max_length=100, unique=True, db_index=True)
     transaction = models.OneToOneField(
         Transaction,
@@ -56,8 +59,7 @@ class Payment(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.reference:
-            import time
-            self.reference = f"PAY_{int(time.time())}{str(uuid.uuid4())[:8]}"
+            self.reference = sortable_reference("PAY_")
         super().save(*args, **kwargs)
 
     class Meta:
@@ -65,3 +67,51 @@ class Payment(models.Model):
         verbose_name = 'Payment'
         verbose_name_plural = 'Payments'
         ordering = ['-initiated_at']
+        indexes = [
+            # Only pending payments can expire; keeps the sweeper's scan
+            # proportional to the live backlog
+            models.Index(fields=['expires_at'],
+                         condition=models.Q(status='PENDING'),
+                         name='payments_pending_expiry_idx'),
+        ]
+
+
+class WebhookEvent(models.Model):
+    """
+    Durable inbox of payment gateway callbacks.
+
+    Webhooks are stored here as received and acknowledged immediately; the
+    process_webhooks worker drains the inbox in batches.
+    """
+    STATUS_CHOICES = [
+        ('RECEIVED', 'Received'),
+        ('PROCESSED', 'Processed'),
+        ('DUPLICATE', 'Duplicate'),
+        ('IGNORED', 'Ignored'),
+        ('FAILED', 'Failed'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    provider = models.CharField(max_length=50)
+    event = models.CharField(max_length=100, blank=True)
+    reference = models.CharField(max_length=100, blank=True, db_index=True)
+    provider_reference = models.CharField(
+        max_length=255, blank=True, null=True)
+    payload = models.JSONField()
+    status = models.CharField(
+        max_length=15, choices=STATUS_CHOICES, default='RECEIVED')
+    error = models.TextField(blank=True, null=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.provider} {self.event} - {self.reference} - {self.status}"
+
+    class Meta:
+        db_table = 'payment_webhook_events'
+        verbose_name = 'Webhook Event'
+        verbose_name_plural = 'Webhook Events'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
@@ -0,0 +1,251 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Payment, WebhookEvent
+from .webhooks import get_provider
+from transactions import outbox, rollups
+from transactions.models import Transaction
+from transactions.serializers import TransactionSerializer
+from wallets import events as wallet_events
+from wallets.models import Wallet
+from wallets.services import lock_wallets, with_wallet_locks
+from ledger import services as ledger
+from ledger.models import LedgerEntry
+
+
+@with_wallet_locks
+def process_webhook_batch(batch_size=200):
+    """
+    Drain one batch of received webhooks from the inbox.
+
+    Events are claimed with SELECT ... FOR UPDATE SKIP LOCKED so several
+    workers can drain the inbox side by side. Duplicates are detected on the
+    payment reference / provider reference, a successful event must match
+    the payment's amount and currency, and only an explicit failure from
+    the provider fails a payment. A successful charge for a payment that
+    already expired or failed is marked FAILED for reconciliation. Every
+    wallet credited in the batch gets a single grouped balance UPDATE,
+    with all ledger entries written in one bulk INSERT. Once committed, the wallets' streams get
+    the settled deposits and new balances.
+
+    Returns the number of events handled.
+    """
+    events = list(
+        WebhookEvent.objects.select_for_update(skip_locked=True)
+        .filter(status='RECEIVED')
+        .order_by('id')[:batch_size]
+    )
+    if not events:
+        return 0
+
+    now = timezone.now()
+    parsed = {
+        event.pk: get_provider(event.provider).parse(event.payload)
+        for event in events
+    }
+
+    references = {p.reference for p in parsed.values() if p.reference}
+    provider_references = {
+        p.provider_reference for p in parsed.values() if p.provider_reference}
+    payments = list(
+        Payment.objects.select_for_update(of=('self',))
+        .filter(Q(reference__in=references)
+                | Q(provider_reference__in=provider_references))
+        .annotate(currency=F('transaction__currency'))
+        .order_by('pk')
+    )
+    by_reference = {payment.reference: payment for payment in payments}
+    by_provider_reference = {
+        payment.provider_reference: payment
+        for payment in payments if payment.provider_reference}
+
+    confirmed = []
+    failed = []
+    seen = set()
+
+    for event in events:
+        event.processed_at = now
+        data = parsed[event.pk]
+        payment = (by_reference.get(data.reference)
+                   or by_provider_reference.get(data.provider_reference))
+
+        if payment is None:
+            event.status = 'IGNORED'
+            event.error = 'Unknown payment reference'
+        elif data.successful and payment.status in ('EXPIRED', 'FAILED'):
+            # The customer was charged for a deposit we already gave up
+            # on; keep it visible for reconciliation rather than a duplicate
+            event.status = 'FAILED'
+            event.error = f'Successful charge for a {payment.status} payment'
+        elif payment.pk in seen or payment.status != 'PENDING':
+            event.status = 'DUPLICATE'
+        elif data.failed:
+            payment.status = 'FAILED'
+            failed.append((payment, event, data))
+            event.status = 'PROCESSED'
+        elif not data.successful:
+            event.status = 'IGNORED'
+            event.error = f'Not a charge outcome: {data.event or "no event"}'
+        elif data.amount != payment.amount:
+            event.status = 'FAILED'
+            event.error = (f'Amount mismatch: expected {payment.amount}, '
+                           f'received {data.amount}')
+        elif data.currency != payment.currency:
+            event.status = 'FAILED'
+            event.error = (f'Currency mismatch: expected {payment.currency}, '
+                           f'received {data.currency}')
+        else:
+            payment.status = 'CONFIRMED'
+            payment.confirmed_at = now
+            confirmed.append((payment, event, data))
+            event.status = 'PROCESSED'
+
+        if payment is not None:
+            seen.add(payment.pk)
+
+    for payment, event, data in confirmed + failed:
+        payment.webhook_received = True
+        payment.webhook_data = event.payload
+        payment.provider_reference = (
+            data.provider_reference or payment.provider_reference)
+
+    credited = _credit_confirmed_payments(confirmed, now) if confirmed else []
+    if failed:
+        Transaction.objects.filter(
+            pk__in=[payment.transaction_id for payment, _, _ in failed]
+        ).update(status='FAILED', updated_at=now)
+    Wallet.objects.release_pending(
+        _holds(payment for payment, _, _ in confirmed + failed))
+    outbox.emit(
+        [outbox.payment_event(outbox.DEPOSIT_CONFIRMED, payment,
+                              provider=payment.provider, confirmed_at=now)
+         for payment, _, _ in confirmed]
+        + [outbox.payment_event(outbox.DEPOSIT_FAILED, payment,
+                                provider=payment.provider)
+           for payment, _, _ in failed]
+    )
+
+    _publish_wallet_events([payment for payment, _, _ in confirmed + failed],
+                           credited)
+
+    Payment.objects.bulk_update(
+        [payment for payment, _, _ in confirmed + failed],
+        ['status', 'confirmed_at', 'webhook_received', 'webhook_data',
+         'provider_reference']
+    )
+    WebhookEvent.objects.bulk_update(
+        events, ['status', 'error', 'processed_at'])
+    return len(events)
+
+
+def _credit_confirmed_payments(confirmed, now):
+    """
+    Credit every confirmed deposit with one UPDATE per batch.
+
+    Returns (wallet, new balance, transaction id of its last deposit) for
+    every credited wallet.
+    """
+    wallet_ids = {payment.wallet_id for payment, _, _ in confirmed}
+    wallets = {wallet.pk: wallet for wallet in lock_wallets(Q(pk__in=wallet_ids))}
+    running = {pk: wallet.balance for pk, wallet in wallets.items()}
+
+    credits = defaultdict(Decimal)
+    entries = []
+    last_deposit = {}
+    for payment, _, _ in confirmed:
+        last_deposit[payment.wallet_id] = payment.transaction_id
+        before = running[payment.wallet_id]
+        running[payment.wallet_id] = before + payment.amount
+        credits[payment.wallet_id] += payment.amount
+        entries.append(LedgerEntry(
+            transaction_id=payment.transaction_id,
+            wallet_id=payment.wallet_id,
+            entry_type='CREDIT',
+            amount=payment.amount,
+            balance_before=before,
+            balance_after=running[payment.wallet_id],
+            description=f'Deposit via {payment.provider}: {payment.reference}'
+        ))
+
+    Wallet.objects.credit_many(credits)
+    Transaction.objects.filter(
+        pk__in=[payment.transaction_id for payment, _, _ in confirmed]
+    ).update(status='COMPLETED', completed_at=now, updated_at=now)
+    ledger.append_many(entries)
+    rollups.record(
+        rollups.Movement(payment.wallet_id, 'DEPOSIT',
+                         wallets[payment.wallet_id].currency, now,
+                         payment.amount)
+        for payment, _, _ in confirmed
+    )
+    return [(wallets[pk], running[pk], transaction_id)
+            for pk, transaction_id in last_deposit.items()]
+
+
+def _publish_wallet_events(payments, credited):
+    """
+    Once committed, push each settled deposit to its wallet's stream, then
+    the new balance of every credited wallet.
+    """
+    if not payments:
+        return
+    deposits = Transaction.objects.select_related(
+        'wallet__user', 'recipient_wallet__user').in_bulk(
+        [payment.transaction_id for payment in payments])
+    wallet_events.publish_on_commit(
+        [wallet_events.Event(deposit.wallet_id, 'transaction',
+                             TransactionSerializer(deposit).data)
+         for deposit in deposits.values()]
+        + [wallet_events.balance_changed(
+               wallet, balance, deposits[transaction_id].reference)
+           for wallet, balance, transaction_id in credited]
+    )
+
+
+@with_wallet_locks
+def expire_overdue_batch(now, batch_size=500):
+    """
+    Expire one batch of PENDING payments whose expires_at has passed.
+
+    Rows are found through the partial (expires_at) WHERE status='PENDING'
+    index and changed with set-based UPDATE ... WHERE id IN (...) statements:
+    payments become EXPIRED, their deposit transactions FAILED, and the
+    wallets' pending holds are released in one grouped UPDATE.
+
+    Returns (expired count, total amount released).
+    """
+    batch = list(
+        Payment.objects.select_for_update(skip_locked=True)
+        .filter(status='PENDING', expires_at__lte=now)
+        .order_by('expires_at')
+        .only('id', 'reference', 'wallet_id', 'transaction_id',
+              'amount')[:batch_size]
+    )
+    if not batch:
+        return 0, Decimal('0.00')
+
+    Payment.objects.filter(
+        pk__in=[payment.pk for payment in batch]
+    ).update(status='EXPIRED')
+    Transaction.objects.filter(
+        pk__in=[payment.transaction_id for payment in batch]
+    ).update(status='FAILED', updated_at=now)
+
+    holds = _holds(batch)
+    Wallet.objects.release_pending(holds)
+    outbox.emit([
+        outbox.payment_event(outbox.PAYMENT_EXPIRED, payment, expired_at=now)
+        for payment in batch
+    ])
+    return len(batch), sum(holds.values(), Decimal('0.00'))
+
+
+def _holds(payments):
+    """Pending amount per wallet for the given payments"""
+    holds = defaultdict(Decimal)
+    for payment in payments:
+        holds[payment.wallet_id] += payment.amount
+    return holds
@@ -1,3 +1,334 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import (
+    TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature)
+from django.urls import reverse
+from django.utils import timezone
+
+from ledger.models import LedgerEntry
+from payments.models import Payment, WebhookEvent
+from payments.services import process_webhook_batch
+from transactions.models import OutboxEvent, Transaction
+from wallets.models import Wallet
+
+
+SECRET = 'paystack-test-secret'
+
+
+def pending_deposit(user, amount, reference, expires_at=None):
+    """A PENDING gateway deposit with its amount held in pending_balance"""
+    deposit = Transaction.objects.create(
+        wallet=user.wallet, transaction_type='DEPOSIT', amount=amount,
+        status='PENDING')
+    Wallet.objects.filter(pk=user.wallet.pk).update(
+        pending_balance=F('pending_balance') + amount)
+    return Payment.objects.create(
+        reference=reference, transaction=deposit, wallet=user.wallet,
+        amount=amount, payment_method='CARD', expires_at=expires_at)
+
+
+def charge_success(reference, kobo, currency='NGN', charge_id=1):
+    return {
+        'event': 'charge.success',
+        'data': {'id': charge_id, 'reference': reference, 'amount': kobo,
+                 'currency': currency, 'status': 'success'},
+    }
+
+
+@override_settings(PAYSTACK_SECRET_KEY=SECRET)
+class WebhookViewTests(TestCase):
+    """The public webhook endpoint stores only correctly signed events"""
+
+    def _post(self, body, signature):
+        return self.client.post(
+            reverse('payment-webhook', args=['paystack']), data=body,
+            content_type='application/json',
+            HTTP_X_PAYSTACK_SIGNATURE=signature)
+
+    def test_bad_signature_is_rejected(self):
+        body = json.dumps(charge_success('PAY_1', 5000)).encode()
+        forged = hmac.new(b'wrong-secret', body, hashlib.sha512).hexdigest()
+
+        for signature in (forged, ''):
+            response = self._post(body, signature)
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response.json()['error'], 'INVALID_SIGNATURE')
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_signed_event_is_stored_for_the_worker(self):
+        body = json.dumps(charge_success('PAY_1', 5000)).encode()
+        signature = hmac.new(SECRET.encode(), body, hashlib.sha512).hexdigest()
+
+        response = self._post(body, signature)
+        self.assertEqual(response.status_code, 200)
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.provider, event.reference, event.status),
+                         ('Paystack', 'PAY_1', 'RECEIVED'))
+
+
+class WebhookProcessingTests(TestCase):
+    """
+    A batch confirms each pending deposit at most once, and only when the
+    event matches its amount and currency.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+        cls.payment = pending_deposit(cls.alice, Decimal('50.00'), 'PAY_1')
+
+    def _receive(self, *payloads):
+        WebhookEvent.objects.bulk_create([
+            WebhookEvent(provider='Paystack', reference=p['data']['reference'],
+                         payload=p)
+            for p in payloads
+        ])
+
+    def _process(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return process_webhook_batch()
+
+    def _wallet(self):
+        return Wallet.objects.get(pk=self.alice.wallet.pk)
+
+    def _assert_not_credited(self):
+        wallet = self._wallet()
+        self.assertEqual(wallet.balance, Decimal('0.00'))
+        self.assertEqual(wallet.pending_balance, Decimal('50.00'))
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).status, 'PENDING')
+        self.assertFalse(LedgerEntry.objects.exists())
+
+    def test_success_credits_ledgers_and_releases_hold_in_one_pass(self):
+        self._receive(charge_success('PAY_1', 5000))
+        self.assertEqual(self._process(), 1)
+
+        wallet = self._wallet()
+        self.assertEqual(wallet.balance, Decimal('50.00'))
+        self.assertEqual(wallet.pending_balance, Decimal('0.00'))
+        payment = Payment.objects.select_related('transaction').get(
+            pk=self.payment.pk)
+        self.assertEqual(payment.status, 'CONFIRMED')
+        self.assertEqual(payment.provider_reference, '1')
+        self.assertEqual(payment.transaction.status, 'COMPLETED')
+        entry = LedgerEntry.objects.get()
+        self.assertEqual(
+            (entry.entry_type, entry.amount, entry.balance_before,
+             entry.balance_after, entry.transaction_id),
+            ('CREDIT', Decimal('50.00'), Decimal('0.00'), Decimal('50.00'),
+             payment.transaction_id))
+        self.assertEqual(WebhookEvent.objects.get().status, 'PROCESSED')
+
+    def test_wallet_streams_get_deposit_and_balance(self):
+        self._receive(charge_success('PAY_1', 5000))
+        with mock.patch('wallets.events.get_backend') as get_backend:
+            self._process()
+
+        (events,), _ = get_backend.return_value.publish.call_args
+        deposit = Payment.objects.select_related('transaction').get(
+            pk=self.payment.pk).transaction
+        self.assertEqual([(e.wallet_id, e.type) for e in events],
+                         [(self.alice.wallet.pk, 'transaction'),
+                          (self.alice.wallet.pk, 'balance')])
+        self.assertEqual(events[0].data['reference'], deposit.reference)
+        self.assertEqual(events[0].data['status'], 'COMPLETED')
+        self.assertEqual((events[1].data['available_balance'],
+                          events[1].data['reference']),
+                         ('50.00', deposit.reference))
+
+    def test_duplicate_deliveries_credit_once(self):
+        # Twice in one batch, then again in a later batch
+        self._receive(charge_success('PAY_1', 5000),
+                      charge_success('PAY_1', 5000))
+        self.assertEqual(self._process(), 2)
+        self._receive(charge_success('PAY_1', 5000))
+        self.assertEqual(self._process(), 1)
+
+        self.assertEqual(
+            list(WebhookEvent.objects.values_list('status', flat=True)),
+            ['PROCESSED', 'DUPLICATE', 'DUPLICATE'])
+        self.assertEqual(self._wallet().balance, Decimal('50.00'))
+        self.assertEqual(LedgerEntry.objects.count(), 1)
+
+    def test_only_an_explicit_failure_fails_the_payment(self):
+        self._receive({'event': 'charge.dispute.create',
+                       'data': {'reference': 'PAY_1', 'status': 'pending'}})
+        self._process()
+
+        event = WebhookEvent.objects.get()
+        self.assertEqual(event.status, 'IGNORED')
+        self.assertIn('charge.dispute.create', event.error)
+        self._assert_not_credited()
+
+        self._receive({'event': 'charge.failed',
+                       'data': {'reference': 'PAY_1', 'status': 'failed'}})
+        self._process()
+
+        payment = Payment.objects.select_related('transaction').get(
+            pk=self.payment.pk)
+        self.assertEqual((payment.status, payment.transaction.status),
+                         ('FAILED', 'FAILED'))
+        self.assertEqual(self._wallet().pending_balance, Decimal('0.00'))
+
+    def test_success_for_a_lapsed_payment_is_flagged(self):
+        for status in ('EXPIRED', 'FAILED'):
+            Payment.objects.filter(pk=self.payment.pk).update(status=status)
+            self._receive(charge_success('PAY_1', 5000))
+            self._process()
+
+            event = WebhookEvent.objects.latest('id')
+            self.assertEqual(event.status, 'FAILED')
+            self.assertEqual(event.error,
+                             f'Successful charge for a {status} payment')
+        self.assertEqual(self._wallet().balance, Decimal('0.00'))
+        self.assertFalse(LedgerEntry.objects.exists())
+
+    def test_amount_mismatch_does_not_credit(self):
+        self._receive(charge_success('PAY_1', 500000))
+        self._process()
+
+        event = WebhookEvent.objects.get()
+        self.assertEqual(event.status, 'FAILED')
+        self.assertIn('Amount mismatch', event.error)
+        self._assert_not_credited()
+
+    def test_currency_mismatch_does_not_credit(self):
+        self._receive(charge_success('PAY_1', 5000, currency='USD'))
+        self._process()
+
+        event = WebhookEvent.objects.get()
+        self.assertEqual(event.status, 'FAILED')
+        self.assertIn('Currency mismatch', event.error)
+        self._assert_not_credited()
+
+
+class ConcurrentWebhookProcessingTests(TransactionTestCase):
+    """Workers draining the inbox side by side never share an event"""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(name, f'{name}@example.com', 'pass1234')
+            for name in ('alice', 'bob')
+        ]
+        for n in range(8):
+            user = self.users[n % 2]
+            pending_deposit(user, Decimal('10.00'), f'PAY_{n}')
+            WebhookEvent.objects.create(
+                provider='Paystack', reference=f'PAY_{n}',
+                payload=charge_success(f'PAY_{n}', 1000, charge_id=n))
+
+    @staticmethod
+    def _drain(batch_size):
+        try:
+            handled = 0
+            while count := process_webhook_batch(batch_size):
+                handled += count
+            return handled
+        finally:
+            connection.close()
+
+    @override_settings(WALLET_LOCK_MAX_RETRIES=50)
+    def test_parallel_workers_process_each_event_once(self):
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            handled = list(pool.map(self._drain, [2] * 4))
+
+        self.assertEqual(sum(handled), 8)
+        self.assertEqual(
+            set(WebhookEvent.objects.values_list('status', flat=True)),
+            {'PROCESSED'})
+        self.assertEqual(LedgerEntry.objects.count(), 8)
+        for wallet in Wallet.objects.all():
+            self.assertEqual(wallet.balance, Decimal('40.00'))
+            self.assertEqual(wallet.pending_balance, Decimal('0.00'))
+
+    @skipUnlessDBFeature('has_select_for_update_skip_locked')
+    def test_events_claimed_by_another_worker_are_skipped(self):
+        with transaction.atomic():
+            claimed = list(
+                WebhookEvent.objects.select_for_update(skip_locked=True)
+                .order_by('id')[:3])
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                handled = pool.submit(self._drain, 100).result()
+
+        self.assertEqual(handled, 5)
+        untouched = WebhookEvent.objects.filter(status='RECEIVED')
+        self.assertEqual({event.pk for event in untouched},
+                         {event.pk for event in claimed})
+
+
+class ExpirePaymentsTests(TestCase):
+    """
+    The sweeper expires overdue PENDING payments only and releases their
+    holds; --dry-run reports the same set without touching it.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+        now = timezone.now()
+        for reference, amount, expires_at in (
+                ('PAY_OVERDUE_1', '10.00', now - timedelta(hours=1)),
+                ('PAY_OVERDUE_2', '15.00', now - timedelta(minutes=1)),
+                ('PAY_LIVE', '20.00', now + timedelta(hours=1)),
+                ('PAY_NO_EXPIRY', '5.00', None),
+                ('PAY_CONFIRMED', '7.00', now - timedelta(hours=1))):
+            pending_deposit(cls.alice, Decimal(amount), reference, expires_at)
+        # A confirmed payment holds nothing and must not expire
+        Payment.objects.filter(reference='PAY_CONFIRMED').update(status='CONFIRMED')
+        Wallet.objects.filter(pk=cls.alice.wallet.pk).update(
+            pending_balance=Decimal('50.00'))
+
+    def _expire(self, *args):
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('expire_payments', *args, stdout=out)
+        return out.getvalue()
+
+    def _statuses(self):
+        return dict(Payment.objects.values_list('reference', 'status'))
+
+    def _pending_balance(self):
+        return Wallet.objects.get(pk=self.alice.wallet.pk).pending_balance
+
+    def test_dry_run_reports_and_changes_nothing(self):
+        statuses = self._statuses()
+
+        output = self._expire('--dry-run')
+
+        self.assertIn('2 payment(s) across 1 wallet(s) would expire, '
+                      'releasing 25.00', output)
+        self.assertEqual(self._statuses(), statuses)
+        self.assertEqual(self._pending_balance(), Decimal('50.00'))
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_only_overdue_pending_payments_expire(self):
+        output = self._expire('--batch-size', '1')
+
+        self.assertIn('Expired 2 payment(s) in 2 batch(es), released 25.00',
+                      output)
+        self.assertEqual(self._statuses(), {
+            'PAY_OVERDUE_1': 'EXPIRED',
+            'PAY_OVERDUE_2': 'EXPIRED',
+            'PAY_LIVE': 'PENDING',
+            'PAY_NO_EXPIRY': 'PENDING',
+            'PAY_CONFIRMED': 'CONFIRMED',
+        })
+        self.assertEqual(
+            set(Transaction.objects.filter(status='FAILED')
+                .values_list('payment__reference', flat=True)),
+            {'PAY_OVERDUE_1', 'PAY_OVERDUE_2'})
+        self.assertEqual(self._pending_balance(), Decimal('25.00'))
+        self.assertEqual(OutboxEvent.objects.count(), 2)
+
+        # A second sweep finds nothing left to expire
+        self.assertIn('Expired 0 payment(s)', self._expire())
@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import WebhookView
+
+urlpatterns = [
+    path('webhooks/<str:provider>/', WebhookView.as_view(), name='payment-webhook'),
+]
@@ -1,3 +1,56 @@
-from django.shortcuts import render
+import json
 
-# Create your views here.
+from rest_framework import status
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .models import WebhookEvent
+from .webhooks import get_provider
+
+
+class WebhookView(APIView):
+    """
+    Receive payment gateway callbacks
+
+    The signature is verified against the raw body and the event is
+    appended to the webhook inbox with a single INSERT. Confirming payments
+    and crediting wallets happens later in the process_webhooks worker, so
+    the gateway is acknowledged immediately.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request, provider):
+        gateway = get_provider(provider)
+        if gateway is None:
+            return Response({
+                'error': 'UNKNOWN_PROVIDER',
+                'message': f"Unsupported payment provider '{provider}'"
+            }, status=status.HTTP_404_NOT_FOUND)
+
+        body = request.body
+        if not gateway.verify(body, request.headers):
+            return Response({
+                'error': 'INVALID_SIGNATURE',
+                'message': 'Webhook signature verification failed'
+            }, status=status.HTTP_401_UNAUTHORIZED)
+
+        try:
+            payload = json.loads(body)
+            parsed = gateway.parse(payload)
+        except (ValueError, AttributeError):
+            return Response({
+                'error': 'INVALID_PAYLOAD',
+                'message': 'Webhook body is not a valid event'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        WebhookEvent.objects.create(
+            provider=gateway.name,
+            event=parsed.event[:100],
+            reference=parsed.reference[:100],
+            provider_reference=parsed.provider_reference,
+            payload=payload
+        )
+
+        return Response({'status': 'received'}, status=status.HTTP_200_OK)
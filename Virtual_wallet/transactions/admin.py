@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Transaction
+from .models import DailyTransactionRollup, Transaction
 
 
 @admin.register(Transaction)
@@ -9,3 +9,13 @@ class TransactionAdmin(admin.ModelAdmin):
     list_filter = ['transaction_type', 'status', 'created_at']
     search_fields = ['reference', 'wallet__user__username']
     readonly_fields = ['id', 'reference', 'created_at', 'updated_at']
+
+
+@admin.register(DailyTransactionRollup)
+class DailyTransactionRollupAdmin(admin.ModelAdmin):
+    list_display = ['wallet', 'day', 'transaction_type', 'currency',
+                    'count', 'total']
+    list_filter = ['transaction_type', 'day']
+    search_fields = ['wallet__user__username']
+    readonly_fields = ['wallet', 'day', 'transaction_type', 'currency',
+                       'count', 'total', 'updated_at']
@@ -0,0 +1,26 @@
+from rest_framework.request import Request
+
+from config.async_api import AsyncAPIView
+from .pagination import TransactionCursorPagination
+from .serializers import TransactionSerializer
+from .views import history_queryset
+
+
+class TransactionListView(AsyncAPIView):
+    """
+    Async twin of transactions.views.TransactionListView
+
+    Same filters, page sizes and cursors, so a cursor from either endpoint
+    can be followed on the other.
+    """
+
+    async def get(self, request):
+        # The paginator reads query_params and builds links off a DRF
+        # request; its user is left alone, authentication already happened
+        params_request = Request(request)
+        paginator = TransactionCursorPagination()
+        page = await paginator.apaginate_queryset(
+            history_queryset(request.user.wallet, params_request.query_params),
+            params_request)
+        return self.respond(paginator.get_paginated_data(
+            TransactionSerializer(page, many=True).data))
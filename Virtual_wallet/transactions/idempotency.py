@@ -0,0 +1,92 @@
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+
+from .models import Transaction
+from ledger.models import LedgerEntry
+
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 200
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+class KeyReused(Exception):
+    """Raised when an idempotency key is replayed with a different request body"""
+
+
+def scoped_key(user, key):
+    """Idempotency keys are per user; store them prefixed with the user id"""
+    return f'{user.pk}:{key}'
+
+
+def fingerprint(data):
+    """
+    SHA-256 of the request body as canonical JSON: key order and
+    whitespace do not matter, any change to a value does.
+    """
+    canonical = json.dumps(dict(data.items()), sort_keys=True,
+                           separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _cache_key(scoped):
+    # v2 entries hold the request fingerprint next to the response
+    return f'idempotency:v2:{scoped}'
+
+
+def _check(stored, request_fingerprint):
+    # Rows stored before fingerprints were recorded have none to compare
+    if stored and stored != request_fingerprint:
+        raise KeyReused(
+            f'{HEADER} was already used for a different request')
+
+
+def remember(scoped, request_fingerprint, payload):
+    """Cache the response of a transfer once its transaction commits"""
+    db_transaction.on_commit(lambda: cache.set(
+        _cache_key(scoped),
+        {'fingerprint': request_fingerprint, 'response': payload},
+        CACHE_TIMEOUT))
+
+
+def replay(scoped, request_fingerprint, serializer_class):
+    """
+    Return the stored response for an idempotency key, or None.
+
+    The cache is checked first; on a miss the completed transfer is found
+    through the unique idempotency_key index and its response rebuilt from
+    the transaction and its debit ledger entry. No wallet is touched.
+    Raises KeyReused if the key was stored with a different request body.
+    """
+    stored = cache.get(_cache_key(scoped))
+    if stored is not None:
+        _check(stored['fingerprint'], request_fingerprint)
+        return stored['response']
+
+    transfer_out = (Transaction.objects.for_api()
+                    .filter(idempotency_key=scoped).first())
+    if transfer_out is None:
+        return None
+    _check(transfer_out.idempotency_fingerprint, request_fingerprint)
+
+    balances = (LedgerEntry.objects
+                .filter(transaction=transfer_out, entry_type='DEBIT')
+                .values_list('balance_before', 'balance_after')
+                .first())
+    payload = {
+        'transaction': serializer_class(transfer_out).data,
+        'balance_update': {
+            'previous_balance': str(balances[0]) if balances else None,
+            'new_balance': str(balances[1]) if balances else None,
+            'currency': transfer_out.currency
+        },
+        'message': 'Transfer successful'
+    }
+    cache.set(_cache_key(scoped),
+              {'fingerprint': transfer_out.idempotency_fingerprint,
+               'response': payload},
+              CACHE_TIMEOUT)
+    return payload
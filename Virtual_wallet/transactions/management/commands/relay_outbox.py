@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from transactions import outbox
+
+
+class Command(BaseCommand):
+    help = 'Publish outbox events in order to a sink, checkpointing progress'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sink', default='stdout',
+                            help="'stdout', 'file', 'queue' or a dotted path "
+                                 "to a sink class")
+        parser.add_argument('--path', default=None,
+                            help='Output file for the file sink')
+        parser.add_argument('--name', default=None,
+                            help='Checkpoint name, default the sink name; '
+                                 'each name receives every event')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Events published per batch')
+        parser.add_argument('--settle-seconds', type=float, default=10,
+                            help='Minimum event age; must exceed the longest '
+                                 'money movement transaction')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to sleep when caught up')
+        parser.add_argument('--retain-days', type=int, default=None,
+                            help='Delete events older than this once every '
+                                 'relay has delivered them')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once caught up')
+
+    def handle(self, *args, **options):
+        try:
+            sink = outbox.get_sink(options['sink'], path=options['path'])
+        except (ImportError, ValueError) as exc:
+            raise CommandError(f"Cannot use sink '{options['sink']}': {exc}")
+        name = options['name'] or options['sink']
+        # Events go to stdout with the stdout sink, so report on stderr
+        report = self.stderr if options['sink'] == 'stdout' else self.stdout
+
+        published = 0
+        while True:
+            count = outbox.relay(
+                name, sink, batch_size=options['batch_size'],
+                settle_seconds=options['settle_seconds'])
+            published += count
+            if count:
+                continue
+            if options['retain_days'] is not None:
+                outbox.prune(options['retain_days'])
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+
+        report.write(self.style.SUCCESS(
+            f"Published {published} event(s) to '{name}'"))
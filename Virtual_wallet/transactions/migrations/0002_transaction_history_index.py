@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['wallet', '-created_at', 'id'], name='transaction_wallet_hist_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:29
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallets', '0003_time_ordered_ids'),
+        ('transactions', '0003_time_ordered_ids'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyTransactionRollup',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('transaction_type', models.CharField(choices=[('DEPOSIT', 'Deposit'), ('WITHDRAWAL', 'Withdrawal'), ('TRANSFER_OUT', 'Transfer Out'), ('TRANSFER_IN', 'Transfer In'), ('REVERSAL', 'Reversal')], max_length=15)),
+                ('currency', models.CharField(max_length=3)),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=18)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='wallets.wallet')),
+            ],
+            options={
+                'verbose_name': 'Daily Transaction Rollup',
+                'verbose_name_plural': 'Daily Transaction Rollups',
+                'db_table': 'transaction_daily_rollups',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailytransactionrollup',
+            constraint=models.UniqueConstraint(fields=('wallet', 'day', 'transaction_type', 'currency'), name='unique_wallet_daily_rollup'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations, models
+
+
+OLD_INDEX = models.Index(fields=['wallet', '-created_at', 'id'],
+                         name='transaction_wallet_hist_idx')
+NEW_INDEX = models.Index(fields=['wallet', '-created_at', '-id'],
+                         name='transaction_wallet_keyset_idx')
+
+
+def _swap(apps, schema_editor, old, new):
+    """
+    Build new before dropping old, so history reads always have an index.
+    On PostgreSQL both run CONCURRENTLY and never block transaction writes.
+    """
+    model = apps.get_model('transactions', 'Transaction')
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.add_index(model, new, concurrently=True)
+        schema_editor.remove_index(model, old, concurrently=True)
+    else:
+        schema_editor.add_index(model, new)
+        schema_editor.remove_index(model, old)
+
+
+def forwards(apps, schema_editor):
+    _swap(apps, schema_editor, OLD_INDEX, NEW_INDEX)
+
+
+def backwards(apps, schema_editor):
+    _swap(apps, schema_editor, NEW_INDEX, OLD_INDEX)
+
+
+class Migration(migrations.Migration):
+    # CREATE / DROP INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('transactions', '0005_outbox'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(forwards, backwards)],
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='transaction', name='transaction_wallet_hist_idx'),
+                migrations.AddIndex(model_name='transaction', index=NEW_INDEX),
+            ],
+        ),
+    ]
@@ -3,7 +3,36 @@ from django.contrib.auth.models import User
 from wallets.models import Wallet
 from django.core.validators import MinValueValidator
 from decimal import Decimal
-import uuid
+from config.ids import sortable_reference, uuid7
+
+
+def generate_reference(transaction_type, uid=None):
+    """
+    Build a unique, time-ordered reference for a transaction of the given
+    type, from uid (a UUIDv7) when given
+    """
+    prefix = transaction_type[:3].upper()
+    return sortable_reference(f"TXN_{prefix}_", uid)
+
+
+class TransactionQuerySet(models.QuerySet):
+    # Columns read by TransactionSerializer
+    API_FIELDS = (
+        'id', 'reference', 'transaction_type', 'amount', 'currency', 'status',
+        'description', 'recipient_account', 'recipient_bank',
+        'payment_reference', 'initiated_at', 'completed_at', 'created_at',
+        'wallet__user__username', 'recipient_wallet__user__username',
+    )
+
+    def for_api(self):
+        """
+        Join the wallet -> user and recipient_wallet -> user chains and load
+        only the serialized columns, so rendering a page of transactions is
+        a single query regardless of its size.
+        """
+        return self.select_related(
+            'wallet__user', 'recipient_wallet__user'
+        ).only(*self.API_FIELDS)
 
 
 class Transaction(models.Model):
@@ -26,7 +55,7 @@ class Transaction(models.Model):
         ('REVERSED', 'Reversed'),
     ]
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     reference = models.CharField(max_length=100, unique=True, db_index=True)
     wallet = models.ForeignKey(
         Wallet, on_delete=models.CASCADE, related_name='transactions')
@@ -61,6 +90,9 @@ class Transaction(models.Model):
     # Idempotency
     idempotency_key = models.CharField(
         max_length=255, unique=True, blank=True, null=True)
+    # SHA-256 of the request body the key was first used with
+    idempotency_fingerprint = models.CharField(
+        max_length=64, blank=True, null=True)
 
     # Metadata
     metadata = models.JSONField(blank=True, null=True)
@@ -71,15 +103,15 @@ class Transaction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = TransactionQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.reference} - {self.transaction_type} - {self.currency} {self.amount}"
 
     def save(self, *args, **kwargs):
         if not self.reference:
             # Auto-generate reference
-            prefix = self.transaction_type[:3].upper()
-            import time
-            self.reference = f"TXN_{prefix}_{int(time.time())}{str(uuid.uuid4())[:8]}"
+            self.reference = generate_reference(self.transaction_type)
         super().save(*args, **kwargs)
 
     class Meta:
@@ -92,4 +124,79 @@ class Transaction(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['transaction_type']),
             models.Index(fields=['-created_at']),
+            # History keyset: WHERE wallet = ? AND (created_at, id) < (?, ?)
+            models.Index(fields=['wallet', '-created_at', '-id'],
+                         name='transaction_wallet_keyset_idx'),
         ]
+
+
+class DailyTransactionRollup(models.Model):
+    """
+    Count and total of a wallet's completed transactions of one type, per
+    currency and day (the day they completed).
+
+    Kept current at write time by transactions.rollups.record, so summaries
+    read a handful of rows instead of aggregating Transaction history.
+    """
+    id = models.BigAutoField(primary_key=True)
+    wallet = models.ForeignKey(
+        Wallet, on_delete=models.CASCADE, related_name='daily_rollups')
+    transaction_type = models.CharField(
+        max_length=15, choices=Transaction.TRANSACTION_TYPES)
+    currency = models.CharField(max_length=3)
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+    total = models.DecimalField(
+        max_digits=18, decimal_places=2, default=Decimal('0.00'))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.wallet_id} - {self.day} - {self.transaction_type}: {self.count} / {self.total}"
+
+    class Meta:
+        db_table = 'transaction_daily_rollups'
+        verbose_name = 'Daily Transaction Rollup'
+        verbose_name_plural = 'Daily Transaction Rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['wallet', 'day', 'transaction_type', 'currency'],
+                name='unique_wallet_daily_rollup'),
+        ]
+
+
+class OutboxEvent(models.Model):
+    """
+    Transactional outbox: an event about a money movement, written in the
+    same DB transaction as the movement itself.
+
+    relay_outbox publishes events in id order to downstream consumers, so
+    they do not poll the transaction tables.
+    """
+    id = models.BigAutoField(primary_key=True)
+    topic = models.CharField(max_length=50)
+    # Partitioning key for consumers, normally the wallet id
+    key = models.CharField(max_length=64)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.id} {self.topic} {self.key}"
+
+    class Meta:
+        db_table = 'transaction_outbox'
+        verbose_name = 'Outbox Event'
+        verbose_name_plural = 'Outbox Events'
+        ordering = ['id']
+
+
+class OutboxCheckpoint(models.Model):
+    """Last outbox event a named relay has delivered"""
+    name = models.CharField(max_length=100, primary_key=True)
+    last_event_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_event_id}"
+
+    class Meta:
+        db_table = 'transaction_outbox_checkpoints'
@@ -0,0 +1,173 @@
+"""
+Transactional outbox for money movement events.
+
+Writers add events with emit() in the DB transaction that moves the money,
+so an event exists if and only if the movement committed. relay() reads
+them back in id order and hands each batch to a sink; the relay's
+checkpoint only advances once the sink accepted the batch, so delivery is
+at-least-once and consumers should de-duplicate on the event id.
+"""
+import json
+import os
+import queue
+import sys
+from datetime import timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import OutboxCheckpoint, OutboxEvent
+
+
+BULK_CREATE_BATCH_SIZE = 500
+
+# Topics
+TRANSFER_COMPLETED = 'transfer.completed'
+DEPOSIT_CONFIRMED = 'deposit.confirmed'
+DEPOSIT_FAILED = 'deposit.failed'
+PAYMENT_EXPIRED = 'payment.expired'
+
+
+def event(topic, key, payload):
+    """An unsaved OutboxEvent; payload may hold Decimals, UUIDs and dates"""
+    return OutboxEvent(
+        topic=topic, key=str(key),
+        payload=json.loads(json.dumps(payload, cls=DjangoJSONEncoder)))
+
+
+def emit(events):
+    """Write events in one INSERT; call inside the movement's transaction"""
+    return OutboxEvent.objects.bulk_create(
+        events, batch_size=BULK_CREATE_BATCH_SIZE)
+
+
+def transfer_completed(transfer_out, transfer_in):
+    return event(TRANSFER_COMPLETED, transfer_out.wallet_id, {
+        'reference': transfer_out.reference,
+        'counterpart': transfer_in.reference,
+        'sender_wallet_id': transfer_out.wallet_id,
+        'recipient_wallet_id': transfer_in.wallet_id,
+        'amount': transfer_out.amount,
+        'currency': transfer_out.currency,
+        'completed_at': transfer_out.completed_at,
+    })
+
+
+def payment_event(topic, payment, **extra):
+    return event(topic, payment.wallet_id, {
+        'reference': payment.reference,
+        'wallet_id': payment.wallet_id,
+        'amount': payment.amount,
+        **extra,
+    })
+
+
+def serialize(outbox_event):
+    return {
+        'id': outbox_event.id,
+        'topic': outbox_event.topic,
+        'key': outbox_event.key,
+        'payload': outbox_event.payload,
+        'created_at': outbox_event.created_at.isoformat(),
+    }
+
+
+class StdoutSink:
+    """Writes each event as one JSON line to stdout"""
+
+    def __init__(self, stream=None, **options):
+        self.stream = stream or sys.stdout
+
+    def publish(self, events):
+        self.stream.write(
+            ''.join(json.dumps(e) + '\n' for e in events))
+        self.stream.flush()
+
+
+class FileSink:
+    """Appends events as JSON lines to a file, synced before checkpointing"""
+
+    def __init__(self, path=None, **options):
+        if not path:
+            raise ValueError('The file sink needs a path')
+        self.path = path
+
+    def publish(self, events):
+        with open(self.path, 'a') as sink_file:
+            sink_file.write(''.join(json.dumps(e) + '\n' for e in events))
+            sink_file.flush()
+            os.fsync(sink_file.fileno())
+
+
+class QueueSink:
+    """Puts events on an in-process queue; meant for tests"""
+    queue = queue.Queue()
+
+    def __init__(self, **options):
+        pass
+
+    def publish(self, events):
+        for outbox_event in events:
+            self.queue.put(outbox_event)
+
+
+SINKS = {
+    'stdout': StdoutSink,
+    'file': FileSink,
+    'queue': QueueSink,
+}
+
+
+def get_sink(name, **options):
+    """A sink by short name, or by dotted path to a class with publish()"""
+    sink_class = SINKS.get(name) or import_string(name)
+    return sink_class(**options)
+
+
+def relay(name, sink, batch_size=500, settle_seconds=10):
+    """
+    Publish the next batch of events for the relay called name.
+
+    The batch stops at the first event younger than settle_seconds, even
+    if older events follow it: ids are assigned at insert time, so a
+    transaction still in flight may commit a lower id than one already
+    visible, and the checkpoint must not move past it. The checkpoint row
+    is locked while publishing, so two relays with the same name never
+    deliver the same batch concurrently.
+
+    Returns the number of events published.
+    """
+    OutboxCheckpoint.objects.get_or_create(name=name)
+    with transaction.atomic():
+        checkpoint = OutboxCheckpoint.objects.select_for_update().get(name=name)
+        settled = timezone.now() - timedelta(seconds=settle_seconds)
+        events = []
+        for outbox_event in (OutboxEvent.objects
+                             .filter(id__gt=checkpoint.last_event_id)
+                             .order_by('id')[:batch_size]):
+            if outbox_event.created_at > settled:
+                break
+            events.append(outbox_event)
+        if not events:
+            return 0
+
+        sink.publish([serialize(e) for e in events])
+        checkpoint.last_event_id = events[-1].id
+        checkpoint.save(update_fields=['last_event_id', 'updated_at'])
+    return len(events)
+
+
+def prune(older_than_days):
+    """
+    Delete events every relay has delivered and that are older than
+    older_than_days. Returns the number deleted.
+    """
+    checkpoints = OutboxCheckpoint.objects.values_list('last_event_id', flat=True)
+    if not checkpoints:
+        return 0
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    deleted, _ = OutboxEvent.objects.filter(
+        id__lte=min(checkpoints), created_at__lt=cutoff).delete()
+    return deleted
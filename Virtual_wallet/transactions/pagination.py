@@ -0,0 +1,149 @@
+from base64 import b64decode, b64encode
+from collections import namedtuple
+from urllib.parse import parse_qs, urlencode
+from uuid import UUID
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+# A position in history: the (created_at, id) of a row. reverse marks a
+# cursor that walks back towards newer rows (a "previous" link).
+Cursor = namedtuple('Cursor', ['created_at', 'id', 'reverse'])
+
+
+class TransactionCursorPagination(BasePagination):
+    """
+    Keyset pagination over (created_at, id) for transaction history, newest
+    first.
+
+    The cursor carries the (created_at, id) of the row a page ends on, and
+    the next page is the rows with (created_at, id) < that position. Rows
+    sharing a timestamp are told apart by id instead of an OFFSET, no
+    COUNT(*) is issued, and rows inserted meanwhile never shift a page, so
+    deep pages cost the same as the first one. Backed by the
+    (wallet, -created_at, -id) index on Transaction.
+
+    Sync views call paginate_queryset, async views apaginate_queryset; both
+    build the same one-query window and share the paging logic.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        window = self._window(queryset, request)
+        if window is None:
+            return None
+        return self._paginate(list(window))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        window = self._window(queryset, request)
+        if window is None:
+            return None
+        return self._paginate([item async for item in window])
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def _window(self, queryset, request):
+        """The sliced queryset holding the page plus one row, unevaluated"""
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+
+        if self.cursor is None:
+            return queryset.order_by('-created_at', '-id')[:self.page_size + 1]
+
+        created_at, pk = self.cursor.created_at, self.cursor.id
+        if self.cursor.reverse:
+            # (created_at, id) > position, nearest first
+            queryset = queryset.filter(
+                Q(created_at__gt=created_at)
+                | Q(created_at=created_at, id__gt=pk)
+            ).order_by('created_at', 'id')
+        else:
+            # (created_at, id) < position
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at)
+                | Q(created_at=created_at, id__lt=pk)
+            ).order_by('-created_at', '-id')
+        return queryset[:self.page_size + 1]
+
+    def _paginate(self, rows):
+        self.page = rows[:self.page_size]
+        more = len(rows) > self.page_size
+        if self.cursor is not None and self.cursor.reverse:
+            self.page.reverse()
+            # The page that linked here starts at the cursor's row
+            self.has_next, self.has_previous = True, more
+        else:
+            self.has_next, self.has_previous = more, self.cursor is not None
+        return self.page
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            fields = parse_qs(b64decode(encoded.encode('ascii')).decode('ascii'),
+                              strict_parsing=True)
+            created_at = parse_datetime(fields['t'][0])
+            cursor = Cursor(created_at, UUID(fields['i'][0]),
+                            fields.get('r', ['0'])[0] == '1')
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, cursor):
+        fields = {'t': cursor.created_at.isoformat(), 'i': str(cursor.id)}
+        if cursor.reverse:
+            fields['r'] = '1'
+        encoded = b64encode(urlencode(fields).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not (self.has_next and self.page):
+            return None
+        last = self.page[-1]
+        return self.encode_cursor(Cursor(last.created_at, last.pk, False))
+
+    def get_previous_link(self):
+        if not (self.has_previous and self.page):
+            return None
+        first = self.page[0]
+        return self.encode_cursor(Cursor(first.created_at, first.pk, True))
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,90 @@
+"""
+Incremental daily transaction rollups.
+"""
+import operator
+from collections import defaultdict, namedtuple
+from decimal import Decimal
+from functools import reduce
+
+from django.db.models import Case, DecimalField, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from .models import DailyTransactionRollup
+
+
+# One completed money movement, as far as the rollups are concerned
+Movement = namedtuple(
+    'Movement',
+    ['wallet_id', 'transaction_type', 'currency', 'completed_at', 'amount']
+)
+
+# Rollup rows updated per statement; keeps the OR / CASE lists within
+# database parameter and expression depth limits for bulk transfers
+KEYS_PER_UPDATE = 100
+
+# Rollup types that bring money into / take money out of a wallet
+INFLOW_TYPES = ('DEPOSIT', 'TRANSFER_IN')
+OUTFLOW_TYPES = ('WITHDRAWAL', 'TRANSFER_OUT')
+
+
+def movement(transaction):
+    """The Movement of a completed Transaction instance"""
+    return Movement(transaction.wallet_id, transaction.transaction_type,
+                    transaction.currency, transaction.completed_at,
+                    transaction.amount)
+
+
+def record(movements):
+    """
+    Add completed movements to their daily rollups.
+
+    Missing rollup rows are inserted empty (INSERT ... ON CONFLICT DO
+    NOTHING), then every touched row is incremented by one grouped UPDATE,
+    so a transfer costs two statements (more only past KEYS_PER_UPDATE
+    distinct rows).
+
+    Must run in the transaction that moved the money, after its wallets
+    were locked; that lock also serialises writers of the same rollup rows.
+    """
+    groups = defaultdict(lambda: [0, Decimal('0.00')])
+    for item in movements:
+        key = (item.wallet_id, timezone.localdate(item.completed_at),
+               item.transaction_type, item.currency)
+        groups[key][0] += 1
+        groups[key][1] += item.amount
+    if not groups:
+        return
+
+    DailyTransactionRollup.objects.bulk_create([
+        DailyTransactionRollup(wallet_id=wallet_id, day=day,
+                               transaction_type=transaction_type,
+                               currency=currency)
+        for wallet_id, day, transaction_type, currency in groups
+    ], batch_size=500, ignore_conflicts=True)
+
+    keys = sorted(groups)
+    for offset in range(0, len(keys), KEYS_PER_UPDATE):
+        _increment({key: groups[key]
+                    for key in keys[offset:offset + KEYS_PER_UPDATE]})
+
+
+def _increment(groups):
+    matches = {
+        key: Q(wallet_id=key[0], day=key[1], transaction_type=key[2],
+               currency=key[3])
+        for key in groups
+    }
+    DailyTransactionRollup.objects.filter(
+        reduce(operator.or_, matches.values())
+    ).update(
+        count=F('count') + Case(
+            *[When(match, then=Value(groups[key][0]))
+              for key, match in matches.items()],
+            default=Value(0), output_field=IntegerField()),
+        total=F('total') + Case(
+            *[When(match, then=Value(groups[key][1]))
+              for key, match in matches.items()],
+            default=Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=18, decimal_places=2)),
+        updated_at=timezone.now(),
+    )
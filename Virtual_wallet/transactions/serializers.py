@@ -1,3 +1,5 @@
+from decimal import Decimal
+
 from wallets.models import Wallet
 from rest_framework import serializers
 from .models import Transaction
@@ -25,21 +27,21 @@ class TransactionSerializer(serializers.ModelSerializer):
 class TransferSerializer(serializers.Serializer):
     recipient_username = serializers.CharField(max_length=150)
     amount = serializers.DecimalField(
-        max_digits=15, decimal_places=2, min_value=0.01)
+        max_digits=15, decimal_places=2, min_value=Decimal('0.01'))
     description = serializers.CharField(
         max_length=255, required=False, allow_blank=True)
     transaction_pin = serializers.CharField(
         max_length=4, write_only=True, required=False)
 
     def validate_recipient_username(self, value):
-        """Check if recipient exists"""
+        """Check the recipient exists and resolve their wallet in one query"""
         try:
-            user = User.objects.get(username=value)
-            # Check if user has a wallet
-            if not hasattr(user, 'wallet'):
+            self._recipient_wallet = Wallet.objects.select_related(
+                'user').get(user__username=value)
+        except Wallet.DoesNotExist:
+            if User.objects.filter(username=value).exists():
                 raise serializers.ValidationError(
                     "Recipient does not have a wallet")
-        except User.DoesNotExist:
             raise serializers.ValidationError(f"User '{value}' not found")
         return value
 
@@ -58,4 +60,23 @@ class TransferSerializer(serializers.Serializer):
                 'amount': f"Insufficient balance. Available: ₦{sender_wallet.balance:,.2f}"
             })
 
+        # Hand the resolved wallet to the view so it is not looked up again
+        data['recipient_wallet'] = self._recipient_wallet
         return data
+
+
+class BulkTransferItemSerializer(serializers.Serializer):
+    recipient_username = serializers.CharField(max_length=150)
+    amount = serializers.DecimalField(
+        max_digits=15, decimal_places=2, min_value=Decimal('0.01'))
+    description = serializers.CharField(
+        max_length=255, required=False, allow_blank=True)
+
+
+class BulkTransferSerializer(serializers.Serializer):
+    MAX_ITEMS = 5000
+
+    transfers = BulkTransferItemSerializer(
+        many=True, allow_empty=False, max_length=MAX_ITEMS)
+    transaction_pin = serializers.CharField(
+        max_length=4, write_only=True, required=False)
@@ -0,0 +1,188 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Q
+from django.utils import timezone
+
+from . import outbox, rollups
+from .models import Transaction, generate_reference
+from .serializers import TransactionSerializer
+from wallets import events as wallet_events
+from wallets.models import DailyLimitExceeded, Wallet
+from wallets.services import consume_daily_limit, lock_wallets
+from ledger import services as ledger
+from ledger.models import LedgerEntry
+
+
+BULK_CREATE_BATCH_SIZE = 500
+
+
+class BulkTransferError(Exception):
+    """Raised when a bulk transfer has to be rejected as a whole"""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def execute_bulk_transfer(sender, items):
+    """
+    Settle many transfers from one sender inside the caller's DB transaction.
+
+    The sender and every recipient wallet are locked together in a single
+    query ordered by primary key. Transactions and ledger entries are
+    written with bulk_create and balances are moved with set-based F()
+    updates, so the statement count does not grow with the number of items.
+    Once committed, every wallet involved gets its transaction and balance
+    events.
+
+    Returns (results, sender_wallet, balance_before) where results holds one
+    dict per item, in request order.
+    """
+    usernames = {item['recipient_username'] for item in items}
+    wallets = lock_wallets(Q(user=sender), Q(user__username__in=usernames))
+    sender_wallet = next(w for w in wallets if w.user_id == sender.pk)
+    if sender_wallet.status != 'ACTIVE':
+        raise BulkTransferError(
+            'WALLET_NOT_ACTIVE',
+            f'Your wallet is {sender_wallet.status}. Cannot process transfer.')
+
+    recipient_wallets = {wallet.user.username: wallet for wallet in wallets}
+
+    # Validate every item before touching any balance
+    results = []
+    accepted = []
+    for index, item in enumerate(items):
+        username = item['recipient_username']
+        result = {
+            'index': index,
+            'recipient_username': username,
+            'amount': str(item['amount']),
+        }
+        recipient_wallet = recipient_wallets.get(username)
+        if username == sender.username:
+            result.update(status='FAILED', error='SELF_TRANSFER',
+                          message='Cannot transfer to yourself')
+        elif recipient_wallet is None:
+            result.update(status='FAILED', error='RECIPIENT_NOT_FOUND',
+                          message=f"User '{username}' not found")
+        elif recipient_wallet.status != 'ACTIVE':
+            result.update(status='FAILED', error='RECIPIENT_WALLET_NOT_ACTIVE',
+                          message='Recipient wallet is not active')
+        else:
+            accepted.append((item, recipient_wallet, result))
+        results.append(result)
+
+    total = sum((item['amount'] for item, _, _ in accepted), Decimal('0.00'))
+    if sender_wallet.balance < total:
+        raise BulkTransferError(
+            'INSUFFICIENT_BALANCE',
+            f'Insufficient balance. Required: ₦{total:,.2f}, '
+            f'available: ₦{sender_wallet.balance:,.2f}')
+
+    now = timezone.now()
+    sender_balance_before = sender_wallet.balance
+    running = {sender_wallet.pk: sender_wallet.balance}
+    credits = defaultdict(Decimal)
+    transactions = []
+    ledger_entries = []
+
+    for item, recipient_wallet, result in accepted:
+        username = item['recipient_username']
+        amount = item['amount']
+        description = item.get('description') or f'Transfer to {username}'
+
+        # Both legs carry the other's reference for reconciliation
+        out_reference = generate_reference('TRANSFER_OUT')
+        in_reference = generate_reference('TRANSFER_IN')
+        transfer_out = Transaction(
+            reference=out_reference,
+            wallet=sender_wallet,
+            transaction_type='TRANSFER_OUT',
+            amount=amount,
+            currency=sender_wallet.currency,
+            status='COMPLETED',
+            description=description,
+            recipient_wallet=recipient_wallet,
+            metadata={'counterpart': in_reference},
+            completed_at=now
+        )
+        transfer_in = Transaction(
+            reference=in_reference,
+            wallet=recipient_wallet,
+            transaction_type='TRANSFER_IN',
+            amount=amount,
+            currency=recipient_wallet.currency,
+            status='COMPLETED',
+            description=f'Transfer from {sender.username}',
+            metadata={'counterpart': out_reference},
+            completed_at=now
+        )
+        transactions.extend([transfer_out, transfer_in])
+
+        # Debit sender
+        before = running[sender_wallet.pk]
+        running[sender_wallet.pk] = before - amount
+        ledger_entries.append(LedgerEntry(
+            transaction=transfer_out,
+            wallet=sender_wallet,
+            entry_type='DEBIT',
+            amount=amount,
+            balance_before=before,
+            balance_after=running[sender_wallet.pk],
+            description=f'Transfer to {username}: {description}'
+        ))
+
+        # Credit recipient
+        before = running.get(recipient_wallet.pk, recipient_wallet.balance)
+        running[recipient_wallet.pk] = before + amount
+        ledger_entries.append(LedgerEntry(
+            transaction=transfer_in,
+            wallet=recipient_wallet,
+            entry_type='CREDIT',
+            amount=amount,
+            balance_before=before,
+            balance_after=running[recipient_wallet.pk],
+            description=f'Transfer from {sender.username}: {description}'
+        ))
+        credits[recipient_wallet.pk] += amount
+
+        result.update(status='COMPLETED', reference=transfer_out.reference)
+
+    if not accepted:
+        return results, sender_wallet, sender_balance_before
+
+    try:
+        consume_daily_limit(sender_wallet, total)
+    except DailyLimitExceeded as exc:
+        raise BulkTransferError('DAILY_LIMIT_EXCEEDED', str(exc))
+
+    Transaction.objects.bulk_create(
+        transactions, batch_size=BULK_CREATE_BATCH_SIZE)
+
+    Wallet.objects.debit(sender_wallet.pk, total)
+    Wallet.objects.credit_many(credits)
+
+    ledger.append_many(ledger_entries)
+    rollups.record(rollups.movement(txn) for txn in transactions)
+    # transactions alternates transfer-out and transfer-in legs
+    outbox.emit([
+        outbox.transfer_completed(transfer_out, transfer_in)
+        for transfer_out, transfer_in in zip(transactions[::2], transactions[1::2])
+    ])
+
+    # Each leg on its wallet's stream, then every wallet's final balance
+    # with the last movement that touched it
+    last_reference = {txn.wallet_id: txn.reference for txn in transactions}
+    wallets = {txn.wallet_id: txn.wallet for txn in transactions}
+    wallet_events.publish_on_commit(
+        [wallet_events.Event(txn.wallet_id, 'transaction',
+                             TransactionSerializer(txn).data)
+         for txn in transactions]
+        + [wallet_events.balance_changed(wallet, running[pk], last_reference[pk])
+           for pk, wallet in wallets.items()]
+    )
+
+    sender_wallet.balance = running[sender_wallet.pk]
+    return results, sender_wallet, sender_balance_before
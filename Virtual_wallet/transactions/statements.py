@@ -0,0 +1,147 @@
+"""
+Streaming account statements.
+
+Rows are read with a chunked .iterator() over values_list() and encoded as
+they arrive, so an export of any size holds only one chunk in memory.
+"""
+import csv
+import json
+import zlib
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Transaction
+from ledger.models import LedgerEntry
+from ledger.services import balance_at
+
+
+CHUNK_SIZE = 2000
+
+# Rows encoded per yielded piece of the response
+ROWS_PER_WRITE = 500
+
+TRANSACTION_COLUMNS = (
+    ('reference', 'reference'),
+    ('created_at', 'created_at'),
+    ('transaction_type', 'transaction_type'),
+    ('status', 'status'),
+    ('amount', 'amount'),
+    ('currency', 'currency'),
+    ('recipient_username', 'recipient_wallet__user__username'),
+    ('description', 'description'),
+    ('completed_at', 'completed_at'),
+)
+
+LEDGER_COLUMNS = (
+    ('created_at', 'created_at'),
+    ('reference', 'transaction__reference'),
+    ('entry_type', 'entry_type'),
+    ('amount', 'amount'),
+    ('balance_before', 'balance_before'),
+    ('balance_after', 'balance_after'),
+    ('description', 'description'),
+)
+
+
+def _in_period(queryset, start, end):
+    if start is not None:
+        queryset = queryset.filter(created_at__gte=start)
+    if end is not None:
+        queryset = queryset.filter(created_at__lt=end)
+    return queryset
+
+
+def transaction_rows(wallet, start=None, end=None):
+    """(header, rows) for the wallet's transactions in [start, end)"""
+    rows = (
+        _in_period(Transaction.objects.filter(wallet=wallet), start, end)
+        .order_by('created_at', 'id')
+        .values_list(*(field for _, field in TRANSACTION_COLUMNS))
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    return [name for name, _ in TRANSACTION_COLUMNS], rows
+
+
+def ledger_rows(wallet, start=None, end=None):
+    """
+    (header, rows) for the wallet's ledger entries in [start, end).
+
+    Each row ends with running_balance: the opening balance at start plus
+    every entry streamed so far.
+    """
+    balance = Decimal('0.00')
+    if start is not None:
+        balance = balance_at(wallet.pk, start - timedelta(microseconds=1))
+
+    entries = (
+        _in_period(LedgerEntry.objects.filter(wallet=wallet), start, end)
+        .order_by('created_at', 'id')
+        .values_list(*(field for _, field in LEDGER_COLUMNS))
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+    def rows():
+        nonlocal balance
+        for row in entries:
+            _, _, entry_type, amount, *_ = row
+            balance += amount if entry_type == 'CREDIT' else -amount
+            yield row + (balance,)
+
+    header = [name for name, _ in LEDGER_COLUMNS] + ['running_balance']
+    return header, rows()
+
+
+class _Echo:
+    """File-like object that hands csv.writer's output straight back"""
+
+    def write(self, value):
+        return value
+
+
+def _batched(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == ROWS_PER_WRITE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def encode_csv(header, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for batch in _batched(rows):
+        yield ''.join(writer.writerow(row) for row in batch)
+
+
+def encode_ndjson(header, rows):
+    for batch in _batched(rows):
+        yield ''.join(
+            json.dumps(dict(zip(header, row)), cls=DjangoJSONEncoder) + '\n'
+            for row in batch
+        )
+
+
+def gzipped(chunks):
+    """Gzip a stream of text chunks without buffering the whole body"""
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+ENCODERS = {
+    'csv': (encode_csv, 'text/csv'),
+    'ndjson': (encode_ndjson, 'application/x-ndjson'),
+}
+
+SOURCES = {
+    'transactions': transaction_rows,
+    'ledger': ledger_rows,
+}
@@ -1,3 +1,893 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import (
+    AsyncClient, TestCase, TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from ledger.models import LedgerEntry
+from transactions import idempotency, outbox, statements
+from transactions.management.commands import (
+    rebuild_transaction_rollups as rebuild_rollups)
+from transactions.models import (
+    DailyTransactionRollup, OutboxEvent, Transaction, generate_reference)
+from wallets import events as wallet_events
+from wallets.models import Wallet
+
+
+class TransactionListQueryCountTests(TestCase):
+    """
+    Rendering transaction history must not issue per-row queries for the
+    wallet and recipient usernames.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+        bob = User.objects.create_user('bob', 'bob@example.com', 'pass1234')
+        Transaction.objects.bulk_create([
+            Transaction(
+                reference=f'TXN_TEST_{i}',
+                wallet=cls.alice.wallet,
+                transaction_type='TRANSFER_OUT',
+                amount=Decimal('1.00'),
+                status='COMPLETED',
+                recipient_wallet=bob.wallet,
+            )
+            for i in range(30)
+        ])
+
+    def _count_queries(self, url):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(pk=self.alice.pk))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_list_query_count_is_independent_of_page_size(self):
+        small, small_page = self._count_queries(
+            reverse('transaction-list') + '?page_size=2')
+        large, large_page = self._count_queries(
+            reverse('transaction-list') + '?page_size=30')
+
+        self.assertEqual(len(small_page['results']), 2)
+        self.assertEqual(len(large_page['results']), 30)
+        self.assertEqual(large_page['results'][0]['recipient_username'], 'bob')
+        self.assertEqual(small, large)
+
+    def test_detail_uses_single_joined_query(self):
+        transaction = Transaction.objects.first()
+        count, data = self._count_queries(
+            reverse('transaction-detail', args=[transaction.pk]))
+
+        self.assertEqual(data['wallet_user'], 'alice')
+        self.assertEqual(data['recipient_username'], 'bob')
+        self.assertLessEqual(count, 2)
+
+
+class TransactionHistoryPaginationTests(TestCase):
+    """
+    History pages are a keyset over (created_at, id): rows sharing a
+    timestamp are paged by id, and inserts never shift or repeat rows.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+        cls._deposits(cls.alice.wallet, 25)
+        # Most rows share one timestamp, so only the id can order them
+        cls.tied_at = timezone.now() - timedelta(days=1)
+        Transaction.objects.filter(
+            pk__in=list(Transaction.objects.values_list('pk', flat=True)[:20])
+        ).update(created_at=cls.tied_at)
+
+    @staticmethod
+    def _deposits(wallet, count):
+        Transaction.objects.bulk_create([
+            Transaction(wallet=wallet, transaction_type='DEPOSIT',
+                        amount=Decimal('1.00'), status='COMPLETED',
+                        reference=generate_reference('DEPOSIT'))
+            for _ in range(count)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(pk=self.alice.pk))
+
+    def _page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [row['id'] for row in data['results']], data
+
+    def _expected(self):
+        return [str(pk) for pk in Transaction.objects.order_by(
+            '-created_at', '-id').values_list('pk', flat=True)]
+
+    def test_pages_cover_history_once_in_keyset_order(self):
+        expected = self._expected()
+        seen = []
+        url = reverse('transaction-list') + '?page_size=7'
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                ids, data = self._page(url)
+                seen.extend(ids)
+                url = data['next']
+        self.assertEqual(seen, expected)
+        self.assertFalse(any('OFFSET' in query['sql'] for query in queries))
+
+    def test_inserts_do_not_shift_pages(self):
+        expected = self._expected()
+        first, data = self._page(reverse('transaction-list') + '?page_size=10')
+        self._deposits(self.alice.wallet, 5)
+
+        second, data = self._page(data['next'])
+        self.assertEqual(first + second, expected[:20])
+
+        # Back from the second page: exactly the first page, not the new rows
+        again, data = self._page(data['previous'])
+        self.assertEqual(again, first)
+        self.assertIsNotNone(data['previous'])
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get(reverse('transaction-list') + '?cursor=bm9wZQ==')
+        self.assertEqual(response.status_code, 404)
+
+
+class TransferQueryCountTests(TestCase):
+    """
+    Pins the number of SQL statements a single transfer issues, from JWT
+    authentication to the last ledger write.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+        User.objects.create_user('bob', 'bob@example.com', 'pass1234')
+        Wallet.objects.filter(user=cls.alice).update(balance=Decimal('500.00'))
+
+    def test_transfer_query_count(self):
+        client = APIClient()
+        token = RefreshToken.for_user(self.alice).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        # auth + recipient wallet, 2 transaction inserts, debit and credit
+        # (UPDATE + read-back each, a single UPDATE ... RETURNING each on
+        # PostgreSQL), today's spend counter (an UPDATE, plus a savepointed
+        # INSERT on the day's first debit, as here), one ledger insert for
+        # both legs, the rollup insert-if-missing and grouped increment, the
+        # outbox event, and the savepoints around the view and the
+        # transfer-out insert
+        with self.assertNumQueries(18 if connection.vendor == 'postgresql' else 20):
+            response = client.post(reverse('transfer'), {
+                'recipient_username': 'bob',
+                'amount': '25.00',
+            }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            Wallet.objects.get(user__username='bob').balance, Decimal('25.00'))
+
+
+class TransferWalletCheckTests(TestCase):
+    """
+    Wallet status and funds are checked by the conditional UPDATEs, not on
+    the wallet loaded with the user, and errors report what they found.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'pass1234')
+        Wallet.objects.filter(user=cls.alice).update(balance=Decimal('100.00'))
+
+    def setUp(self):
+        # alice's wallet as loaded at authentication, before the changes
+        # each test makes
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.select_related('wallet').get(pk=self.alice.pk))
+
+    def _transfer(self, amount='10.00'):
+        return self.client.post(reverse('transfer'), {
+            'recipient_username': 'bob', 'amount': amount}, format='json')
+
+    def _assert_nothing_moved(self):
+        self.assertEqual(Wallet.objects.get(user=self.bob).balance,
+                         Decimal('0.00'))
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_sender_frozen_after_loading(self):
+        Wallet.objects.filter(user=self.alice).update(status='FROZEN')
+
+        response = self._transfer()
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['error'], 'WALLET_NOT_ACTIVE')
+        self.assertIn('FROZEN', response.json()['message'])
+        self._assert_nothing_moved()
+
+    def test_recipient_frozen_after_loading(self):
+        Wallet.objects.filter(user=self.bob).update(status='FROZEN')
+
+        response = self._transfer()
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['error'], 'RECIPIENT_WALLET_NOT_ACTIVE')
+        self._assert_nothing_moved()
+        self.assertEqual(Wallet.objects.get(user=self.alice).balance,
+                         Decimal('100.00'))
+
+    def test_insufficient_balance_reports_the_balance_found(self):
+        Wallet.objects.filter(user=self.alice).update(balance=Decimal('5.00'))
+
+        response = self._transfer()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['message'],
+                         'Insufficient balance. Available: ₦5.00')
+        self._assert_nothing_moved()
+
+
+class IdempotentTransferTests(TestCase):
+    """
+    A retried transfer replays the first response, from the cache or the
+    database, and moves money once; a reused key with a new body is refused.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'pass1234')
+        Wallet.objects.update(balance=Decimal('100.00'))
+
+    def setUp(self):
+        cache.clear()
+
+    def _transfer(self, user, key, amount='10.00', recipient='bob'):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=user.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            return client.post(reverse('transfer'), {
+                'recipient_username': recipient,
+                'amount': amount,
+            }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def _transfers_out(self):
+        return Transaction.objects.filter(transaction_type='TRANSFER_OUT').count()
+
+    def _assert_replayed(self, first, again):
+        self.assertEqual(again.status_code, 201)
+        self.assertEqual(again['Idempotent-Replayed'], 'true')
+        self.assertEqual(again.json(), first.json())
+        self.assertEqual(self._transfers_out(), 1)
+        self.assertEqual(Wallet.objects.get(user=self.alice).balance,
+                         Decimal('90.00'))
+
+    def test_retry_is_replayed_from_cache(self):
+        first = self._transfer(self.alice, 'key-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertFalse(first.has_header('Idempotent-Replayed'))
+
+        # Only the user is loaded; the response comes from the cache
+        with self.assertNumQueries(1):
+            again = self._transfer(self.alice, 'key-1')
+        self._assert_replayed(first, again)
+
+    def test_retry_is_replayed_from_database_after_cache_loss(self):
+        first = self._transfer(self.alice, 'key-1')
+        cache.clear()
+
+        self._assert_replayed(first, self._transfer(self.alice, 'key-1'))
+
+    def test_concurrent_duplicate_replays_after_unique_violation(self):
+        first = self._transfer(self.alice, 'key-1')
+        cache.clear()
+
+        # Each duplicate checked for the key before the first one committed:
+        # its first replay misses and it collides on the unique index instead
+        real_replay = idempotency.replay
+        calls = []
+
+        def racing_replay(*args):
+            calls.append(args)
+            return None if len(calls) % 2 else real_replay(*args)
+
+        with mock.patch.object(idempotency, 'replay', racing_replay):
+            again = self._transfer(self.alice, 'key-1')
+            reused = self._transfer(self.alice, 'key-1', amount='20.00')
+
+        self.assertEqual(len(calls), 4)
+        self._assert_replayed(first, again)
+        self.assertEqual(reused.status_code, 422)
+
+    def test_reused_key_with_different_body_is_rejected(self):
+        self._transfer(self.alice, 'key-1')
+
+        response = self._transfer(self.alice, 'key-1', amount='20.00')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.json()['error'], 'IDEMPOTENCY_KEY_REUSED')
+
+        cache.clear()
+        response = self._transfer(self.alice, 'key-1', amount='20.00')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self._transfers_out(), 1)
+
+    def test_keys_are_scoped_per_user(self):
+        self.assertEqual(self._transfer(self.alice, 'key-1').status_code, 201)
+        response = self._transfer(self.bob, 'key-1', recipient='alice')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(self._transfers_out(), 2)
+
+
+class ConcurrentTransferTests(TransactionTestCase):
+    """
+    Opposite-direction transfers fired at the same time must neither
+    deadlock nor create or destroy money.
+    """
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+        self.bob = User.objects.create_user('bob', 'bob@example.com', 'pass1234')
+        Wallet.objects.update(balance=Decimal('1000.00'))
+
+    def _transfer(self, sender, recipient_username):
+        try:
+            client = APIClient()
+            client.force_authenticate(sender)
+            response = client.post(reverse('transfer'), {
+                'recipient_username': recipient_username,
+                'amount': '7.00',
+            }, format='json')
+            return response.status_code
+        finally:
+            connection.close()
+
+    @override_settings(WALLET_LOCK_MAX_RETRIES=50)
+    def test_opposite_transfers_do_not_deadlock_and_conserve_money(self):
+        # Fresh user instances per job so threads share no cached wallets
+        jobs = [
+            (User.objects.get(pk=sender.pk), recipient)
+            for _ in range(20)
+            for sender, recipient in ((self.alice, 'bob'), (self.bob, 'alice'))
+        ]
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            statuses = list(pool.map(lambda job: self._transfer(*job), jobs))
+
+        self.assertEqual(statuses, [201] * len(jobs))
+        total = Wallet.objects.aggregate(total=Sum('balance'))['total']
+        self.assertEqual(total, Decimal('2000.00'))
+        self.assertEqual(
+            Wallet.objects.get(user=self.alice).balance, Decimal('1000.00'))
+
+
+class BulkTransferTests(TestCase):
+    """
+    A bulk transfer settles its valid items together, reports the rest per
+    item, and writes a ledger chain that runs through repeated recipients.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+        User.objects.create_user('bob', 'bob@example.com', 'pass1234')
+        carol = User.objects.create_user('carol', 'carol@example.com', 'pass1234')
+        Wallet.objects.filter(user=cls.alice).update(balance=Decimal('100.00'))
+        Wallet.objects.filter(user=carol).update(status='FROZEN')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(pk=self.alice.pk))
+
+    def _bulk(self, *transfers):
+        return self.client.post(reverse('bulk-transfer'), {'transfers': [
+            {'recipient_username': username, 'amount': amount}
+            for username, amount in transfers
+        ]}, format='json')
+
+    def test_failed_items_are_reported_alongside_completed_ones(self):
+        response = self._bulk(('bob', '10.00'), ('alice', '5.00'),
+                              ('nobody', '5.00'), ('carol', '5.00'))
+
+        self.assertEqual(response.status_code, 201)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results],
+                         ['COMPLETED', 'FAILED', 'FAILED', 'FAILED'])
+        self.assertEqual([result.get('error') for result in results[1:]], [
+            'SELF_TRANSFER', 'RECIPIENT_NOT_FOUND', 'RECIPIENT_WALLET_NOT_ACTIVE'])
+        self.assertEqual(response.json()['summary']['amount_transferred'], '10.00')
+        self.assertEqual(Wallet.objects.get(user=self.alice).balance, Decimal('90.00'))
+        self.assertEqual(Wallet.objects.get(user__username='carol').balance,
+                         Decimal('0.00'))
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_insufficient_balance_rejects_the_whole_batch(self):
+        response = self._bulk(('bob', '60.00'), ('bob', '50.00'))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'INSUFFICIENT_BALANCE')
+        self.assertEqual(Wallet.objects.get(user=self.alice).balance, Decimal('100.00'))
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(LedgerEntry.objects.exists())
+
+    def test_repeated_recipient_gets_a_running_ledger_chain(self):
+        response = self._bulk(('bob', '10.00'), ('bob', '15.00'), ('bob', '20.00'))
+        self.assertEqual(response.status_code, 201)
+
+        def chain(username, entry_type):
+            return list(LedgerEntry.objects.filter(
+                wallet__user__username=username, entry_type=entry_type,
+            ).order_by('balance_before').values_list(
+                'balance_before', 'balance_after'))
+
+        self.assertEqual(chain('bob', 'CREDIT'), [
+            (Decimal('0.00'), Decimal('10.00')),
+            (Decimal('10.00'), Decimal('25.00')),
+            (Decimal('25.00'), Decimal('45.00')),
+        ])
+        self.assertEqual(chain('alice', 'DEBIT'), [
+            (Decimal('75.00'), Decimal('55.00')),
+            (Decimal('90.00'), Decimal('75.00')),
+            (Decimal('100.00'), Decimal('90.00')),
+        ])
+        self.assertEqual(Wallet.objects.get(user__username='bob').balance,
+                         Decimal('45.00'))
+
+
+class StatementExportTests(TestCase):
+    """
+    Statements stream in pieces; the ledger statement carries a running
+    balance that matches every entry's balance_after, and gzip output
+    decompresses to the same body.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+        User.objects.create_user('bob', 'bob@example.com', 'pass1234')
+        deposit = Transaction.objects.create(
+            wallet=cls.alice.wallet, transaction_type='DEPOSIT',
+            amount=Decimal('100.00'), status='COMPLETED')
+        LedgerEntry.objects.create(
+            transaction=deposit, wallet=cls.alice.wallet, entry_type='CREDIT',
+            amount=Decimal('100.00'), balance_before=Decimal('0.00'),
+            balance_after=Decimal('100.00'), description='Deposit')
+        Wallet.objects.filter(user=cls.alice).update(balance=Decimal('100.00'))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(pk=self.alice.pk))
+        for amount in ('10.00', '15.50', '4.25', '20.00'):
+            self.client.post(reverse('transfer'), {
+                'recipient_username': 'bob', 'amount': amount}, format='json')
+
+    def _export(self, **params):
+        response = self.client.get(reverse('statement-export'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, list(response.streaming_content)
+
+    def _ledger_csv(self, **params):
+        _, chunks = self._export(kind='ledger', output='csv', **params)
+        return list(csv.DictReader(StringIO(b''.join(chunks).decode())))
+
+    def test_ledger_csv_running_balance(self):
+        rows = self._ledger_csv()
+
+        self.assertEqual(len(rows), 5)
+        for row in rows:
+            self.assertEqual(row['running_balance'], row['balance_after'])
+        self.assertEqual(rows[-1]['running_balance'],
+                         str(Wallet.objects.get(user=self.alice).balance))
+
+    def test_ledger_running_balance_opens_at_start(self):
+        entries = LedgerEntry.objects.filter(
+            wallet__user=self.alice).order_by('created_at')
+        start = entries[2].created_at
+
+        rows = self._ledger_csv(start=start.isoformat())
+
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['balance_before'],
+                         str(entries[2].balance_before))
+        for row in rows:
+            self.assertEqual(row['running_balance'], row['balance_after'])
+
+    def test_ledger_ndjson_streams_in_pieces(self):
+        with mock.patch.object(statements, 'ROWS_PER_WRITE', 2):
+            response, chunks = self._export(kind='ledger', output='ndjson')
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(len(chunks), 3)
+        rows = [json.loads(line)
+                for line in b''.join(chunks).decode().splitlines()]
+        self.assertEqual([row['running_balance'] for row in rows],
+                         [row['balance_after'] for row in rows])
+        self.assertEqual(rows[-1]['running_balance'], '50.25')
+
+    def test_gzip_output_matches_plain_output(self):
+        _, plain = self._export(kind='transactions', output='csv')
+        response, compressed = self._export(
+            kind='transactions', output='csv', compress='gzip')
+
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('transactions-statement.csv.gz',
+                      response['Content-Disposition'])
+        body = gzip.decompress(b''.join(compressed))
+        self.assertEqual(body, b''.join(plain))
+        self.assertEqual(body.decode().splitlines()[0],
+                         ','.join(name for name, _ in statements.TRANSACTION_COLUMNS))
+
+
+class TransactionRollupTests(TestCase):
+    """
+    Rollups maintained at write time must match a rebuild from Transaction
+    history, and the summary endpoint must read them.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+        User.objects.create_user('bob', 'bob@example.com', 'pass1234')
+        User.objects.create_user('carol', 'carol@example.com', 'pass1234')
+        Wallet.objects.filter(user=cls.alice).update(balance=Decimal('500.00'))
+
+    def _rollups(self):
+        return sorted(DailyTransactionRollup.objects.values_list(
+            'wallet_id', 'day', 'transaction_type', 'currency', 'count', 'total'))
+
+    def test_rollups_match_rebuild_and_feed_summary(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=self.alice.pk))
+        for amount in ('10.00', '15.00'):
+            response = client.post(reverse('transfer'), {
+                'recipient_username': 'bob', 'amount': amount}, format='json')
+            self.assertEqual(response.status_code, 201)
+
+        client.force_authenticate(User.objects.get(pk=self.alice.pk))
+        response = client.post(reverse('bulk-transfer'), {'transfers': [
+            {'recipient_username': 'bob', 'amount': '5.00'},
+            {'recipient_username': 'carol', 'amount': '20.00'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        maintained = self._rollups()
+        call_command('rebuild_transaction_rollups', stdout=StringIO())
+        self.assertEqual(self._rollups(), maintained)
+
+        # The wallet, then the rollups; Transaction is never read
+        with self.assertNumQueries(2):
+            response = client.get(reverse('transaction-summary'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['by_type'], [{
+            'transaction_type': 'TRANSFER_OUT', 'currency': 'NGN',
+            'count': 4, 'total': '50.00'}])
+        self.assertEqual(response.json()['totals'][0]['net'], '-50.00')
+
+    def test_rebuild_repairs_each_wallet_under_its_lock(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=self.alice.pk))
+        client.post(reverse('transfer'), {
+            'recipient_username': 'bob', 'amount': '10.00'}, format='json')
+        maintained = self._rollups()
+
+        # Drifted and stale rows, the latter for a wallet without movements
+        DailyTransactionRollup.objects.update(count=7, total=Decimal('1.00'))
+        carol = Wallet.objects.get(user__username='carol')
+        DailyTransactionRollup.objects.create(
+            wallet=carol, day=timezone.localdate(), transaction_type='DEPOSIT',
+            currency='NGN', count=1, total=Decimal('3.00'))
+
+        with mock.patch.object(rebuild_rollups, 'WALLETS_PER_BATCH', 1), \
+                mock.patch.object(rebuild_rollups, 'lock_wallets',
+                                  wraps=rebuild_rollups.lock_wallets) as locks:
+            call_command('rebuild_transaction_rollups', stdout=StringIO())
+
+        self.assertEqual(self._rollups(), maintained)
+        self.assertEqual(locks.call_count, 3)
+
+
+class OutboxRelayTests(TestCase):
+    """
+    Transfers write outbox events in their own transaction; the relay
+    delivers them in order, at least once, and resumes from its checkpoint.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+        User.objects.create_user('bob', 'bob@example.com', 'pass1234')
+        Wallet.objects.filter(user=cls.alice).update(balance=Decimal('500.00'))
+
+    def _drain_queue(self):
+        events = []
+        while not outbox.QueueSink.queue.empty():
+            events.append(outbox.QueueSink.queue.get_nowait())
+        return events
+
+    def test_relay_delivers_in_order_and_retries_failed_batches(self):
+        self._drain_queue()
+        client = APIClient()
+        for amount in ('10.00', '20.00', '30.00'):
+            client.force_authenticate(User.objects.get(pk=self.alice.pk))
+            response = client.post(reverse('transfer'), {
+                'recipient_username': 'bob', 'amount': amount}, format='json')
+            self.assertEqual(response.status_code, 201)
+
+        class FailingSink:
+            def publish(self, events):
+                raise ConnectionError('sink down')
+
+        with self.assertRaises(ConnectionError):
+            outbox.relay('consumer', FailingSink(), settle_seconds=0)
+
+        sink = outbox.get_sink('queue')
+        self.assertEqual(outbox.relay('consumer', sink, batch_size=2, settle_seconds=0), 2)
+        self.assertEqual(outbox.relay('consumer', sink, batch_size=2, settle_seconds=0), 1)
+        self.assertEqual(outbox.relay('consumer', sink, settle_seconds=0), 0)
+
+        events = self._drain_queue()
+        self.assertEqual([e['topic'] for e in events], ['transfer.completed'] * 3)
+        self.assertEqual([e['payload']['amount'] for e in events],
+                         ['10.00', '20.00', '30.00'])
+        self.assertEqual(events, sorted(events, key=lambda e: e['id']))
+
+    def test_batch_stops_at_first_unsettled_event(self):
+        self._drain_queue()
+        events = outbox.emit([
+            outbox.event('test.event', n, {'n': n}) for n in range(3)])
+        # Ids and timestamps disagree: the middle event is the newest
+        hour_ago = timezone.now() - timedelta(hours=1)
+        OutboxEvent.objects.filter(pk__in=[events[0].pk, events[2].pk]).update(
+            created_at=hour_ago)
+        OutboxEvent.objects.filter(pk=events[1].pk).update(created_at=timezone.now())
+
+        sink = outbox.get_sink('queue')
+        self.assertEqual(outbox.relay('consumer', sink, settle_seconds=60), 1)
+        self.assertEqual(outbox.relay('consumer', sink, settle_seconds=60), 0)
+        self.assertEqual([e['payload']['n'] for e in self._drain_queue()], [0])
+
+        OutboxEvent.objects.filter(pk=events[1].pk).update(created_at=hour_ago)
+        self.assertEqual(outbox.relay('consumer', sink, settle_seconds=60), 2)
+        self.assertEqual([e['payload']['n'] for e in self._drain_queue()], [1, 2])
+
+
+class AsyncReadViewTests(TestCase):
+    """
+    The async read endpoints must answer exactly like their sync twins, and
+    their history cursors must be interchangeable.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+        bob = User.objects.create_user('bob', 'bob@example.com', 'pass1234')
+        Wallet.objects.filter(user=cls.alice).update(balance=Decimal('500.00'))
+        Transaction.objects.bulk_create([
+            Transaction(
+                reference=f'TXN_TEST_{i}', wallet=cls.alice.wallet,
+                transaction_type='TRANSFER_OUT', amount=Decimal('1.00'),
+                status='COMPLETED', recipient_wallet=bob.wallet)
+            for i in range(7)
+        ])
+
+    async def test_async_views_match_sync_views(self):
+        token = RefreshToken.for_user(self.alice).access_token
+        headers = {'Authorization': f'Bearer {token}'}
+        sync_client, async_client = APIClient(), AsyncClient()
+
+        async def both(sync_url, async_url):
+            sync_response = await sync_to_async(sync_client.get)(
+                sync_url, headers=headers)
+            async_response = await async_client.get(async_url, headers=headers)
+            self.assertEqual(async_response.status_code, sync_response.status_code)
+            return sync_response.json(), async_response.json()
+
+        sync_data, async_data = await both(
+            reverse('wallet-detail'), reverse('async-wallet-detail'))
+        self.assertEqual(async_data, sync_data)
+
+        sync_data, async_data = await both(
+            reverse('wallet-balance'), reverse('async-wallet-balance'))
+        self.assertEqual(async_data, sync_data)
+        self.assertEqual(async_data['available_balance'], '500.00')
+
+        # Walk the history on the async endpoint, checking each page against
+        # the sync endpoint fed the same cursor
+        query = '?page_size=3'
+        seen = []
+        while query:
+            sync_data, async_data = await both(
+                reverse('transaction-list') + query,
+                reverse('async-transaction-list') + query)
+            self.assertEqual(async_data['results'], sync_data['results'])
+            seen += [row['reference'] for row in async_data['results']]
+            query = async_data['next'] and '?' + async_data['next'].split('?')[1]
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len(set(seen)), 7)
+
+        response = await async_client.get(reverse('async-wallet-balance'))
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('detail', response.json())
+
+    async def test_cursors_cross_between_endpoints_on_tied_timestamps(self):
+        # Every row shares one created_at, so pages are split by id alone
+        await Transaction.objects.aupdate(created_at=timezone.now())
+        token = RefreshToken.for_user(self.alice).access_token
+        headers = {'Authorization': f'Bearer {token}'}
+        sync_client, async_client = APIClient(), AsyncClient()
+
+        async def get(link, on_async):
+            query = '?' + link.split('?')[1]
+            if on_async:
+                response = await async_client.get(
+                    reverse('async-transaction-list') + query, headers=headers)
+            else:
+                response = await sync_to_async(sync_client.get)(
+                    reverse('transaction-list') + query, headers=headers)
+            self.assertEqual(response.status_code, 200)
+            return response.json()
+
+        # Forward, alternating endpoints page by page
+        pages = [await get('?page_size=3', on_async=False)]
+        while pages[-1]['next']:
+            pages.append(await get(pages[-1]['next'], on_async=len(pages) % 2 == 1))
+        forward = [[row['reference'] for row in page['results']] for page in pages]
+        self.assertEqual(sum(map(len, forward)), 7)
+        self.assertEqual(len(set(sum(forward, []))), 7)
+
+        # Back again, on the other endpoint each time, returns the same pages
+        page = pages[-1]
+        for expected, on_async in zip(reversed(forward[:-1]), (True, False)):
+            page = await get(page['previous'], on_async)
+            self.assertEqual([row['reference'] for row in page['results']], expected)
+        self.assertIsNone(page['previous'])
+
+
+class WalletEventStreamTests(TestCase):
+    """
+    A committed transfer, single or bulk, reaches every open event stream
+    of the wallets it moved money between, and only theirs.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'pass1234')
+        User.objects.create_user('carol', 'carol@example.com', 'pass1234')
+        Wallet.objects.filter(user=cls.bob).update(balance=Decimal('100.00'))
+
+    def setUp(self):
+        # Balances cached by earlier tests outlive their rolled back rows
+        cache.clear()
+        self.responses = []
+
+    async def _open_stream(self, user):
+        token = RefreshToken.for_user(user).access_token
+        response = await AsyncClient().get(
+            reverse('async-wallet-events'),
+            headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.responses.append(response)
+        return aiter(response.streaming_content)
+
+    async def _next_event(self, stream):
+        chunk = (await asyncio.wait_for(anext(stream), 5)).decode()
+        event_line, data_line = chunk.strip().split('\n')
+        return event_line.removeprefix('event: '), json.loads(
+            data_line.removeprefix('data: '))
+
+    async def test_transfer_is_pushed_to_both_wallets_streams(self):
+        alice_streams = [await self._open_stream(self.alice) for _ in range(2)]
+        bob_stream = await self._open_stream(self.bob)
+        carol = await User.objects.aget(username='carol')
+        carol_stream = await self._open_stream(carol)
+
+        for stream in alice_streams:
+            event_type, data = await self._next_event(stream)
+            self.assertEqual((event_type, data['available_balance']),
+                             ('snapshot', '0.00'))
+        await self._next_event(bob_stream)
+        await self._next_event(carol_stream)
+
+        # Transfer on the sync side, as WSGI/ASGI worker threads do; the
+        # commit callbacks publish from that thread to this loop's streams
+        def transfer():
+            client = APIClient()
+            client.force_authenticate(User.objects.get(pk=self.bob.pk))
+            with self.captureOnCommitCallbacks(execute=True):
+                return client.post(reverse('transfer'), {
+                    'recipient_username': 'alice', 'amount': '30.00'},
+                    format='json')
+
+        response = await sync_to_async(transfer)()
+        self.assertEqual(response.status_code, 201)
+
+        for stream in alice_streams:
+            event_type, data = await self._next_event(stream)
+            self.assertEqual(event_type, 'transaction')
+            self.assertEqual(data['transaction_type'], 'TRANSFER_IN')
+            event_type, data = await self._next_event(stream)
+            self.assertEqual((event_type, data['available_balance']),
+                             ('balance', '30.00'))
+
+        event_type, data = await self._next_event(bob_stream)
+        self.assertEqual((event_type, data['reference']),
+                         ('transaction', response.json()['transaction']['reference']))
+        event_type, data = await self._next_event(bob_stream)
+        self.assertEqual((event_type, data['available_balance']),
+                         ('balance', '70.00'))
+
+        with override_settings(WALLET_EVENTS_HEARTBEAT_SECONDS=0.01):
+            chunk = await asyncio.wait_for(anext(carol_stream), 5)
+        self.assertEqual(chunk, b': keep-alive\n\n')
+
+        for response in self.responses:
+            response.close()
+        self.assertEqual(wallet_events.hub.subscriber_count(), 0)
+
+    async def test_bulk_transfer_is_pushed_to_every_wallet(self):
+        carol = await User.objects.aget(username='carol')
+        alice_stream = await self._open_stream(self.alice)
+        bob_stream = await self._open_stream(self.bob)
+        carol_stream = await self._open_stream(carol)
+        for stream in (alice_stream, bob_stream, carol_stream):
+            await self._next_event(stream)
+
+        def bulk_transfer():
+            client = APIClient()
+            client.force_authenticate(User.objects.get(pk=self.bob.pk))
+            with self.captureOnCommitCallbacks(execute=True):
+                return client.post(reverse('bulk-transfer'), {'transfers': [
+                    {'recipient_username': 'alice', 'amount': '10.00'},
+                    {'recipient_username': 'carol', 'amount': '5.00'},
+                    {'recipient_username': 'alice', 'amount': '15.00'},
+                ]}, format='json')
+
+        response = await sync_to_async(bulk_transfer)()
+        self.assertEqual(response.status_code, 201)
+
+        async def events(stream, count):
+            return [await self._next_event(stream) for _ in range(count)]
+
+        received = await events(bob_stream, 4)
+        self.assertEqual([data['reference'] for _, data in received[:3]],
+                         [r['reference'] for r in response.json()['results']])
+        self.assertEqual(received[3][0], 'balance')
+        self.assertEqual(received[3][1]['available_balance'], '70.00')
+        self.assertEqual(received[3][1]['reference'],
+                         response.json()['results'][-1]['reference'])
+
+        received = await events(alice_stream, 3)
+        self.assertEqual([(event_type, data.get('amount')) for event_type, data
+                          in received[:2]],
+                         [('transaction', '10.00'), ('transaction', '15.00')])
+        self.assertEqual((received[2][0], received[2][1]['available_balance']),
+                         ('balance', '25.00'))
+
+        received = await events(carol_stream, 2)
+        self.assertEqual(received[0][1]['transaction_type'], 'TRANSFER_IN')
+        self.assertEqual(received[1][1]['available_balance'], '5.00')
+
+        for response in self.responses:
+            response.close()
@@ -1,8 +1,13 @@
 from django.urls import path
-from .views import TransactionListView, TransactionDetailView, TransferView
+from .views import (
+    TransactionListView, TransactionDetailView, TransferView,
+    BulkTransferView, StatementExportView, TransactionSummaryView)
 
 urlpatterns = [
     path('', TransactionListView.as_view(), name='transaction-list'),
     path('<uuid:pk>/', TransactionDetailView.as_view(), name='transaction-detail'),
+    path('summary/', TransactionSummaryView.as_view(), name='transaction-summary'),
+    path('statement/', StatementExportView.as_view(), name='statement-export'),
     path('transfer/', TransferView.as_view(), name='transfer'),
+    path('transfer/bulk/', BulkTransferView.as_view(), name='bulk-transfer'),
 ]
@@ -1,15 +1,28 @@
 from rest_framework import generics, status
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
-from django.db import transaction as db_transaction
-from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction as db_transaction
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time, timedelta
 from decimal import Decimal
 
-from .models import Transaction
-from .serializers import TransactionSerializer, TransferSerializer
-from wallets.models import Wallet
+from . import idempotency, outbox, rollups, statements
+from .models import DailyTransactionRollup, Transaction, generate_reference
+from .pagination import TransactionCursorPagination
+from .serializers import (
+    TransactionSerializer, TransferSerializer, BulkTransferSerializer)
+from .services import BulkTransferError, execute_bulk_transfer
+from wallets import events as wallet_events
+from wallets.models import (
+    DailyLimitExceeded, InsufficientFunds, WalletNotActive)
+from wallets.services import (
+    consume_daily_limit, transfer_funds, with_wallet_locks)
+from ledger import services as ledger
 from ledger.models import LedgerEntry
 
 
@@ -19,21 +32,28 @@ class TransactionListView(generics.ListAPIView):
     """
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = TransactionCursorPagination
 
     def get_queryset(self):
-        queryset = Transaction.objects.filter(wallet=self.request.user.wallet)
+        return history_queryset(
+            self.request.user.wallet, self.request.query_params)
 
-        # Filter by type
-        transaction_type = self.request.query_params.get('type', None)
-        if transaction_type:
-            queryset = queryset.filter(transaction_type=transaction_type)
 
-        # Filter by status
-        status = self.request.query_params.get('status', None)
-        if status:
-            queryset = queryset.filter(status=status)
+def history_queryset(wallet, params):
+    """A wallet's transactions, filtered by the ?type= and ?status= params"""
+    queryset = Transaction.objects.for_api().filter(wallet=wallet)
 
-        return queryset.order_by('-created_at')
+    # Filter by type
+    transaction_type = params.get('type', None)
+    if transaction_type:
+        queryset = queryset.filter(transaction_type=transaction_type)
+
+    # Filter by status
+    status = params.get('status', None)
+    if status:
+        queryset = queryset.filter(status=status)
+
+    return queryset
 
 
 class TransactionDetailView(generics.RetrieveAPIView):
@@ -44,114 +64,415 @@ class TransactionDetailView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Transaction.objects.filter(wallet=self.request.user.wallet)
+        return Transaction.objects.for_api().filter(
+            wallet=self.request.user.wallet)
+
+
+class StatementNegotiation(DefaultContentNegotiation):
+    """
+    Statement bodies are not rendered by DRF, so an Accept header asking
+    for text/csv or NDJSON must not be rejected; errors fall back to JSON.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except NotAcceptable:
+            return renderers[0], renderers[0].media_type
+
+
+class StatementExportView(APIView):
+    """
+    Stream a statement of transactions or ledger entries for a date range
+
+    GET ?kind=transactions|ledger&output=csv|ndjson&start=&end=&compress=gzip
+
+    start and end accept a date or an ISO 8601 date and time; a plain end
+    date includes that whole day. Rows are streamed as they are read, so
+    the export size is not limited by memory.
+    """
+    permission_classes = [IsAuthenticated]
+    content_negotiation_class = StatementNegotiation
+
+    def get(self, request):
+        params = request.query_params
+        kind = params.get('kind', 'transactions')
+        output = params.get('output', 'csv')
+        compress = params.get('compress', '')
+
+        if kind not in statements.SOURCES:
+            return self._invalid(
+                f"kind must be one of: {', '.join(statements.SOURCES)}")
+        if output not in statements.ENCODERS:
+            return self._invalid(
+                f"output must be one of: {', '.join(statements.ENCODERS)}")
+        if compress not in ('', 'gzip'):
+            return self._invalid("compress must be 'gzip' when given")
+
+        try:
+            start = self._parse_bound(params.get('start'))
+            end = self._parse_bound(params.get('end'), end_of_day=True)
+        except ValueError:
+            return self._invalid(
+                'start and end must be ISO 8601 dates or date-times')
+        if start and end and start >= end:
+            return self._invalid('start must be before end')
+
+        wallet = request.user.wallet
+        header, rows = statements.SOURCES[kind](wallet, start, end)
+        encode, content_type = statements.ENCODERS[output]
+        body = encode(header, rows)
+
+        filename = f'{kind}-statement.{output}'
+        if compress:
+            body = statements.gzipped(body)
+            content_type = 'application/gzip'
+            filename += '.gz'
+
+        response = StreamingHttpResponse(body, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @staticmethod
+    def _parse_bound(value, end_of_day=False):
+        if not value:
+            return None
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError(value)
+            if end_of_day:
+                day += timedelta(days=1)
+            moment = datetime.combine(day, time.min)
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    @staticmethod
+    def _invalid(message):
+        return Response({
+            'error': 'INVALID_STATEMENT_REQUEST',
+            'message': message
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+
+class TransactionSummaryView(APIView):
+    """
+    Totals per transaction type and per day: GET ?start=YYYY-MM-DD&end=YYYY-MM-DD
+
+    Read from the daily rollups only, never from Transaction. Days are the
+    days transactions completed; both bounds are inclusive and default to
+    the last 30 days.
+    """
+    permission_classes = [IsAuthenticated]
+
+    DEFAULT_DAYS = 30
+    MAX_DAYS = 366
+
+    def get(self, request):
+        try:
+            end = self._parse_day(request.query_params.get('end'))
+            end = end or timezone.localdate()
+            start = self._parse_day(request.query_params.get('start'))
+            start = start or end - timedelta(days=self.DEFAULT_DAYS - 1)
+        except ValueError:
+            return self._invalid('start and end must be dates (YYYY-MM-DD)')
+        if start > end:
+            return self._invalid('start must not be after end')
+        if (end - start).days >= self.MAX_DAYS:
+            return self._invalid(f'The range is limited to {self.MAX_DAYS} days')
+
+        wallet = request.user.wallet
+        rows = (DailyTransactionRollup.objects
+                .filter(wallet=wallet, day__range=(start, end))
+                .order_by('day', 'transaction_type', 'currency')
+                .values_list('day', 'transaction_type', 'currency',
+                             'count', 'total'))
+
+        by_day = []
+        by_type = {}
+        totals = {}
+        for day, transaction_type, currency, count, total in rows:
+            by_day.append({
+                'day': day.isoformat(),
+                'transaction_type': transaction_type,
+                'currency': currency,
+                'count': count,
+                'total': str(total)
+            })
+            summed = by_type.setdefault(
+                (transaction_type, currency), [0, Decimal('0.00')])
+            summed[0] += count
+            summed[1] += total
+
+            flows = totals.setdefault(
+                currency, {'inflow': Decimal('0.00'), 'outflow': Decimal('0.00'),
+                           'count': 0})
+            flows['count'] += count
+            if transaction_type in rollups.INFLOW_TYPES:
+                flows['inflow'] += total
+            elif transaction_type in rollups.OUTFLOW_TYPES:
+                flows['outflow'] += total
+
+        return Response({
+            'wallet_id': str(wallet.pk),
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'totals': [{
+                'currency': currency,
+                'inflow': str(flows['inflow']),
+                'outflow': str(flows['outflow']),
+                'net': str(flows['inflow'] - flows['outflow']),
+                'transaction_count': flows['count']
+            } for currency, flows in sorted(totals.items())],
+            'by_type': [{
+                'transaction_type': transaction_type,
+                'currency': currency,
+                'count': count,
+                'total': str(total)
+            } for (transaction_type, currency), (count, total)
+                in sorted(by_type.items())],
+            'by_day': by_day
+        })
+
+    @staticmethod
+    def _parse_day(value):
+        if not value:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        return day
+
+    @staticmethod
+    def _invalid(message):
+        return Response({
+            'error': 'INVALID_SUMMARY_REQUEST',
+            'message': message
+        }, status=status.HTTP_400_BAD_REQUEST)
 
 
 class TransferView(APIView):
     """
     Transfer money to another user
+
+    Clients may send an Idempotency-Key header; retries with the same key
+    return the original response instead of transferring again. Reusing a
+    key with a different request body is rejected with 422.
     """
     permission_classes = [IsAuthenticated]
 
-    @db_transaction.atomic
     def post(self, request):
+        key = request.headers.get(idempotency.HEADER)
+        if key is None:
+            return self.transfer(request, None)
+
+        if not key or len(key) > idempotency.MAX_KEY_LENGTH:
+            return Response({
+                'error': 'INVALID_IDEMPOTENCY_KEY',
+                'message': f'{idempotency.HEADER} must be 1-{idempotency.MAX_KEY_LENGTH} characters'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        scoped_key = idempotency.scoped_key(request.user, key)
+        fingerprint = idempotency.fingerprint(request.data)
+        try:
+            payload = idempotency.replay(
+                scoped_key, fingerprint, TransactionSerializer)
+            if payload is not None:
+                return self._replayed(payload)
+            return self.transfer(request, scoped_key, fingerprint)
+        except idempotency.KeyReused as exc:
+            return Response({
+                'error': 'IDEMPOTENCY_KEY_REUSED',
+                'message': str(exc)
+            }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def _replayed(self, payload):
+        response = Response(payload, status=status.HTTP_201_CREATED)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+    @with_wallet_locks
+    def transfer(self, request, idempotency_key, fingerprint=None):
         serializer = TransferSerializer(
             data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
 
-        # Get sender and recipient
         sender = request.user
-        sender_wallet = Wallet.objects.select_for_update().get(user=sender)
-
+        sender_wallet = sender.wallet
         recipient_username = serializer.validated_data['recipient_username']
-        recipient = User.objects.get(username=recipient_username)
-        recipient_wallet = Wallet.objects.select_for_update().get(user=recipient)
+        recipient_wallet = serializer.validated_data['recipient_wallet']
 
         amount = serializer.validated_data['amount']
         description = serializer.validated_data.get(
             'description', f'Transfer to {recipient_username}')
 
-        # Check wallet status
-        if sender_wallet.status != 'ACTIVE':
-            return Response({
-                'error': 'WALLET_NOT_ACTIVE',
-                'message': f'Your wallet is {sender_wallet.status}. Cannot process transfer.'
-            }, status=status.HTTP_403_FORBIDDEN)
-
-        if recipient_wallet.status != 'ACTIVE':
-            return Response({
-                'error': 'RECIPIENT_WALLET_NOT_ACTIVE',
-                'message': 'Recipient wallet is not active'
-            }, status=status.HTTP_403_FORBIDDEN)
-
-        # Double-check balance (redundant but safe)
-        if sender_wallet.balance < amount:
-            return Response({
-                'error': 'INSUFFICIENT_BALANCE',
-                'message': f'Insufficient balance. Available: ₦{sender_wallet.balance:,.2f}'
-            }, status=status.HTTP_400_BAD_REQUEST)
-
-        # Create transfer-out transaction for sender
-        transfer_out = Transaction.objects.create(
-            wallet=sender_wallet,
-            transaction_type='TRANSFER_OUT',
-            amount=amount,
-            currency=sender_wallet.currency,
-            status='COMPLETED',
-            description=description,
-            recipient_wallet=recipient_wallet,
-            completed_at=timezone.now()
-        )
+        # Create transfer-out transaction for sender. It is written first
+        # so a concurrent request with the same idempotency key waits on the
+        # unique index here, before any balance is touched.
+        # Both legs carry the other's reference for reconciliation.
+        transfer_in_reference = generate_reference('TRANSFER_IN')
+        try:
+            with db_transaction.atomic():
+                transfer_out = Transaction.objects.create(
+                    wallet=sender_wallet,
+                    transaction_type='TRANSFER_OUT',
+                    amount=amount,
+                    currency=sender_wallet.currency,
+                    status='COMPLETED',
+                    description=description,
+                    recipient_wallet=recipient_wallet,
+                    idempotency_key=idempotency_key,
+                    idempotency_fingerprint=fingerprint,
+                    metadata={'counterpart': transfer_in_reference},
+                    completed_at=timezone.now()
+                )
+        except IntegrityError:
+            payload = idempotency_key and idempotency.replay(
+                idempotency_key, fingerprint, TransactionSerializer)
+            if not payload:
+                raise
+            db_transaction.set_rollback(True)
+            return self._replayed(payload)
 
         # Create transfer-in transaction for recipient
         transfer_in = Transaction.objects.create(
+            reference=transfer_in_reference,
             wallet=recipient_wallet,
             transaction_type='TRANSFER_IN',
             amount=amount,
             currency=recipient_wallet.currency,
             status='COMPLETED',
             description=f'Transfer from {sender.username}',
+            metadata={'counterpart': transfer_out.reference},
             completed_at=timezone.now()
         )
 
-        # Update balances
-        sender_balance_before = sender_wallet.balance
-        sender_wallet.balance -= amount
-        sender_wallet.save()
-
-        recipient_balance_before = recipient_wallet.balance
-        recipient_wallet.balance += amount
-        recipient_wallet.save()
-
-        # Create ledger entries (audit trail)
-        # Debit sender
-        LedgerEntry.objects.create(
-            transaction=transfer_out,
-            wallet=sender_wallet,
-            entry_type='DEBIT',
-            amount=amount,
-            balance_before=sender_balance_before,
-            balance_after=sender_wallet.balance,
-            description=f'Transfer to {recipient_username}: {description}'
-        )
+        # Update balances; the conditional UPDATEs are the authoritative
+        # wallet status and balance checks, and report what they found
+        try:
+            debit, credit = transfer_funds(
+                sender_wallet, recipient_wallet, amount)
+        except WalletNotActive as exc:
+            db_transaction.set_rollback(True)
+            if exc.wallet_id == sender_wallet.pk:
+                return Response({
+                    'error': 'WALLET_NOT_ACTIVE',
+                    'message': f'Your wallet is {exc.status}. Cannot process transfer.'
+                }, status=status.HTTP_403_FORBIDDEN)
+            return Response({
+                'error': 'RECIPIENT_WALLET_NOT_ACTIVE',
+                'message': 'Recipient wallet is not active'
+            }, status=status.HTTP_403_FORBIDDEN)
+        except InsufficientFunds as exc:
+            db_transaction.set_rollback(True)
+            return Response({
+                'error': 'INSUFFICIENT_BALANCE',
+                'message': f'Insufficient balance. Available: ₦{exc.available:,.2f}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            consume_daily_limit(sender_wallet, amount)
+        except DailyLimitExceeded as exc:
+            db_transaction.set_rollback(True)
+            return Response({
+                'error': 'DAILY_LIMIT_EXCEEDED',
+                'message': str(exc)
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        # Create ledger entries (audit trail), both legs in one INSERT
+        ledger.append_many([
+            # Debit sender
+            LedgerEntry(
+                transaction=transfer_out,
+                wallet=sender_wallet,
+                entry_type='DEBIT',
+                amount=amount,
+                balance_before=debit.before,
+                balance_after=debit.after,
+                description=f'Transfer to {recipient_username}: {description}'
+            ),
+            # Credit recipient
+            LedgerEntry(
+                transaction=transfer_in,
+                wallet=recipient_wallet,
+                entry_type='CREDIT',
+                amount=amount,
+                balance_before=credit.before,
+                balance_after=credit.after,
+                description=f'Transfer from {sender.username}: {description}'
+            ),
+        ])
+        rollups.record([rollups.movement(transfer_out),
+                        rollups.movement(transfer_in)])
+        outbox.emit([outbox.transfer_completed(transfer_out, transfer_in)])
+
+        transaction_data = TransactionSerializer(transfer_out).data
+        wallet_events.publish_on_commit([
+            wallet_events.Event(sender_wallet.pk, 'transaction', transaction_data),
+            wallet_events.balance_changed(
+                sender_wallet, debit.after, transfer_out.reference),
+            wallet_events.Event(recipient_wallet.pk, 'transaction',
+                                TransactionSerializer(transfer_in).data),
+            wallet_events.balance_changed(
+                recipient_wallet, credit.after, transfer_in.reference),
+        ])
+
+        payload = {
+            'transaction': transaction_data,
+            'balance_update': {
+                'previous_balance': str(debit.before),
+                'new_balance': str(debit.after),
+                'currency': sender_wallet.currency
+            },
+            'message': 'Transfer successful'
+        }
+        if idempotency_key:
+            idempotency.remember(idempotency_key, fingerprint, payload)
+
+        return Response(payload, status=status.HTTP_201_CREATED)
 
-        # Credit recipient
-        LedgerEntry.objects.create(
-            transaction=transfer_in,
-            wallet=recipient_wallet,
-            entry_type='CREDIT',
-            amount=amount,
-            balance_before=recipient_balance_before,
-            balance_after=recipient_wallet.balance,
-            description=f'Transfer from {sender.username}: {description}'
-        )
+
+class BulkTransferView(APIView):
+    """
+    Transfer money to many users in a single database transaction
+    """
+    permission_classes = [IsAuthenticated]
+
+    @with_wallet_locks
+    def post(self, request):
+        serializer = BulkTransferSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            results, sender_wallet, balance_before = execute_bulk_transfer(
+                request.user, serializer.validated_data['transfers'])
+        except BulkTransferError as exc:
+            db_transaction.set_rollback(True)
+            error_status = (status.HTTP_403_FORBIDDEN
+                            if exc.code in ('WALLET_NOT_ACTIVE', 'DAILY_LIMIT_EXCEEDED')
+                            else status.HTTP_400_BAD_REQUEST)
+            return Response({
+                'error': exc.code,
+                'message': exc.message
+            }, status=error_status)
+
+        completed = sum(1 for result in results
+                        if result['status'] == 'COMPLETED')
 
         return Response({
-            'transaction': TransactionSerializer(transfer_out).data,
+            'results': results,
+            'summary': {
+                'total': len(results),
+                'completed': completed,
+                'failed': len(results) - completed,
+                'amount_transferred': str(balance_before - sender_wallet.balance)
+            },
             'balance_update': {
-                'previous_balance': str(sender_balance_before),
+                'previous_balance': str(balance_before),
                 'new_balance': str(sender_wallet.balance),
                 'currency': sender_wallet.currency
             },
-            'message': 'Transfer successful'
-        }, status=status.HTTP_201_CREATED)
+            'message': 'Bulk transfer processed'
+        }, status=status.HTTP_201_CREATED if completed else status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+
+class WalletJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that loads the user together with their wallet and
+    profile in one joined query, so request.user.wallet and
+    request.user.profile are free for the serializer and the view.
+
+    When JWT_USER_CACHE_TTL is set, read-only requests reuse the resolved
+    user for that many seconds per access token and skip the database.
+    Wallet fields on a cached user may be that many seconds old.
+    """
+
+    def authenticate(self, request):
+        validated_token = self._validated_token(request)
+        if validated_token is None:
+            return None
+
+        cache_key = self._cache_key(request, validated_token)
+        if cache_key is None:
+            return self.get_user(validated_token), validated_token
+
+        user = cache.get(cache_key)
+        if user is None:
+            user = self.get_user(validated_token)
+            cache.set(cache_key, user, settings.JWT_USER_CACHE_TTL)
+        return user, validated_token
+
+    async def aauthenticate(self, request):
+        """
+        authenticate() for async views, through the async cache and ORM
+        """
+        validated_token = self._validated_token(request)
+        if validated_token is None:
+            return None
+
+        cache_key = self._cache_key(request, validated_token)
+        if cache_key is None:
+            return await self.aget_user(validated_token), validated_token
+
+        user = await cache.aget(cache_key)
+        if user is None:
+            user = await self.aget_user(validated_token)
+            await cache.aset(cache_key, user, settings.JWT_USER_CACHE_TTL)
+        return user, validated_token
+
+    def get_user(self, validated_token):
+        try:
+            user = self._user_query().get(**self._user_lookup(validated_token))
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        return self._check_active(user)
+
+    async def aget_user(self, validated_token):
+        try:
+            user = await self._user_query().aget(
+                **self._user_lookup(validated_token))
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        return self._check_active(user)
+
+    def _validated_token(self, request):
+        """The request's validated access token, or None without one"""
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        return self.get_validated_token(raw_token)
+
+    @staticmethod
+    def _cache_key(request, validated_token):
+        """
+        Cache key of the token's user, or None when the user must be read
+        from the database: caching is off, or the request may write
+        """
+        if not settings.JWT_USER_CACHE_TTL or request.method not in SAFE_METHODS:
+            return None
+        return f'auth:user:{validated_token[api_settings.JTI_CLAIM]}'
+
+    def _user_query(self):
+        return self.user_model.objects.select_related('wallet', 'profile')
+
+    @staticmethod
+    def _user_lookup(validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(
+                _("Token contained no recognizable user identification"))
+        return {api_settings.USER_ID_FIELD: user_id}
+
+    @staticmethod
+    def _check_active(user):
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
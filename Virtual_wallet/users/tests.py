@@ -1,3 +1,85 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from users.authentication import WalletJWTAuthentication
+
+
+class WalletJWTAuthenticationTests(TestCase):
+    """
+    Authentication resolves the user with wallet and profile in one query,
+    and only read-only requests may reuse a cached user.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+
+    def setUp(self):
+        cache.clear()
+        self.auth = WalletJWTAuthentication()
+        self.token = AccessToken.for_user(self.alice)
+
+    def _request(self, method='get', token=None):
+        return getattr(APIRequestFactory(), method)(
+            '/', HTTP_AUTHORIZATION=f'Bearer {token or self.token}')
+
+    def test_user_wallet_and_profile_load_in_one_query(self):
+        with self.assertNumQueries(1):
+            user, token = self.auth.authenticate(self._request())
+        with self.assertNumQueries(0):
+            self.assertEqual(user.wallet.user_id, self.alice.pk)
+            self.assertEqual(user.profile.user_id, self.alice.pk)
+        self.assertEqual(token['user_id'], self.alice.pk)
+
+    def test_async_authentication_loads_the_same_user(self):
+        with self.assertNumQueries(1):
+            user, _ = async_to_sync(self.auth.aauthenticate)(self._request())
+        with self.assertNumQueries(0):
+            self.assertEqual(user.wallet.user_id, self.alice.pk)
+            self.assertEqual(user.profile.user_id, self.alice.pk)
+
+    def test_missing_header_is_anonymous(self):
+        self.assertIsNone(self.auth.authenticate(APIRequestFactory().get('/')))
+
+    def test_user_is_read_from_database_when_cache_is_off(self):
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.auth.authenticate(self._request())
+
+    @override_settings(JWT_USER_CACHE_TTL=60)
+    def test_read_only_requests_reuse_cached_user(self):
+        with self.assertNumQueries(1):
+            self.auth.authenticate(self._request())
+        with self.assertNumQueries(0):
+            user, _ = self.auth.authenticate(self._request('head'))
+        self.assertEqual(user.wallet.user_id, self.alice.pk)
+
+        # The cache is per access token
+        with self.assertNumQueries(1):
+            self.auth.authenticate(
+                self._request(token=AccessToken.for_user(self.alice)))
+
+    @override_settings(JWT_USER_CACHE_TTL=60)
+    def test_unsafe_methods_never_use_the_cache(self):
+        for method in ('post', 'put', 'patch', 'delete'):
+            with self.assertNumQueries(1):
+                self.auth.authenticate(self._request(method))
+        self.assertIsNone(cache.get(f'auth:user:{self.token["jti"]}'))
+
+        # Also once a read-only request has cached the user
+        self.auth.authenticate(self._request())
+        with self.assertNumQueries(1):
+            self.auth.authenticate(self._request('post'))
+
+    @override_settings(JWT_USER_CACHE_TTL=60)
+    def test_async_read_only_requests_reuse_cached_user(self):
+        aauthenticate = async_to_sync(self.auth.aauthenticate)
+        aauthenticate(self._request())
+        with self.assertNumQueries(0):
+            aauthenticate(self._request())
+        with self.assertNumQueries(1):
+            aauthenticate(self._request('post'))
@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from config.async_api import AsyncAPIView
+from . import cache as balance_cache, events
+from .serializers import WalletSerializer
+from .views import balance_payload, balance_validators
+
+
+class WalletDetailView(AsyncAPIView):
+    """
+    Async twin of wallets.views.WalletDetailView
+
+    The wallet comes with the authenticated user, so no query is issued.
+    """
+
+    async def get(self, request):
+        return self.respond(WalletSerializer(request.user.wallet).data)
+
+
+class WalletBalanceView(AsyncAPIView):
+    """
+    Async twin of wallets.views.WalletBalanceView, with the same caching
+    and ETag / Last-Modified handling
+    """
+
+    async def get(self, request):
+        wallet = await balance_cache.aget_balance(request.user)
+        etag, last_modified = balance_validators(wallet)
+
+        # A 304 carries the validators too, as the full response would
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.respond(balance_payload(wallet))
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class WalletEventsView(AsyncAPIView):
+    """
+    Server-sent events stream of the authenticated wallet
+
+    Opens with a `snapshot` event (the balance endpoint's body), then sends
+    a `transaction` event for each new transaction and a `balance` event for
+    each balance change, as they commit. Idle streams get a keep-alive
+    comment every WALLET_EVENTS_HEARTBEAT_SECONDS.
+
+    The stream ends when the access token expires, or when the client
+    falls too far behind; clients reconnect with a current token and resume
+    from the new snapshot. Django 4.2 does not report disconnects of
+    streaming responses, so the token lifetime also bounds how long an
+    abandoned stream is kept.
+    """
+
+    async def get(self, request):
+        # Subscribe before reading the snapshot so no change falls between
+        subscription = events.subscribe(request.user.wallet.pk)
+        try:
+            snapshot = await balance_cache.aget_balance(request.user)
+        except BaseException:
+            subscription.close()
+            raise
+
+        response = StreamingHttpResponse(
+            events.Stream(subscription, self._stream(
+                subscription, snapshot, request.auth['exp'])),
+            content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx-style proxies from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def _stream(self, subscription, snapshot, expires_at):
+        try:
+            yield events.format_sse('snapshot', balance_payload(snapshot))
+            while True:
+                remaining = expires_at - time.time()
+                if remaining <= 0:
+                    return
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.get(),
+                        min(settings.WALLET_EVENTS_HEARTBEAT_SECONDS, remaining))
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                if event is None:
+                    return
+                yield events.format_sse(event.type, event.data)
+        finally:
+            subscription.close()
@@ -0,0 +1,119 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _owner_key(user_id):
+    return f'wallet:owner:{user_id}'
+
+
+def _balance_key(wallet_id):
+    return f'wallet:balance:{wallet_id}'
+
+
+def _generation_key(wallet_id):
+    return f'wallet:balance-generation:{wallet_id}'
+
+
+def _new_generation():
+    return uuid.uuid4().hex
+
+
+def snapshot(wallet):
+    """The fields the balance endpoint serves, in cacheable form"""
+    return {
+        'wallet_id': wallet.pk,
+        'balance': wallet.balance,
+        'pending_balance': wallet.pending_balance,
+        'currency': wallet.currency,
+        'updated_at': wallet.updated_at,
+    }
+
+
+# Columns snapshot() reads
+SNAPSHOT_FIELDS = (
+    'id', 'user_id', 'balance', 'pending_balance', 'currency', 'updated_at')
+
+
+def get_balance(user):
+    """
+    Balance snapshot for a user's wallet, read through the cache.
+
+    The user -> wallet id mapping never changes and is cached without
+    expiry; the snapshot itself is keyed by wallet id so money movements can
+    invalidate it without knowing the owner. A snapshot is stored under the
+    wallet's generation read before the row, and served only while that is
+    still the current generation, so a reader that loaded the row before a
+    commit cannot cache it past the commit's invalidation.
+    """
+    from .models import Wallet
+
+    owner_key = _owner_key(user.pk)
+    wallet_id = cache.get(owner_key)
+    if wallet_id is None:
+        wallet_id = Wallet.objects.values_list('pk', flat=True).get(
+            user_id=user.pk)
+        cache.set(owner_key, wallet_id, None)
+
+    balance_key = _balance_key(wallet_id)
+    generation_key = _generation_key(wallet_id)
+    found = cache.get_many([balance_key, generation_key])
+    generation = found.get(generation_key)
+    if generation is None:
+        generation = _new_generation()
+        if not cache.add(generation_key, generation, None):
+            generation = cache.get(generation_key)
+    cached = found.get(balance_key)
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+
+    wallet = Wallet.objects.only(*SNAPSHOT_FIELDS).get(pk=wallet_id)
+    data = snapshot(wallet)
+    cache.set(balance_key, (generation, data), settings.BALANCE_CACHE_TIMEOUT)
+    return data
+
+
+async def aget_balance(user):
+    """get_balance() for async views"""
+    from .models import Wallet
+
+    owner_key = _owner_key(user.pk)
+    wallet_id = await cache.aget(owner_key)
+    if wallet_id is None:
+        wallet_id = await Wallet.objects.values_list('pk', flat=True).aget(
+            user_id=user.pk)
+        await cache.aset(owner_key, wallet_id, None)
+
+    balance_key = _balance_key(wallet_id)
+    generation_key = _generation_key(wallet_id)
+    found = await cache.aget_many([balance_key, generation_key])
+    generation = found.get(generation_key)
+    if generation is None:
+        generation = _new_generation()
+        if not await cache.aadd(generation_key, generation, None):
+            generation = await cache.aget(generation_key)
+    cached = found.get(balance_key)
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+
+    wallet = await Wallet.objects.only(*SNAPSHOT_FIELDS).aget(pk=wallet_id)
+    data = snapshot(wallet)
+    await cache.aset(balance_key, (generation, data),
+                     settings.BALANCE_CACHE_TIMEOUT)
+    return data
+
+
+def invalidate_balances(wallet_ids):
+    """
+    Retire cached balances once the current DB transaction commits.
+
+    Each wallet gets a new generation rather than a deleted snapshot: a
+    reader still holding the old generation may yet store its snapshot,
+    but nobody will serve it. Generations are random rather than counters
+    so an evicted generation key cannot bring old snapshots back.
+    """
+    keys = [_generation_key(wallet_id) for wallet_id in wallet_ids]
+    transaction.on_commit(lambda: cache.set_many(
+        {key: _new_generation() for key in keys}, None))
@@ -0,0 +1,234 @@
+"""
+Wallet event pub/sub for the server-sent events stream.
+
+Writers call publish_on_commit() inside the transaction that moved money;
+once it commits, the events go to the configured backend (the
+WALLET_EVENTS_BACKEND setting), which hands them to the Hub of every server
+process. A Hub fans each event out to the streams subscribed to its wallet,
+so one notification reaches any number of connected clients and no stream
+ever queries for changes.
+
+LocalBackend delivers straight to this process's Hub and suits a single
+process serving both the writes and the streams. RedisBackend publishes on
+a Redis channel that every process listens to, for several workers or
+separate WSGI and ASGI deployments.
+"""
+import asyncio
+import json
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+# One published event; data must be JSON serializable
+Event = namedtuple('Event', ['wallet_id', 'type', 'data'])
+
+# Tells a subscription its stream should end
+_CLOSE = object()
+
+
+class Subscription:
+    """
+    The events of one wallet for one stream, buffered on the stream's loop.
+
+    A stream that falls WALLET_EVENTS_QUEUE_SIZE events behind is closed
+    rather than allowed to grow without bound; its client reconnects and
+    starts again from a fresh snapshot.
+    """
+
+    def __init__(self, hub, wallet_id, loop):
+        self.hub = hub
+        self.wallet_id = str(wallet_id)
+        self.loop = loop
+        self.queue = asyncio.Queue()
+        self.overflowed = False
+
+    def put(self, event):
+        """Called on the subscription's loop"""
+        if self.overflowed:
+            return
+        if self.queue.qsize() >= settings.WALLET_EVENTS_QUEUE_SIZE:
+            self.overflowed = True
+            event = _CLOSE
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        """The next Event, or None once the stream should end"""
+        event = await self.queue.get()
+        return None if event is _CLOSE else event
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class Stream:
+    """
+    A subscription's response body: iterates chunks, and close() releases
+    the subscription. Django closes the response once it finishes sending
+    it, so the subscription is released without waiting for the chunk
+    generator to be garbage collected.
+    """
+
+    def __init__(self, subscription, chunks):
+        self.subscription = subscription
+        self.chunks = chunks
+
+    def __aiter__(self):
+        return self.chunks
+
+    def close(self):
+        self.subscription.close()
+
+
+class Hub:
+    """In-process fan-out of events to subscriptions, by wallet"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def subscribe(self, wallet_id):
+        """Subscribe the running event loop to a wallet's events"""
+        subscription = Subscription(self, wallet_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.setdefault(
+                subscription.wallet_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.wallet_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.wallet_id]
+
+    def deliver(self, events):
+        """Hand events to their wallets' subscriptions; safe from any thread"""
+        for event in events:
+            with self._lock:
+                subscriptions = list(
+                    self._subscriptions.get(str(event.wallet_id), ()))
+            for subscription in subscriptions:
+                try:
+                    subscription.loop.call_soon_threadsafe(
+                        subscription.put, event)
+                except RuntimeError:
+                    # Its loop has shut down
+                    self.unsubscribe(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscriptions.values())
+
+
+hub = Hub()
+
+
+class LocalBackend:
+    """Delivers events to this process's Hub only"""
+
+    def __init__(self, **options):
+        pass
+
+    def publish(self, events):
+        hub.deliver(events)
+
+    def listen(self):
+        """Nothing to listen to; published events are already delivered"""
+
+
+class RedisBackend:
+    """
+    Publishes events on one Redis channel; every process runs a listener
+    (started by its first stream) that delivers them to its Hub.
+
+    Needs the `redis` package (5.0+) and WALLET_EVENTS_REDIS_URL or
+    REDIS_URL.
+    """
+    RECONNECT_SECONDS = 1
+
+    def __init__(self, url=None, channel='wallet-events', **options):
+        self.url = url or settings.WALLET_EVENTS_REDIS_URL or settings.REDIS_URL
+        if not self.url:
+            raise ValueError('RedisBackend needs WALLET_EVENTS_REDIS_URL or REDIS_URL')
+        self.channel = channel
+        self._client = None
+        self._listeners = {}
+
+    def publish(self, events):
+        import redis
+
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url)
+        self._client.publish(self.channel, json.dumps(
+            [list(event) for event in events], cls=DjangoJSONEncoder))
+
+    def listen(self):
+        """Start this loop's listener unless it is running"""
+        loop = asyncio.get_running_loop()
+        listener = self._listeners.get(loop)
+        if listener is None or listener.done():
+            self._listeners[loop] = loop.create_task(self._listen())
+
+    async def _listen(self):
+        import redis.asyncio
+
+        while True:
+            client = redis.asyncio.Redis.from_url(self.url)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            hub.deliver(Event(*item)
+                                        for item in json.loads(message['data']))
+            except redis.RedisError:
+                await asyncio.sleep(self.RECONNECT_SECONDS)
+            finally:
+                await client.aclose()
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(settings.WALLET_EVENTS_BACKEND)()
+    return _backend
+
+
+def subscribe(wallet_id):
+    """Subscribe the calling stream to a wallet's events"""
+    get_backend().listen()
+    return hub.subscribe(wallet_id)
+
+
+def publish_on_commit(events):
+    """
+    Publish events once the current DB transaction commits. A backend
+    failure is logged and does not fail the committed request.
+    """
+    events = list(events)
+    transaction.on_commit(lambda: get_backend().publish(events), robust=True)
+
+
+def balance_changed(wallet, balance, reference):
+    """Event for a wallet's available balance after the movement reference"""
+    return Event(wallet.pk, 'balance', {
+        'wallet_id': str(wallet.pk),
+        'available_balance': str(balance),
+        'currency': wallet.currency,
+        'reference': reference,
+    })
+
+
+def format_sse(event_type, data):
+    """An event in text/event-stream framing"""
+    return (f'event: {event_type}\n'
+            f'data: {json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)}\n\n')
@@ -0,0 +1,56 @@
+from datetime import date, datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from transactions.models import Transaction
+from wallets.models import DailySpendCounter
+
+
+# Transaction types that count against Wallet.daily_limit
+SPEND_TYPES = ('TRANSFER_OUT', 'WITHDRAWAL')
+
+
+class Command(BaseCommand):
+    help = 'Rebuild daily spend counters from Transaction history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Day to rebuild (YYYY-MM-DD), default today')
+        parser.add_argument('--wallet', help='Only rebuild this wallet id')
+
+    def handle(self, *args, **options):
+        try:
+            day = (date.fromisoformat(options['date']) if options['date']
+                   else timezone.localdate())
+        except ValueError:
+            raise CommandError(f"Invalid --date '{options['date']}'")
+
+        # The local day as a created_at range, like consume_daily_limit's
+        # timezone.localdate(), rather than __date so an index can be used
+        day_start = timezone.make_aware(datetime.combine(day, time.min))
+        spent = Transaction.objects.filter(
+            transaction_type__in=SPEND_TYPES,
+            status='COMPLETED',
+            created_at__gte=day_start,
+            created_at__lt=day_start + timedelta(days=1),
+        )
+        counters = DailySpendCounter.objects.filter(day=day)
+        if options['wallet']:
+            spent = spent.filter(wallet_id=options['wallet'])
+            counters = counters.filter(wallet_id=options['wallet'])
+
+        totals = (spent.order_by()
+                  .values('wallet_id').annotate(amount=Sum('amount')))
+
+        with transaction.atomic():
+            counters.delete()
+            DailySpendCounter.objects.bulk_create([
+                DailySpendCounter(
+                    wallet_id=row['wallet_id'], day=day, amount=row['amount'])
+                for row in totals
+            ], batch_size=500)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {len(totals)} spend counter(s) for {day}'))
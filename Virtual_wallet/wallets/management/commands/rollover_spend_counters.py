@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from wallets.models import DailySpendCounter
+
+
+class Command(BaseCommand):
+    help = 'Nightly rollover: drop daily spend counters for past days'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-days', type=int, default=7,
+                            help='Days of counters to keep, including today')
+
+    def handle(self, *args, **options):
+        # Counters are keyed by day, so a new day starts from zero on its
+        # own; the rollover only keeps the table small
+        cutoff = timezone.localdate() - timedelta(days=options['keep_days'] - 1)
+        deleted, _ = DailySpendCounter.objects.filter(day__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Removed {deleted} spend counter(s) older than {cutoff}'))
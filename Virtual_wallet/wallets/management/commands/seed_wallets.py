@@ -0,0 +1,127 @@
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+
+import django
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from wallets.seeding import generate_batch, insert_batch
+
+
+def _setup_worker():
+    # Workers started with the spawn method import Django from scratch
+    if not apps.ready:
+        django.setup()
+
+
+def _generated(pool, jobs, window):
+    """Batches of jobs generated in the pool, in job order, window in flight"""
+    pending = deque()
+    for job in jobs:
+        pending.append(pool.submit(generate_batch, *job))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class Command(BaseCommand):
+    help = ('Bulk-insert synthetic users, wallets and a consistent '
+            'transaction and ledger history, for benchmarks')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000,
+                            help='Users (with profile and wallet) to create')
+        parser.add_argument('--transactions', type=int, default=50,
+                            help='Transactions per user, on average')
+        parser.add_argument('--days', type=int, default=365,
+                            help='Days of history, ending as the --end day starts')
+        parser.add_argument('--end', default=None,
+                            help='Day (YYYY-MM-DD) whose midnight ends the '
+                                 'history, default today; not in the future')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='The same seed and other options, --end '
+                                 'and --batch-size included, give the same data')
+        parser.add_argument('--prefix', default='seed_user_',
+                            help='Usernames are <prefix><n>')
+        parser.add_argument('--start', type=int, default=0,
+                            help='n of the first user')
+        parser.add_argument('--password', default=None,
+                            help='Password of every user; unusable by default')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Users per batch; a batch only transfers '
+                                 'between its own wallets')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Processes generating batches')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        users = options['users']
+        prefix = options['prefix']
+        first = options['start']
+        self._check_free(prefix, first, users)
+
+        today = timezone.localdate()
+        try:
+            end_day = (date.fromisoformat(options['end']) if options['end']
+                       else today)
+        except ValueError:
+            raise CommandError(f"Invalid --end '{options['end']}'")
+        if end_day > today:
+            raise CommandError('--end cannot be later than today')
+        # History stops before today so no spend counter is affected
+        end = timezone.make_aware(datetime.combine(end_day, datetime.min.time()))
+        start = end - timedelta(days=options['days'])
+        # Hashing is deliberately slow, so every user shares one hash
+        password = make_password(options['password'])
+        batch_size = max(1, options['batch_size'])
+        jobs = [
+            (options['seed'], prefix, n, min(batch_size, first + users - n),
+             options['transactions'], start, end, password)
+            for n in range(first, first + users, batch_size)
+        ]
+
+        workers = max(1, options['workers'])
+        totals = {'users': 0, 'transactions': 0, 'entries': 0}
+        if workers == 1 or len(jobs) == 1:
+            batches = (generate_batch(*job) for job in jobs)
+            self._insert(batches, totals)
+        else:
+            # Forked workers must not inherit the parent's open connection
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers,
+                                     initializer=_setup_worker) as pool:
+                self._insert(_generated(pool, jobs, workers * 2), totals)
+
+        elapsed = time.monotonic() - started
+        rows = sum(totals.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {totals['users']} user(s), {totals['transactions']} "
+            f"transaction(s) and {totals['entries']} ledger entr(ies) in "
+            f"{elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)"))
+
+    def _check_free(self, prefix, first, count):
+        taken = User.objects.filter(username__startswith=prefix).values_list(
+            'username', flat=True)
+        for username in taken.iterator():
+            suffix = username[len(prefix):]
+            if suffix.isdigit() and first <= int(suffix) < first + count:
+                raise CommandError(
+                    f'User {username} already exists; choose another '
+                    f'--prefix or --start')
+
+    def _insert(self, batches, totals):
+        for batch in batches:
+            insert_batch(batch)
+            totals['users'] += len(batch.users)
+            totals['transactions'] += len(batch.transactions)
+            totals['entries'] += len(batch.entries)
+            self.stdout.write(
+                f"  {totals['users']} user(s), {totals['transactions']} "
+                f"transaction(s)")
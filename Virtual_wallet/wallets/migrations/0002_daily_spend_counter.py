@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:17
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallets', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySpendCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spend_counters', to='wallets.wallet')),
+            ],
+            options={
+                'verbose_name': 'Daily Spend Counter',
+                'verbose_name_plural': 'Daily Spend Counters',
+                'db_table': 'wallet_daily_spend',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyspendcounter',
+            constraint=models.UniqueConstraint(fields=('wallet', 'day'), name='unique_wallet_daily_spend'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:24
+
+import config.ids
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # State only: the default is applied by Django, existing ids are kept
+
+    dependencies = [
+        ('wallets', '0002_daily_spend_counter'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='wallet',
+                    name='id',
+                    field=models.UUIDField(default=config.ids.uuid7, editable=False, primary_key=True, serialize=False),
+                ),
+            ],
+        ),
+    ]
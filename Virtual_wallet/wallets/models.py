@@ -1,10 +1,156 @@
 from django.dispatch import receiver
 from django.db.models.signals import post_save
-from django.db import models
+from django.db import connections, models
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.sql import UpdateQuery
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
+from django.utils import timezone
+from collections import namedtuple
 from decimal import Decimal
-import uuid
+from config.ids import uuid7
+from config.instrumentation import lock_time
+
+from .cache import invalidate_balances
+
+
+class InsufficientFunds(Exception):
+    """Raised when a debit would take a wallet balance below zero"""
+
+    def __init__(self, message, available=None):
+        super().__init__(message)
+        # The balance the failed debit found
+        self.available = available
+
+
+class WalletNotActive(Exception):
+    """Raised when money would move in or out of a wallet that is not ACTIVE"""
+
+    def __init__(self, wallet_id, status):
+        super().__init__(f'Wallet {wallet_id} is {status}')
+        self.wallet_id = wallet_id
+        self.status = status
+
+
+class DailyLimitExceeded(Exception):
+    """Raised when a debit would take a wallet past its daily_limit"""
+
+
+# Wallet balance around a single debit or credit, for the ledger
+BalanceChange = namedtuple('BalanceChange', ['before', 'after'])
+
+
+class WalletQuerySet(models.QuerySet):
+
+    def debit(self, pk, amount):
+        """
+        Subtract amount from an ACTIVE wallet with one conditional UPDATE
+        (SET balance = balance - amount WHERE balance >= amount AND
+        status = 'ACTIVE').
+
+        Only balance and updated_at are written. The UPDATE itself takes the
+        row lock, so no prior locking read is needed to check funds or
+        status. Raises WalletNotActive or InsufficientFunds, with what the
+        failed UPDATE found, when the conditions do not hold.
+        """
+        after = self._add_to_balance(pk, -amount, balance__gte=amount)
+        return BalanceChange(before=after + amount, after=after)
+
+    def credit(self, pk, amount):
+        """
+        Add amount to an ACTIVE wallet with one UPDATE of balance and
+        updated_at; raises WalletNotActive otherwise.
+        """
+        after = self._add_to_balance(pk, amount)
+        return BalanceChange(before=after - amount, after=after)
+
+    def credit_many(self, credits):
+        """
+        Credit many wallets with one set-based UPDATE.
+
+        credits maps wallet pk to the amount to add. Callers that need exact
+        before/after balances for the ledger must hold the wallet locks.
+        """
+        if not credits:
+            return 0
+        updated = self.filter(pk__in=credits).update(
+            balance=F('balance') + Case(
+                *[When(pk=pk, then=Value(amount))
+                  for pk, amount in credits.items()],
+                output_field=models.DecimalField(
+                    max_digits=15, decimal_places=2)
+            ),
+            updated_at=timezone.now()
+        )
+        invalidate_balances(credits)
+        return updated
+
+    def release_pending(self, holds):
+        """
+        Release pending holds with one set-based UPDATE.
+
+        holds maps wallet pk to the amount to take off pending_balance,
+        which is never taken below zero.
+        """
+        if not holds:
+            return 0
+        invalidate_balances(holds)
+        return self.filter(pk__in=holds).update(
+            pending_balance=Greatest(
+                F('pending_balance') - Case(
+                    *[When(pk=pk, then=Value(amount))
+                      for pk, amount in holds.items()],
+                    output_field=models.DecimalField(
+                        max_digits=15, decimal_places=2)
+                ),
+                Value(Decimal('0.00'))
+            ),
+            updated_at=timezone.now()
+        )
+
+    def _add_to_balance(self, pk, amount, **conditions):
+        """
+        Add amount to the balance of ACTIVE wallet pk, where conditions
+        hold, and return the new balance.
+
+        PostgreSQL hands the new balance back with UPDATE ... RETURNING;
+        elsewhere a SELECT follows, which sees our own UPDATE's result as
+        the row is locked by it.
+        """
+        rows = self.filter(pk=pk, status='ACTIVE', **conditions)
+        values = {'balance': F('balance') + amount,
+                  'updated_at': timezone.now()}
+        db = connections[self.db]
+        after = None
+        with lock_time():
+            if db.vendor == 'postgresql':
+                query = rows.query.chain(UpdateQuery)
+                query.add_update_values(values)
+                sql, params = query.get_compiler(self.db).as_sql()
+                with db.cursor() as cursor:
+                    cursor.execute(
+                        f'{sql} RETURNING {db.ops.quote_name("balance")}',
+                        params)
+                    row = cursor.fetchone()
+                updated = row is not None
+                after = row and row[0]
+            else:
+                updated = rows.update(**values)
+
+        if not updated:
+            found = self.filter(pk=pk).values_list('status', 'balance').first()
+            if found is None:
+                raise Wallet.DoesNotExist(f'Wallet {pk} does not exist')
+            status, balance = found
+            if status != 'ACTIVE':
+                raise WalletNotActive(pk, status)
+            raise InsufficientFunds(f'Wallet {pk} cannot cover {-amount}',
+                                    available=balance)
+        invalidate_balances([pk])
+        if after is None:
+            after = self.filter(pk=pk).values_list('balance', flat=True).get()
+        return after
 
 
 class Wallet(models.Model):
@@ -17,7 +163,7 @@ class Wallet(models.Model):
         ('CLOSED', 'Closed'),
     ]
 
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     user = models.OneToOneField(
         User, on_delete=models.CASCADE, related_name='wallet')
     balance = models.DecimalField(
@@ -44,6 +190,8 @@ class Wallet(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = WalletQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.user.username}'s Wallet - {self.currency} {self.balance}"
 
@@ -52,12 +200,53 @@ class Wallet(models.Model):
         """Total balance including pending"""
         return self.balance + self.pending_balance
 
+    def debit(self, amount):
+        """Debit this wallet in the database and sync the in-memory balance"""
+        change = Wallet.objects.debit(self.pk, amount)
+        self.balance = change.after
+        return change
+
+    def credit(self, amount):
+        """Credit this wallet in the database and sync the in-memory balance"""
+        change = Wallet.objects.credit(self.pk, amount)
+        self.balance = change.after
+        return change
+
     class Meta:
         db_table = 'wallets'
         verbose_name = 'Wallet'
         verbose_name_plural = 'Wallets'
 
 
+class DailySpendCounter(models.Model):
+    """
+    Running total of a wallet's outgoing money for one day.
+
+    Kept for every wallet, with or without a daily_limit, and updated in
+    the same DB transaction as the debit, so checking
+    Wallet.daily_limit is a single indexed row operation instead of a SUM()
+    over the day's transactions.
+    """
+    wallet = models.ForeignKey(
+        Wallet, on_delete=models.CASCADE, related_name='spend_counters')
+    day = models.DateField()
+    amount = models.DecimalField(
+        max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.wallet_id} - {self.day} - {self.amount}"
+
+    class Meta:
+        db_table = 'wallet_daily_spend'
+        verbose_name = 'Daily Spend Counter'
+        verbose_name_plural = 'Daily Spend Counters'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['wallet', 'day'], name='unique_wallet_daily_spend'),
+        ]
+
+
 # Signal to automatically create Wallet when User is created
 
 
@@ -73,3 +262,9 @@ def create_user_wallet(sender, instance, created, **kwargs):
         # Only create wallet if one doesn't exist
         if not hasattr(instance, 'wallet'):
             Wallet.objects.create(user=instance)
+
+
+@receiver(post_save, sender=Wallet)
+def invalidate_wallet_balance(sender, instance, **kwargs):
+    # Covers full saves (admin edits); F() updates invalidate themselves
+    invalidate_balances([instance.pk])
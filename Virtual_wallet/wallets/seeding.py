@@ -0,0 +1,271 @@
+"""
+Synthetic users and wallets with a consistent history, for benchmarks and
+capacity planning.
+
+generate_batch() builds one batch of users in memory: their profiles,
+wallets, and a history of deposits, withdrawals and transfers between the
+batch's wallets, with the ledger entries and daily rollups they imply.
+Every chain starts from zero and each wallet's balance is the end of its
+chain, so seeded data reconciles cleanly. A batch is a pure function of
+its arguments - ids and references included - so batches can be generated
+by a pool of processes and still come out the same. Transfers stay within
+a batch and its random stream is keyed on its first user, so the batch
+size shapes the data as much as the seed does.
+
+Transactions, ledger entries and rollups leave generate_batch() as rows of
+column values already adapted for the database, so the preparation work
+stays in the generating process and the one writing only runs multi-row
+INSERTs. insert_batch() writes users, profiles and wallets with
+bulk_create: either way no post_save signals fire, so no profile or wallet
+is created twice, and the given timestamps are kept instead of auto_now.
+"""
+import random
+import uuid
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import (
+    DEFAULT_DB_ALIAS, connection, connections, models, transaction)
+from django.utils import timezone
+
+from config.ids import uuid7_from
+from ledger.models import LedgerEntry
+from transactions.models import (
+    DailyTransactionRollup, Transaction, generate_reference)
+from users.models import UserProfile
+from .models import Wallet
+
+
+BULK_CREATE_BATCH_SIZE = 500
+
+# Relative frequency of each kind of event; a transfer writes two
+# transactions, one per wallet
+EVENT_WEIGHTS = {'DEPOSIT': 3, 'WITHDRAWAL': 1, 'TRANSFER': 4}
+
+# Amount ranges, in kobo
+DEPOSIT_RANGE = (1_000, 5_000_000)
+DEBIT_RANGE = (100, 2_000_000)
+
+CURRENCY = 'NGN'
+
+# users, profiles and wallets are unsaved instances; the other fields are
+# lists of rows, see _columns()
+Batch = namedtuple('Batch', [
+    'users', 'profiles', 'wallets', 'transactions', 'entries', 'rollups'])
+
+
+class _Ids:
+    """Deterministic UUIDs drawn from a batch's random generator"""
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def at(self, moment):
+        return uuid7_from(int(moment.timestamp() * 1000),
+                          self.rng.getrandbits(12), self.rng.getrandbits(62))
+
+    def uuid4(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+
+def _kobo(amount):
+    return Decimal(amount).scaleb(-2)
+
+
+def _columns(model):
+    """The fields a row of model holds: all but an auto-incremented key"""
+    return [field for field in model._meta.concrete_fields
+            if not isinstance(field, models.AutoField)]
+
+
+def _rows(model, instances):
+    fields = _columns(model)
+    # The wrapper itself: every lookup through the connection proxy
+    # costs a thread-local access
+    db = connections[DEFAULT_DB_ALIAS]
+    return [
+        tuple(field.get_db_prep_save(getattr(instance, field.attname), db)
+              for field in fields)
+        for instance in instances
+    ]
+
+
+def generate_batch(seed, prefix, first, count, transactions, start, end,
+                   password):
+    """
+    The Batch of users prefix<first> to prefix<first + count - 1>, with
+    about `transactions` transactions each between start and end.
+
+    password is the stored password hash shared by every user.
+    """
+    rng = random.Random(f'{seed}:{prefix}:{first}')
+    ids = _Ids(rng)
+
+    users, profiles, wallets = [], [], []
+    for n in range(first, first + count):
+        username = f'{prefix}{n}'
+        users.append(User(username=username, email=f'{username}@example.com',
+                          password=password, date_joined=start))
+        profiles.append(UserProfile(id=ids.uuid4(), created_at=start,
+                                    updated_at=start))
+        wallets.append(Wallet(id=ids.at(start), currency=CURRENCY,
+                              created_at=start, updated_at=start))
+
+    # Pick the events first: transfers count twice towards the target
+    kinds, weights = zip(*EVENT_WEIGHTS.items())
+    events, rows = [], 0
+    while rows < count * transactions:
+        kind = rng.choices(kinds, weights)[0]
+        if kind == 'TRANSFER' and count < 2:
+            kind = 'DEPOSIT'
+        events.append(kind)
+        rows += 2 if kind == 'TRANSFER' else 1
+    span = (end - start).total_seconds()
+    moments = sorted(start + timedelta(seconds=rng.random() * span)
+                     for _ in events)
+
+    balances = [0] * count
+    txns, entries = [], []
+    rollups = defaultdict(lambda: [0, 0, None])
+
+    def post(index, kind, amount, moment, uid=None, counterpart=None,
+             description=''):
+        """One completed transaction and its ledger entry for wallet index"""
+        wallet = wallets[index]
+        uid = uid or ids.at(moment)
+        credit = kind in ('DEPOSIT', 'TRANSFER_IN')
+        before = balances[index]
+        balances[index] += amount if credit else -amount
+        txn = Transaction(
+            id=uid, reference=generate_reference(kind, uid),
+            wallet_id=wallet.id, transaction_type=kind, amount=_kobo(amount),
+            currency=CURRENCY, status='COMPLETED', description=description,
+            initiated_at=moment, completed_at=moment, created_at=moment,
+            updated_at=moment)
+        if counterpart is not None:
+            txn.metadata = {'counterpart': counterpart}
+        txns.append(txn)
+        entries.append(LedgerEntry(
+            id=ids.at(moment), transaction_id=uid, wallet_id=wallet.id,
+            entry_type='CREDIT' if credit else 'DEBIT', amount=txn.amount,
+            balance_before=_kobo(before), balance_after=_kobo(balances[index]),
+            description=description, created_at=moment))
+        wallet.updated_at = moment
+
+        rollup = rollups[(index, timezone.localdate(moment), kind)]
+        rollup[0] += 1
+        rollup[1] += amount
+        rollup[2] = moment
+        return txn
+
+    for kind, moment in zip(events, moments):
+        sender = rng.randrange(count)
+        if kind != 'DEPOSIT' and balances[sender] < DEBIT_RANGE[0]:
+            # Nothing to spend yet
+            kind = 'DEPOSIT'
+
+        if kind == 'DEPOSIT':
+            post(sender, 'DEPOSIT', rng.randint(*DEPOSIT_RANGE), moment,
+                 description='Synthetic deposit')
+        elif kind == 'WITHDRAWAL':
+            amount = rng.randint(DEBIT_RANGE[0],
+                                 min(balances[sender], DEBIT_RANGE[1]))
+            post(sender, 'WITHDRAWAL', amount, moment,
+                 description='Synthetic withdrawal')
+        else:
+            recipient = rng.randrange(count - 1)
+            recipient += recipient >= sender
+            amount = rng.randint(DEBIT_RANGE[0],
+                                 min(balances[sender], DEBIT_RANGE[1]))
+            out_uid, in_uid = ids.at(moment), ids.at(moment)
+            transfer_out = post(
+                sender, 'TRANSFER_OUT', amount, moment, uid=out_uid,
+                counterpart=generate_reference('TRANSFER_IN', in_uid),
+                description=f'Transfer to {users[recipient].username}')
+            transfer_out.recipient_wallet_id = wallets[recipient].id
+            post(recipient, 'TRANSFER_IN', amount, moment, uid=in_uid,
+                 counterpart=transfer_out.reference,
+                 description=f'Transfer from {users[sender].username}')
+
+    for wallet, balance in zip(wallets, balances):
+        wallet.balance = _kobo(balance)
+
+    rollup_rows = [
+        DailyTransactionRollup(
+            wallet_id=wallets[index].id, day=day, transaction_type=kind,
+            currency=CURRENCY, count=number, total=_kobo(total),
+            updated_at=last)
+        for (index, day, kind), (number, total, last) in rollups.items()
+    ]
+    return Batch(users, profiles, wallets, _rows(Transaction, txns),
+                 _rows(LedgerEntry, entries),
+                 _rows(DailyTransactionRollup, rollup_rows))
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """
+    Write the auto_now / auto_now_add fields of models as set on the
+    instances instead of the current time. Changes the fields process-wide,
+    so only use it in a command, never while serving requests.
+    """
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False)
+        or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now = auto_now
+            field.auto_now_add = auto_now_add
+
+
+def _insert_rows(model, rows):
+    """INSERT rows of _columns(model), as many per statement as allowed"""
+    fields = _columns(model)
+    ops = connection.ops
+    size = min(ops.bulk_batch_size(fields, rows) or 1, BULK_CREATE_BATCH_SIZE)
+    head = 'INSERT INTO {} ({}) '.format(
+        ops.quote_name(model._meta.db_table),
+        ', '.join(ops.quote_name(field.column) for field in fields))
+    with connection.cursor() as cursor:
+        for offset in range(0, len(rows), size):
+            chunk = rows[offset:offset + size]
+            cursor.execute(
+                head + ops.bulk_insert_sql(
+                    fields, [['%s'] * len(fields)] * len(chunk)),
+                [value for row in chunk for value in row])
+
+
+def insert_batch(batch):
+    """Write a Batch in one DB transaction"""
+    with transaction.atomic():
+        User.objects.bulk_create(batch.users, batch_size=BULK_CREATE_BATCH_SIZE)
+        if batch.users and batch.users[0].pk is None:
+            # Backends that cannot return the new primary keys
+            pks = dict(User.objects.filter(
+                username__in=[user.username for user in batch.users]
+            ).values_list('username', 'pk'))
+            for user in batch.users:
+                user.pk = pks[user.username]
+
+        for user, profile, wallet in zip(batch.users, batch.profiles,
+                                         batch.wallets):
+            profile.user_id = wallet.user_id = user.pk
+        with explicit_timestamps(UserProfile, Wallet):
+            UserProfile.objects.bulk_create(
+                batch.profiles, batch_size=BULK_CREATE_BATCH_SIZE)
+            Wallet.objects.bulk_create(
+                batch.wallets, batch_size=BULK_CREATE_BATCH_SIZE)
+
+        _insert_rows(Transaction, batch.transactions)
+        _insert_rows(LedgerEntry, batch.entries)
+        _insert_rows(DailyTransactionRollup, batch.rollups)
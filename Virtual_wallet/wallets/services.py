@@ -0,0 +1,166 @@
+import operator
+import random
+import time
+from functools import reduce, wraps
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from config.instrumentation import lock_time
+from .models import DailyLimitExceeded, DailySpendCounter, Wallet
+
+
+# SQLSTATE codes PostgreSQL uses for lock contention
+LOCK_NOT_AVAILABLE = '55P03'
+DEADLOCK_DETECTED = '40P01'
+SERIALIZATION_FAILURE = '40001'
+
+RETRYABLE_PGCODES = {LOCK_NOT_AVAILABLE, DEADLOCK_DETECTED, SERIALIZATION_FAILURE}
+
+
+class WalletLockTimeout(APIException):
+    """Raised when wallet locks could not be acquired within the retry budget"""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Wallet is busy, please retry the request.'
+    default_code = 'WALLET_BUSY'
+
+
+def is_lock_conflict(exc):
+    """Whether an OperationalError was caused by lock contention"""
+    pgcode = getattr(exc.__cause__, 'pgcode', None)
+    if pgcode is not None:
+        return pgcode in RETRYABLE_PGCODES
+    # SQLite reports contention by message only
+    message = str(exc)
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+def set_lock_timeout():
+    """Bound how long the current transaction waits for row locks"""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT set_config('lock_timeout', %s, true)",
+                [f'{settings.WALLET_LOCK_TIMEOUT_MS}ms']
+            )
+
+
+def lock_wallets(*conditions):
+    """
+    Lock every wallet matching any of the given Q conditions.
+
+    All rows are locked by a single SELECT ... FOR UPDATE ordered by primary
+    key, so two money movements touching the same wallets always acquire
+    their locks in the same order and cannot deadlock each other. On
+    PostgreSQL the wait is bounded by WALLET_LOCK_TIMEOUT_MS, and the lock
+    is FOR NO KEY UPDATE, the one balance UPDATEs take: it still serialises
+    money movements but does not block the KEY SHARE locks that inserting
+    transactions, ledger entries and counters referencing the wallet take.
+
+    Must be called inside a transaction, normally one opened by
+    with_wallet_locks. Returns the locked wallets ordered by primary key.
+    """
+    set_lock_timeout()
+    with lock_time():
+        return list(
+            Wallet.objects.select_for_update(no_key=True, of=('self',))
+            .select_related('user')
+            .filter(reduce(operator.or_, conditions))
+            .order_by('pk')
+        )
+
+
+def transfer_funds(source, destination, amount):
+    """
+    Move amount from source to destination with conditional F() updates.
+
+    The two UPDATEs are issued in primary key order, so the row locks they
+    take are acquired in the same order as lock_wallets and concurrent
+    transfers stay deadlock-free without a prior locking read. Raises
+    WalletNotActive if either wallet is not ACTIVE and InsufficientFunds if
+    source cannot cover amount.
+
+    Returns the (debit, credit) BalanceChange pair.
+    """
+    set_lock_timeout()
+    changes = {}
+    for wallet in sorted((source, destination), key=lambda w: w.pk):
+        if wallet is source:
+            changes['debit'] = source.debit(amount)
+        else:
+            changes['credit'] = destination.credit(amount)
+    return changes['debit'], changes['credit']
+
+
+def consume_daily_limit(wallet, amount):
+    """
+    Add amount to the wallet's spend counter for today and check it against
+    the wallet's daily_limit.
+
+    Every debit is counted, whether or not the wallet has a limit, so the
+    counter always holds the day's outgoing total as rebuild_spend_counters
+    computes it, and a limit set during the day applies to what was already
+    spent. A conditional UPDATE on today's counter row both checks and
+    consumes the limit; the row is created on the first debit of the day.
+    Must run in the same DB transaction as the debit, after the wallet
+    locks, so a rolled back transfer also rolls back its spend. Raises
+    DailyLimitExceeded when the limit would be passed.
+    """
+    limit = wallet.daily_limit
+    counters = DailySpendCounter.objects.filter(
+        wallet_id=wallet.pk, day=timezone.localdate())
+    within_limit = (counters if limit is None
+                    else counters.filter(amount__lte=limit - amount))
+    if within_limit.update(
+            amount=F('amount') + amount, updated_at=timezone.now()):
+        return
+
+    # Without a limit the UPDATE only misses when today's row is missing
+    if limit is None or (amount <= limit and not counters.exists()):
+        try:
+            with transaction.atomic():
+                DailySpendCounter.objects.create(
+                    wallet_id=wallet.pk, day=timezone.localdate(),
+                    amount=amount)
+            return
+        except IntegrityError:
+            # A concurrent debit created today's row first
+            return consume_daily_limit(wallet, amount)
+
+    raise DailyLimitExceeded(
+        f'Daily transfer limit of ₦{limit:,.2f} exceeded')
+
+
+def with_wallet_locks(func):
+    """
+    Run func in a database transaction, retrying it on lock contention.
+
+    A lock timeout or deadlock aborts the whole transaction, so the retry
+    re-runs func from the start with a short jittered backoff. When called
+    inside an existing transaction the outer block owns retries and func is
+    run once.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if connection.in_atomic_block:
+            with transaction.atomic():
+                return func(*args, **kwargs)
+
+        retries = settings.WALLET_LOCK_MAX_RETRIES
+        for attempt in range(retries + 1):
+            try:
+                with transaction.atomic():
+                    return func(*args, **kwargs)
+            except OperationalError as exc:
+                if not is_lock_conflict(exc):
+                    raise
+                if attempt == retries:
+                    raise WalletLockTimeout() from exc
+            with lock_time():
+                time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+
+    return wrapper
@@ -1,3 +1,271 @@
-from django.test import TestCase
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from transactions.models import DailyTransactionRollup, Transaction
+from wallets import cache as balance_cache, seeding
+from wallets.models import DailySpendCounter, Wallet
+from wallets.services import consume_daily_limit, with_wallet_locks
+
+
+class WalletBalanceCacheTests(TestCase):
+    """
+    The balance endpoint answers polls from the cache with a 304 while the
+    wallet is unchanged, and serves the new balance once money moves.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+        Wallet.objects.filter(user=cls.alice).update(balance=Decimal('100.00'))
+
+    def setUp(self):
+        # Balances cached by earlier tests outlive their rolled back rows
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(pk=self.alice.pk))
+
+    def _balance(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse('wallet-balance'), **headers)
+
+    def test_unchanged_balance_is_not_modified(self):
+        first = self._balance()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()['available_balance'], '100.00')
+
+        with self.assertNumQueries(0):
+            again = self._balance(first['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again['ETag'], first['ETag'])
+
+    def test_debit_invalidates_cached_balance(self):
+        first = self._balance()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Wallet.objects.debit(self.alice.wallet.pk, Decimal('30.00'))
+
+        after = self._balance(first['ETag'])
+        self.assertEqual(after.status_code, 200)
+        self.assertEqual(after.json()['available_balance'], '70.00')
+        self.assertNotEqual(after['ETag'], first['ETag'])
+        self.assertEqual(self._balance(after['ETag']).status_code, 304)
+
+    def test_snapshot_loaded_before_a_commit_is_not_served_after_it(self):
+        snapshot = balance_cache.snapshot
+
+        # The debit commits after the reader loaded the row but before it
+        # caches what it loaded
+        def commit_debit_first(wallet):
+            with self.captureOnCommitCallbacks(execute=True):
+                Wallet.objects.debit(wallet.pk, Decimal('30.00'))
+            return snapshot(wallet)
+
+        with mock.patch.object(balance_cache, 'snapshot', commit_debit_first):
+            stale = self._balance()
+        self.assertEqual(stale.json()['available_balance'], '100.00')
+
+        self.assertEqual(self._balance().json()['available_balance'], '70.00')
+
+
+class DailySpendLimitTests(TestCase):
+    """
+    Transfers count against today's spend counter, which the daily_limit is
+    checked against and which rebuild_spend_counters reproduces exactly.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+        User.objects.create_user('bob', 'bob@example.com', 'pass1234')
+        Wallet.objects.filter(user=cls.alice).update(balance=Decimal('100.00'))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(pk=self.alice.pk))
+
+    def _set_limit(self, limit):
+        Wallet.objects.filter(user=self.alice).update(daily_limit=limit)
+
+    def _transfer(self, amount):
+        # A fresh user, so the wallet's current daily_limit is seen
+        self.client.force_authenticate(User.objects.get(pk=self.alice.pk))
+        return self.client.post(reverse('transfer'), {
+            'recipient_username': 'bob', 'amount': amount}, format='json')
+
+    def _spent(self):
+        return (DailySpendCounter.objects
+                .filter(wallet__user=self.alice, day=timezone.localdate())
+                .values_list('amount', flat=True).first())
+
+    def _balance(self):
+        return Wallet.objects.get(user=self.alice).balance
+
+    def test_limit_is_inclusive_and_rejects_the_next_cent(self):
+        self._set_limit(Decimal('50.00'))
+        self.assertEqual(self._transfer('60.00').status_code, 403)
+        self.assertIsNone(self._spent())
+
+        self.assertEqual(self._transfer('30.00').status_code, 201)
+        self.assertEqual(self._transfer('20.00').status_code, 201)
+        self.assertEqual(self._spent(), Decimal('50.00'))
+
+        response = self._transfer('0.01')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['error'], 'DAILY_LIMIT_EXCEEDED')
+        self.assertEqual(self._spent(), Decimal('50.00'))
+        self.assertEqual(self._balance(), Decimal('50.00'))
+
+    def test_spend_rolls_back_with_its_transfer(self):
+        wallet = Wallet.objects.get(user=self.alice)
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                consume_daily_limit(wallet, Decimal('10.00'))
+                raise RuntimeError('transfer failed after counting spend')
+        self.assertIsNone(self._spent())
+
+        self._transfer('10.00')
+        self._set_limit(Decimal('30.00'))
+        # Rejected after the debit: balance and spend both roll back
+        self.assertEqual(self._transfer('25.00').status_code, 403)
+        self.assertEqual(self._spent(), Decimal('10.00'))
+        self.assertEqual(self._balance(), Decimal('90.00'))
+
+    def test_counter_matches_rebuild_when_limit_is_set_midday(self):
+        self.assertEqual(self._transfer('15.00').status_code, 201)
+        self._set_limit(Decimal('40.00'))
+        # The morning's spend counts towards the new limit
+        self.assertEqual(self._transfer('30.00').status_code, 403)
+        self.assertEqual(self._transfer('25.00').status_code, 201)
+        self.assertEqual(self._spent(), Decimal('40.00'))
+
+        DailySpendCounter.objects.all().delete()
+        call_command('rebuild_spend_counters', stdout=StringIO())
+        self.assertEqual(self._spent(), Decimal('40.00'))
+
+    @override_settings(TIME_ZONE='Africa/Lagos')
+    def test_rebuild_counts_the_local_day(self):
+        day = timezone.localdate()
+        midnight = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+        wallet = Wallet.objects.get(user=self.alice)
+        # 00:30 in Lagos is still the previous day in UTC
+        for moment, amount in ((midnight + timedelta(minutes=30), '7.00'),
+                               (midnight - timedelta(minutes=30), '11.00')):
+            Transaction.objects.filter(pk=Transaction.objects.create(
+                wallet=wallet, transaction_type='TRANSFER_OUT', status='COMPLETED',
+                amount=Decimal(amount)).pk).update(created_at=moment)
+
+        call_command('rebuild_spend_counters', '--date', day.isoformat(),
+                     stdout=StringIO())
+        self.assertEqual(self._spent(), Decimal('7.00'))
+
+
+class ConcurrentSpendCounterTests(TransactionTestCase):
+    """Debits racing to create the day's counter row all get counted"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'pass1234')
+
+    @override_settings(WALLET_LOCK_MAX_RETRIES=50)
+    def test_concurrent_first_debits_share_one_row(self):
+        wallet = Wallet.objects.get(user=self.alice)
+        start = threading.Barrier(8)
+
+        @with_wallet_locks
+        def debit():
+            consume_daily_limit(wallet, Decimal('5.00'))
+
+        def run(_):
+            try:
+                start.wait()
+                debit()
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(run, range(8)))
+
+        counter = DailySpendCounter.objects.get(wallet=wallet)
+        self.assertEqual(counter.amount, Decimal('40.00'))
+
+
+class SeedWalletsTests(TestCase):
+    """
+    Seeded history must reconcile, match a rollup rebuild, and depend on
+    nothing but the options, --end included.
+    """
+
+    def _seed(self, **options):
+        call_command('seed_wallets', users=6, transactions=10, days=30,
+                     batch_size=4, workers=1, prefix='seed_',
+                     stdout=StringIO(), **options)
+
+    def _rollups(self):
+        return sorted(DailyTransactionRollup.objects.values_list(
+            'wallet_id', 'day', 'transaction_type', 'currency', 'count', 'total'))
+
+    def test_seeded_history_is_consistent(self):
+        self._seed(seed=3)
+
+        users = User.objects.filter(username__startswith='seed_')
+        self.assertEqual(users.count(), 6)
+        # No signal ran: one profile and one wallet each
+        self.assertEqual(users.filter(profile__isnull=False).count(), 6)
+        self.assertEqual(Wallet.objects.filter(user__in=users).count(), 6)
+        self.assertGreater(Transaction.objects.count(), 40)
+        self.assertTrue(Transaction.objects.filter(
+            transaction_type='TRANSFER_IN').exists())
+        self.assertLess(Transaction.objects.latest('created_at').created_at,
+                        timezone.localtime().replace(hour=0, minute=0))
+
+        call_command('reconcile_ledger', workers=1, stdout=StringIO())
+        seeded = self._rollups()
+        call_command('rebuild_transaction_rollups', stdout=StringIO())
+        self.assertEqual(self._rollups(), seeded)
+
+        with self.assertRaises(CommandError):
+            self._seed(seed=3)
+
+    def test_same_seed_generates_the_same_batch(self):
+        end = timezone.now()
+        start = end - timedelta(days=30)
+
+        def batch(seed):
+            return seeding.generate_batch(seed, 'seed_', 0, 4, 10, start, end, '!')
+
+        first, again, other = batch(1), batch(1), batch(2)
+        self.assertEqual(first.transactions, again.transactions)
+        self.assertEqual(first.entries, again.entries)
+        self.assertNotEqual(first.transactions, other.transactions)
+
+    def test_end_pins_the_history(self):
+        def seeded_history():
+            with transaction.atomic():
+                self._seed(seed=3, end='2024-03-01')
+                history = list(
+                    Transaction.objects.order_by('created_at', 'id')
+                    .values_list('id', 'created_at', 'amount'))
+                transaction.set_rollback(True)
+            return history
+
+        history = seeded_history()
+        self.assertLess(history[-1][1], timezone.make_aware(datetime(2024, 3, 1)))
+        self.assertEqual(seeded_history(), history)
+
+        for end in ('2024-02-30',
+                    (timezone.localdate() + timedelta(days=1)).isoformat()):
+            with self.assertRaises(CommandError):
+                self._seed(seed=3, end=end)
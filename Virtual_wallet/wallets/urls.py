@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import WalletDetailView, WalletBalanceView
+from .views import WalletDetailView, WalletBalanceView, WalletBalanceAtView
 
 urlpatterns = [
     path('', WalletDetailView.as_view(), name='wallet-detail'),
     path('balance/', WalletBalanceView.as_view(), name='wallet-balance'),
+    path('balance/at/', WalletBalanceAtView.as_view(), name='wallet-balance-at'),
 ]
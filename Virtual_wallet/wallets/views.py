@@ -1,7 +1,13 @@
-from rest_framework import generics
+from rest_framework import generics, status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+from ledger.services import balance_at
+from . import cache as balance_cache
 from .models import Wallet
 from .serializers import WalletSerializer
 
@@ -20,21 +26,79 @@ class WalletDetailView(generics.RetrieveAPIView):
 class WalletBalanceView(APIView):
     """
     Quick balance check endpoint
+
+    Served from the balance cache and tagged with ETag / Last-Modified from
+    Wallet.updated_at, so polling clients get a 304 when nothing changed.
     """
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        wallet = request.user.wallet
+        wallet = balance_cache.get_balance(request.user)
+        etag, last_modified = balance_validators(wallet)
+
+        # A 304 carries the validators too, as the full response would
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = Response(balance_payload(wallet))
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+def balance_validators(wallet):
+    """ETag and Last-Modified (epoch seconds) of a balance snapshot"""
+    updated_at = wallet['updated_at']
+    etag = f'"{wallet["wallet_id"]}-{updated_at.timestamp()}"'
+    return etag, int(updated_at.timestamp())
+
+
+def balance_payload(wallet):
+    """Response body of the balance endpoints for a balance snapshot"""
+    total_balance = wallet['balance'] + wallet['pending_balance']
+    return {
+        'wallet_id': str(wallet['wallet_id']),
+        'available_balance': str(wallet['balance']),
+        'pending_balance': str(wallet['pending_balance']),
+        'total_balance': str(total_balance),
+        'currency': wallet['currency'],
+        'formatted': {
+            'available': f'₦{wallet["balance"]:,.2f}',
+            'pending': f'₦{wallet["pending_balance"]:,.2f}',
+            'total': f'₦{total_balance:,.2f}'
+        }
+    }
+
 
+class WalletBalanceAtView(APIView):
+    """
+    Balance at a point in time: GET ?timestamp=<ISO 8601>
+
+    Read from the nearest balance checkpoint plus the ledger entries written
+    after it, for statements and disputes.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        raw = request.query_params.get('timestamp', '')
+        try:
+            at = parse_datetime(raw)
+        except ValueError:
+            at = None
+        if at is None:
+            return Response({
+                'error': 'INVALID_TIMESTAMP',
+                'message': 'timestamp must be an ISO 8601 date and time'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(at):
+            at = timezone.make_aware(at)
+
+        wallet = request.user.wallet
+        balance = balance_at(wallet.pk, at)
         return Response({
-            'wallet_id': str(wallet.id),
-            'available_balance': str(wallet.balance),
-            'pending_balance': str(wallet.pending_balance),
-            'total_balance': str(wallet.total_balance),
+            'wallet_id': str(wallet.pk),
+            'timestamp': at.isoformat(),
+            'balance': str(balance),
             'currency': wallet.currency,
-            'formatted': {
-                'available': f'₦{wallet.balance:,.2f}',
-                'pending': f'₦{wallet.pending_balance:,.2f}',
-                'total': f'₦{wallet.total_balance:,.2f}'
-            }
+            'formatted': f'₦{balance:,.2f}'
         })